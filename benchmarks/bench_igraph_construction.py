@@ -0,0 +1,110 @@
+"""
+Compare the time and memory needed to turn a UMAP-style connectivity matrix
+into an igraph graph with :func:`mcr.clustering.graph_from_adjacency` and with
+the scanpy-derived implementation it replaced.
+
+Each measurement runs in a fresh process so that peak RSS is not polluted by
+the previous one::
+
+    python benchmarks/bench_igraph_construction.py --cells 1000000 --neighbors 30
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+import scipy.sparse
+
+
+def legacy_get_igraph_from_adjacency(adjacency, directed=None):
+    import igraph as ig
+
+    sources, targets = adjacency.nonzero()
+    weights = adjacency[sources, targets]
+    if isinstance(weights, np.matrix):
+        weights = weights.A1
+    g = ig.Graph(directed=directed)
+    g.add_vertices(adjacency.shape[0])
+    g.add_edges(list(zip(sources, targets)))
+    g.es["weight"] = weights
+    return g
+
+
+def vectorized_graph_from_adjacency(adjacency, directed=None):
+    from mcr.clustering import graph_from_adjacency
+
+    return graph_from_adjacency(adjacency, directed=bool(directed))
+
+
+IMPLEMENTATIONS = {
+    "legacy": legacy_get_igraph_from_adjacency,
+    "vectorized": vectorized_graph_from_adjacency,
+}
+
+
+def synthetic_connectivities(n_cells, n_neighbors, seed=0):
+    """\
+    Random symmetric kNN-like matrix with roughly the sparsity pattern of the
+    output of :func:`umap.umap_.fuzzy_simplicial_set`.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.repeat(np.arange(n_cells), n_neighbors - 1)
+    cols = rng.integers(0, n_cells, size=rows.shape[0])
+    vals = rng.random(rows.shape[0], dtype=np.float32)
+    knn = scipy.sparse.coo_matrix((vals, (rows, cols)), shape=(n_cells,) * 2)
+    knn = knn.tocsr()
+    knn.setdiag(0)
+    knn.eliminate_zeros()
+    transpose = knn.T
+    product = knn.multiply(transpose)
+    return (knn + transpose - product).tocsr()
+
+
+def _measure(name, n_cells, n_neighbors, queue):
+    # import what both implementations need before measuring either, so that
+    # neither is charged for loading igraph, leidenalg, or pandas
+    import igraph  # noqa: F401
+
+    import mcr.clustering  # noqa: F401
+
+    adjacency = synthetic_connectivities(n_cells, n_neighbors)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    IMPLEMENTATIONS[name](adjacency, directed=False)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux
+    queue.put((elapsed, (peak - baseline) / 1024))
+
+
+def run(n_cells, n_neighbors):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in IMPLEMENTATIONS:
+        queue = ctx.Queue()
+        process = ctx.Process(
+            target=_measure, args=(name, n_cells, n_neighbors, queue)
+        )
+        process.start()
+        results[name] = queue.get()
+        process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--cells", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--neighbors", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'cells':>10} {'implementation':>15} {'seconds':>10} {'peak MiB':>10}")
+    for n_cells in args.cells:
+        for name, (elapsed, peak_mib) in run(n_cells, args.neighbors).items():
+            print(f"{n_cells:>10} {name:>15} {elapsed:>10.2f} {peak_mib:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Time how long it takes to start `mcr` and import its modules, each in a fresh
+interpreter, against the cost of importing everything that `import mcr` used
+to import eagerly (the CLI, clustering, reduction, and the Dash GUI)::
+
+    python benchmarks/bench_import_time.py --repeats 10
+
+For a per-module breakdown of any one of them, run it with
+``python -X importtime``.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STARTUPS = {
+    "import mcr": ["-c", "import mcr"],
+    "import mcr.clustering": ["-c", "import mcr.clustering"],
+    "mcr --help": ["-m", "mcr", "--help"],
+    "eager (old import mcr)": [
+        "-c",
+        "import mcr.cli, mcr.clustering, mcr.dash_gui, mcr.reduction",
+    ],
+}
+
+# imports that none of the lazy startups should trigger
+HEAVY_MODULES = ["dash", "plotly", "igraph", "leidenalg", "umap", "numba"]
+
+
+def time_startup(arguments, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *arguments],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def heavy_imports(arguments):
+    # `mcr --help` imports no more than `mcr.cli` does
+    statement = arguments[1] if arguments[0] == "-c" else "import mcr.cli"
+    check = (
+        f"{statement}\n"
+        "import sys\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    # the first run of each pays for compiling bytecode
+    for arguments in STARTUPS.values():
+        time_startup(arguments, 1)
+
+    baseline = time_startup(STARTUPS["eager (old import mcr)"], args.repeats)
+    print(f"{'startup':>24} {'seconds':>8} {'vs eager':>9}  heavy imports")
+    for name, arguments in STARTUPS.items():
+        elapsed = time_startup(arguments, args.repeats)
+        heavy = heavy_imports(arguments)
+        print(
+            f"{name:>24} {elapsed:>8.2f} {elapsed / baseline:>9.0%}  {heavy}"
+        )
+
+
+if __name__ == "__main__":
+    main()
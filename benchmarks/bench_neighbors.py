@@ -0,0 +1,95 @@
+"""
+Compare the neighbor backends of :func:`mcr.neighbors.nearest_neighbors` on
+synthetic cytometry-like data, reporting wall time and recall against an
+exact search::
+
+    python benchmarks/bench_neighbors.py --cells 10000 100000 1000000 5000000
+
+Recall is measured on a random sample of query cells, whose exact neighbors are
+found by brute force, so it stays cheap even at millions of cells.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from mcr.neighbors import NEIGHBOR_BACKENDS, nearest_neighbors
+
+
+def gaussian_mixture(n_cells, n_markers=40, n_populations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 4, size=(n_populations, n_markers))
+    labels = rng.integers(0, n_populations, size=n_cells)
+    return (centers[labels] + rng.normal(size=(n_cells, n_markers))).astype(
+        np.float32
+    )
+
+
+def exact_neighbors(X, queries, n_neighbors, block_size=8):
+    sq_norms = np.einsum("ij,ij->i", X, X)
+    truth = []
+    for start in range(0, len(queries), block_size):
+        block = queries[start : start + block_size]
+        dists = sq_norms[None, :] - 2 * (X[block] @ X.T)
+        truth.append(
+            np.argpartition(dists, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        )
+    return np.vstack(truth)
+
+
+def recall(knn_indices, truth, queries):
+    found = knn_indices[queries]
+    hits = [len(np.intersect1d(a, b)) for a, b in zip(found, truth)]
+    return np.sum(hits) / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--cells",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000, 5_000_000],
+    )
+    parser.add_argument("--markers", type=int, default=40)
+    parser.add_argument("--neighbors", type=int, default=30)
+    parser.add_argument("--backends", nargs="+", default=NEIGHBOR_BACKENDS)
+    parser.add_argument(
+        "--max-brute-cells",
+        type=int,
+        default=500_000,
+        help="skip brute_blas above this size, as it scales quadratically",
+    )
+    parser.add_argument("--recall-queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'cells':>10} {'backend':>12} {'seconds':>10} {'recall':>8}")
+    for n_cells in args.cells:
+        X = gaussian_mixture(n_cells, args.markers)
+        rng = np.random.default_rng(1)
+        queries = rng.choice(n_cells, size=args.recall_queries, replace=False)
+        truth = exact_neighbors(X, queries, args.neighbors)
+
+        for backend in args.backends:
+            if backend == "brute_blas" and n_cells > args.max_brute_cells:
+                continue
+            start = time.perf_counter()
+            try:
+                knn_indices, _ = nearest_neighbors(
+                    X,
+                    n_neighbors=args.neighbors,
+                    backend=backend,
+                    random_state=0,
+                )
+            except ImportError as error:
+                print(f"{n_cells:>10} {backend:>12} skipped: {error}")
+                continue
+            elapsed = time.perf_counter() - start
+            print(
+                f"{n_cells:>10} {backend:>12} {elapsed:>10.2f} "
+                f"{recall(knn_indices, truth, queries):>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
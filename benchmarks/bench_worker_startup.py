@@ -0,0 +1,91 @@
+"""
+Time how long it takes to start a pool of worker processes that each hold a
+feature matrix and a neighbor graph, when they are pickled to every worker
+and when they are placed in shared memory (`mcr.shared`) once::
+
+    python benchmarks/bench_worker_startup.py --cells 100000,1000000,4000000
+
+Workers are started with "spawn", as the GUI's job pool is, so that nothing
+is inherited by forking.  With shared memory the startup time should stay
+flat as the number of cells grows.
+"""
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse
+
+from mcr.shared import SharedArrays, attach_shared
+
+N_FEATURES = 30
+N_NEIGHBORS = 30
+
+_payload = None
+
+
+def _init_worker(X, connectivities):
+    global _payload
+    _payload = (attach_shared(X), attach_shared(connectivities))
+
+
+def _touch(_):
+    # read one row of each, so that the data is really reachable
+    X, connectivities = _payload
+    return float(X[-1].sum() + connectivities[-1].sum())
+
+
+def synthetic(n_cells, rng):
+    X = rng.normal(size=(n_cells, N_FEATURES)).astype(np.float32)
+    rows = np.repeat(np.arange(n_cells), N_NEIGHBORS)
+    cols = rng.integers(0, n_cells, size=n_cells * N_NEIGHBORS)
+    connectivities = scipy.sparse.csr_matrix(
+        (rng.random(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(n_cells, n_cells),
+    )
+    return X, connectivities
+
+
+def time_startup(X, connectivities, n_workers):
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(X, connectivities),
+    ) as executor:
+        list(executor.map(_touch, range(n_workers)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cells", default="100000,1000000")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'cells':>10} {'MB':>8} {'pickled s':>10} {'shared s':>9}")
+    for n_cells in [int(x) for x in args.cells.split(",")]:
+        X, connectivities = synthetic(n_cells, rng)
+        megabytes = (
+            X.nbytes
+            + connectivities.data.nbytes
+            + connectivities.indices.nbytes
+            + connectivities.indptr.nbytes
+        ) / 1e6
+
+        pickled = time_startup(X, connectivities, args.workers)
+        with SharedArrays() as shared:
+            shared_seconds = time_startup(
+                shared.array(X), shared.csr(connectivities), args.workers
+            )
+        print(
+            f"{n_cells:>10} {megabytes:>8.0f} {pickled:>10.2f} "
+            f"{shared_seconds:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
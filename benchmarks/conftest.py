@@ -0,0 +1,85 @@
+"""
+Shared fixtures for the pytest-benchmark suite::
+
+    pytest benchmarks --cells 10000,100000,1000000 --benchmark-json bench.json
+
+Each benchmark is parametrized over the `--cells` sizes.  Besides the timings
+from pytest-benchmark, the peak resident memory of each benchmarked call, and
+how long each stage within it took, are stored in the `extra_info` of its
+result (see :mod:`mcr.profiling`).
+"""
+import pytest
+from synthetic import cytometry_frame
+
+from mcr.profiling import profile, stage
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--cells",
+        default="10000,100000",
+        help="comma-separated numbers of cells to benchmark (up to millions)",
+    )
+    parser.addoption(
+        "--rounds",
+        type=int,
+        default=3,
+        help="timed rounds per benchmark",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "n_cells" in metafunc.fixturenames:
+        cells = [int(x) for x in metafunc.config.getoption("cells").split(",")]
+        metafunc.parametrize("n_cells", cells, scope="session")
+
+
+@pytest.fixture(scope="session")
+def frame(n_cells):
+    return cytometry_frame(n_cells)
+
+
+@pytest.fixture(scope="session")
+def features(frame):
+    return frame.filter(like="marker_")
+
+
+@pytest.fixture(scope="session")
+def neighbor_graph(features):
+    from mcr.neighbors import build_neighbor_graph
+
+    return build_neighbor_graph(
+        features, n_neighbors=30, random_state=0, neighbor_backend="kdtree"
+    )
+
+
+@pytest.fixture
+def measure(benchmark, request):
+    """\
+    Benchmark `function(*args, **kwargs)`, recording its peak memory and
+    stage timings as well.
+    """
+
+    def run(function, *args, **kwargs):
+        profiles = []
+
+        def profiled():
+            with profile() as profiler:
+                with stage(request.node.name):
+                    result = function(*args, **kwargs)
+            profiles.append(profiler.to_dict())
+            return result
+
+        result = benchmark.pedantic(
+            profiled,
+            rounds=request.config.getoption("rounds"),
+            iterations=1,
+        )
+        stages = profiles[-1]["stages"]
+        benchmark.extra_info["peak_rss_mb"] = max(
+            (s["peak_rss_mb"] or 0 for s in stages), default=None
+        )
+        benchmark.extra_info["stages"] = stages
+        return result
+
+    return run
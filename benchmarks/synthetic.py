@@ -0,0 +1,61 @@
+"""
+Synthetic mass cytometry-like data for the benchmarks.
+
+Cells are drawn from a mixture of populations of very different sizes (some
+make up well under 1% of the cells, as rare populations do in real samples),
+each of which is either negative or positive, at its own intensity, for each
+marker.  Values are on the arcsinh-transformed scale that cytometry data is
+usually analyzed on, so they are non-negative with a pile-up at zero.  The
+frames also carry the per-cell metadata columns that are ignored by default.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+METADATA_COLUMNS = ["Object Id", "XMin", "XMax", "YMin", "YMax"]
+
+
+def cytometry_like(
+    n_cells, n_markers=40, n_populations=20, seed=0, block_size=1_000_000
+):
+    """\
+    Return a float32 cells by markers array and the population of each cell.
+    Cells are generated in blocks, so that millions of them never need a
+    float64 copy.
+    """
+    rng = np.random.default_rng(seed)
+    weights = rng.dirichlet(np.full(n_populations, 0.7))
+    positive = rng.random((n_populations, n_markers)) < 0.3
+    means = np.where(
+        positive,
+        rng.uniform(2.0, 6.0, size=positive.shape),
+        rng.uniform(0.0, 0.5, size=positive.shape),
+    ).astype(np.float32)
+
+    labels = rng.choice(n_populations, size=n_cells, p=weights)
+    X = np.empty((n_cells, n_markers), dtype=np.float32)
+    for start in range(0, n_cells, block_size):
+        block = labels[start : start + block_size]
+        noise = rng.standard_normal((len(block), n_markers), dtype=np.float32)
+        X[start : start + len(block)] = np.maximum(
+            means[block] + 0.4 * noise, 0
+        )
+    return X, labels
+
+
+@lru_cache(maxsize=4)
+def cytometry_frame(n_cells, n_markers=40, seed=0):
+    """\
+    :func:`cytometry_like` data as a frame with named marker columns followed
+    by metadata columns, as exported by imaging and cytometry software.
+    """
+    X, _ = cytometry_like(n_cells, n_markers, seed=seed)
+    df = pd.DataFrame(X, columns=[f"marker_{i:02d}" for i in range(n_markers)])
+    rng = np.random.default_rng(seed + 1)
+    df["Object Id"] = np.arange(n_cells)
+    for axis in ("X", "Y"):
+        low = rng.integers(0, 20_000, size=n_cells)
+        df[f"{axis}Min"] = low
+        df[f"{axis}Max"] = low + rng.integers(5, 40, size=n_cells)
+    return df
@@ -0,0 +1,103 @@
+"""
+Time and memory of each step of the pipeline, and of the CLI end to end, on
+synthetic data; see conftest.py for how to run them.
+"""
+import pytest
+
+from mcr.clustering import (
+    get_igraph_from_adjacency,
+    graph_from_adjacency,
+    label_clusters,
+)
+from mcr.readers import read_data
+from mcr.reduction import perform_reducion
+from mcr.writers import write_table
+
+REDUCTIONS = {
+    "umap": "umap",
+    "tsne": "sklearn",
+    "openTSNE": "openTSNE",
+    "pacmap": "pacmap",
+}
+
+
+@pytest.fixture(scope="session")
+def data_files(frame, n_cells, tmp_path_factory):
+    directory = tmp_path_factory.mktemp(f"data-{n_cells}")
+    files = {}
+    for suffix in (".csv", ".parquet", ".feather"):
+        files[suffix] = directory / f"cells{suffix}"
+        write_table(frame, files[suffix])
+    return files
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".feather"])
+def test_read_data(measure, data_files, suffix):
+    df = measure(
+        read_data, str(data_files[suffix]), ignore_columns=["Object Id"]
+    )
+    assert "Object Id" not in df.columns
+
+
+def test_graph_from_adjacency(measure, neighbor_graph):
+    measure(graph_from_adjacency, neighbor_graph.connectivities)
+
+
+def test_get_igraph_from_adjacency(measure, neighbor_graph):
+    measure(get_igraph_from_adjacency, neighbor_graph.connectivities)
+
+
+def test_label_clusters(measure, features):
+    # without the graph cache, so the neighbor search is timed every round
+    clusters = measure(
+        label_clusters,
+        features,
+        resolution=0.6,
+        neighbor_backend="kdtree",
+        use_cache=False,
+    )
+    assert len(clusters) == features.shape[0]
+
+
+def test_label_clusters_precomputed_graph(measure, features, neighbor_graph):
+    measure(label_clusters, features, resolution=0.6, graph=neighbor_graph)
+
+
+@pytest.mark.parametrize("reduction", list(REDUCTIONS))
+def test_perform_reducion(measure, features, n_cells, reduction):
+    pytest.importorskip(REDUCTIONS[reduction])
+    if reduction == "tsne" and n_cells > 100_000:
+        pytest.skip("scikit-learn's t-SNE is impractical at this size")
+    embeddings = measure(perform_reducion, features, reduction=reduction)
+    assert embeddings.shape == (features.shape[0], 2)
+
+
+@pytest.mark.parametrize("command", ["cluster-cells", "reduce-data"])
+def test_cli(measure, data_files, tmp_path, monkeypatch, command):
+    from click.testing import CliRunner
+
+    from mcr.cli import main
+    from mcr.neighbors import get_graph_cache
+
+    # the CLI writes its log to the working directory
+    monkeypatch.chdir(tmp_path)
+
+    arguments = [
+        command,
+        "--data_file",
+        str(data_files[".parquet"]),
+        "--output",
+        str(tmp_path / "output.parquet"),
+        "--add_to_source",
+        "False",
+    ]
+    if command == "cluster-cells":
+        arguments += ["--neighbor_backend", "kdtree"]
+
+    def run():
+        # each round should start from nothing, as a new process would
+        get_graph_cache().clear()
+        return CliRunner().invoke(main, arguments, catch_exceptions=False)
+
+    result = measure(run)
+    assert result.exit_code == 0, result.output
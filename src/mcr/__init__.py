@@ -2,6 +2,7 @@ __version__ = "0.0.999"
 """Perform dimensional reduction and clustering on mass cytometry data
 and visualize using Plotly Dash
 """
+from importlib import import_module
 from importlib.metadata import metadata, version
 
 try:
@@ -18,5 +19,17 @@ try:
     __version__ = version(__name__)
 except KeyError:  # pragma: no cover
     __version__ = "unknown"
-    
-from . import cli, clustering, dash_gui, reduction
\ No newline at end of file
+
+# submodules are imported on first use, so that `import mcr` (and `mcr --help`)
+# does not pull in Dash, igraph, or UMAP
+__all__ = ["cli", "clustering", "dash_gui", "reduction"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,107 @@
+// Chunked, resumable upload of large data files for the mcr GUI.
+//
+// A file chosen in the "chunked-upload-file" input is sent to the
+// mcr-upload/ routes (see mcr/uploads.py) in CHUNK_SIZE pieces.  Each piece
+// starts where the server says the upload ends, so a failed request is simply
+// retried from there.  When the upload is complete, the token the server
+// returns is put into the "data-path" input and the GUI is asked to load it.
+(function () {
+    "use strict";
+
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+
+    function setInputValue(input, value) {
+        // assigning input.value directly is invisible to React, and so to Dash
+        var setter = Object.getOwnPropertyDescriptor(
+            window.HTMLInputElement.prototype,
+            "value"
+        ).set;
+        setter.call(input, value);
+        input.dispatchEvent(new Event("input", { bubbles: true }));
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) {
+            setTimeout(resolve, ms);
+        });
+    }
+
+    async function received(base) {
+        var response = await fetch(base);
+        if (!response.ok) {
+            throw new Error((await response.json()).error);
+        }
+        return (await response.json()).received;
+    }
+
+    async function upload(file, sessionId, report) {
+        var uploadId = [file.name, file.size, file.lastModified]
+            .join("-")
+            .replace(/[^A-Za-z0-9_.-]/g, "_");
+        var base = "mcr-upload/" + sessionId + "/" + uploadId;
+        var offset = await received(base);
+        var failures = 0;
+
+        while (offset < file.size) {
+            report(offset);
+            try {
+                var response = await fetch(base + "?offset=" + offset, {
+                    method: "PUT",
+                    headers: { "Content-Type": "application/octet-stream" },
+                    body: file.slice(offset, offset + CHUNK_SIZE),
+                });
+                if (!response.ok && response.status !== 409) {
+                    throw new Error((await response.json()).error);
+                }
+                offset = (await response.json()).received;
+                failures = 0;
+            } catch (error) {
+                failures += 1;
+                if (failures > MAX_RETRIES) {
+                    throw error;
+                }
+                await sleep(1000 * failures);
+                offset = await received(base);
+            }
+        }
+        report(file.size);
+
+        var done = await fetch(base + "/complete", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ filename: file.name }),
+        });
+        var result = await done.json();
+        if (!done.ok) {
+            throw new Error(result.error);
+        }
+        return result.path;
+    }
+
+    document.addEventListener("change", async function (event) {
+        var input = event.target;
+        if (input.id !== "chunked-upload-file" || !input.files.length) {
+            return;
+        }
+        var file = input.files[0];
+        var sessionId = document.getElementById("session-id-div").dataset
+            .session;
+        var progress = document.getElementById("chunked-upload-progress");
+
+        try {
+            var path = await upload(file, sessionId, function (sent) {
+                var percent = file.size ? (100 * sent) / file.size : 100;
+                progress.textContent =
+                    "Uploading " + file.name + ": " + percent.toFixed(0) + "%";
+            });
+            progress.textContent = "Uploaded " + file.name;
+            setInputValue(document.getElementById("data-path"), path);
+            // give Dash a moment to register the new value before loading
+            await sleep(100);
+            document.getElementById("load-path-btn").click();
+        } catch (error) {
+            progress.textContent = "Upload failed: " + error.message;
+        }
+    });
+})();
@@ -0,0 +1,285 @@
+"""
+Reduce and cluster many data files in one go.
+
+Running `mcr reduce-data` and `mcr cluster-cells` once per file pays for
+starting Python, importing UMAP and friends, and numba's JIT compilation on
+every call, and searches for nearest neighbors twice.  :func:`run_batch`
+instead sends the files to a pool of worker processes that are warmed up once
+(see :func:`_init_batch_worker`), builds a single neighbor graph per file for
+both the reduction and the clustering, and skips files whose outputs are
+newer than their inputs and were made with the same settings.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import pandas as pd
+
+from .profiling import profile
+
+STATE_FILE = ".mcr-batch.json"
+
+
+def collect_inputs(
+    patterns: Sequence[str] = (), manifest: Optional[str] = None
+) -> List[Path]:
+    """\
+    Data files matching any of the glob `patterns` (``**`` is recursive), and
+    those listed in `manifest`, a text file with one path per line (relative
+    to the manifest; blank lines and lines starting with "#" are ignored).
+    """
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        files.extend(Path(x) for x in matches)
+    if manifest:
+        base = Path(manifest).parent
+        for line in Path(manifest).read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                files.append(base / line)
+
+    unique = {}
+    for f in files:
+        unique.setdefault(f.resolve(), f)
+    return list(unique.values())
+
+
+def output_paths(
+    files: Sequence[Path], output_dir: Path, suffix: str = ".parquet"
+) -> List[Path]:
+    """\
+    One output per input, named after it; inputs from different directories
+    that share a name are told apart by a hash of their path.
+    """
+    stems = [f.stem for f in files]
+    outputs = []
+    for f, stem in zip(files, stems):
+        if stems.count(stem) > 1:
+            digest = hashlib.blake2b(
+                str(f.resolve()).encode(), digest_size=4
+            ).hexdigest()
+            stem = f"{stem}-{digest}"
+        outputs.append(output_dir / f"{stem}.mcr{suffix}")
+    return outputs
+
+
+def settings_key(settings: Dict[str, Any]) -> str:
+    try:
+        mcr_version = version("mcr")
+    except PackageNotFoundError:
+        mcr_version = "unknown"
+    description = json.dumps(
+        dict(settings, mcr_version=mcr_version), sort_keys=True, default=str
+    )
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def is_up_to_date(
+    data_file: Path, output: Path, key: str, state: Dict[str, str]
+) -> bool:
+    return (
+        output.exists()
+        and output.stat().st_mtime >= data_file.stat().st_mtime
+        and state.get(output.name) == key
+    )
+
+
+def _init_batch_worker(threads: int, reduction: str) -> None:
+    # each worker pays for the imports and numba compilation (or loading the
+    # compiled kernels from the cache, see mcr.jit) once, rather than per file
+    try:
+        import numba
+
+        numba.set_num_threads(
+            max(1, min(threads, numba.config.NUMBA_NUM_THREADS))
+        )
+    except ImportError:
+        pass
+
+    from .jit import compile_kernels
+
+    compile_kernels(reduction)
+
+
+def process_file(
+    data_file: str,
+    output: str,
+    reduction: str = "umap",
+    resolution: float = 0.6,
+    n_neighbors: int = 30,
+    ignore_columns: Optional[Sequence[str]] = None,
+    neighbor_backend: str = "nndescent",
+    add_to_source: bool = False,
+    random_state: Optional[int] = None,
+) -> Dict[str, Any]:
+    """\
+    Reduce and cluster one file, writing the embeddings and clusters (and,
+    with `add_to_source`, the original columns) to `output`.
+
+    Returns
+    -------
+    a row of the batch report
+    """
+    from .pipeline import reduce_and_cluster
+    from .readers import read_data, select_features
+    from .writers import write_table
+
+    start = time.perf_counter()
+    record = {"data_file": data_file, "output": output}
+    try:
+        with profile() as profiler:
+            if add_to_source:
+                original_df = read_data(data_file, downcast=False)
+                df = select_features(original_df, ignore_columns)
+            else:
+                df = read_data(data_file, ignore_columns=ignore_columns)
+            if df is None:
+                raise ValueError(f"{data_file} is not a supported file type")
+
+            # one neighbor search serves both the embedding and the clusters
+            results = reduce_and_cluster(
+                df,
+                reduction=reduction,
+                resolutions=[resolution],
+                n_neighbors=n_neighbors,
+                neighbor_backend=neighbor_backend,
+                random_state=random_state,
+                # each file is seen once, so caching graphs only costs memory
+                use_cache=False,
+            )
+            clusters = results[f"res_{resolution}"]
+            if add_to_source:
+                results = pd.concat(
+                    [original_df.reset_index(drop=True), results], axis=1
+                )
+            write_table(results, output, source=data_file)
+
+        record.update(
+            status="done",
+            cells=df.shape[0],
+            clusters=clusters.nunique(),
+            stages=json.dumps(
+                {
+                    s["name"]: round(s["wall_seconds"], 2)
+                    for s in profiler.to_dict()["stages"]
+                    if s["depth"] == 0
+                }
+            ),
+        )
+    except Exception as error:
+        logging.error(f"{data_file} failed: {error}")
+        record.update(status="failed", error=str(error))
+    record["seconds"] = round(time.perf_counter() - start, 2)
+    return record
+
+
+def run_batch(
+    files: Iterable[Path],
+    output_dir: str = "mcr_output",
+    output_format: str = ".parquet",
+    n_jobs: Optional[int] = None,
+    force: bool = False,
+    report: Optional[str] = "batch_report.csv",
+    **settings,
+) -> pd.DataFrame:
+    """\
+    Run :func:`process_file` on every file, in parallel.
+
+    Parameters
+    ----------
+    files
+        Iterable[Path]
+    output_dir
+        str
+        default = "mcr_output"
+    output_format
+        str
+        default = ".parquet".  Suffix of the output files.
+    n_jobs
+        Optional[int]
+        default = None, as many workers as there are files or CPUs, whichever
+        is fewer.  The CPUs are shared out between the workers' numba
+        threads.
+    force
+        bool
+        default = False.  Process files even if their output is up to date.
+    report
+        Optional[str]
+        default = "batch_report.csv", written to `output_dir`
+    settings
+        passed to :func:`process_file`
+
+    Returns
+    -------
+    the report, with one row per file
+    """
+    files = list(files)
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    outputs = output_paths(files, out, output_format)
+
+    state_path = out / STATE_FILE
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    key = settings_key(settings)
+
+    records = []
+    todo = []
+    for data_file, output in zip(files, outputs):
+        if not force and is_up_to_date(data_file, output, key, state):
+            records.append(
+                {
+                    "data_file": str(data_file),
+                    "output": str(output),
+                    "status": "skipped",
+                }
+            )
+        else:
+            todo.append((data_file, output))
+    logging.critical(
+        f"{len(todo)} of {len(files)} files to process, "
+        f"{len(files) - len(todo)} up to date"
+    )
+
+    if todo:
+        cpus = os.cpu_count() or 1
+        n_jobs = n_jobs or min(len(todo), cpus)
+        # "spawn" since forking after numba has started its threads can deadlock
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_batch_worker,
+            initargs=(max(1, cpus // n_jobs), settings.get("reduction")),
+        ) as executor:
+            futures = [
+                executor.submit(process_file, str(f), str(o), **settings)
+                for f, o in todo
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                logging.critical(
+                    f"{record['data_file']}: {record['status']} in "
+                    f"{record['seconds']} s"
+                )
+                if record["status"] == "done":
+                    state[Path(record["output"]).name] = key
+                    state_path.write_text(json.dumps(state, indent=2))
+                records.append(record)
+
+    order = {str(f): i for i, f in enumerate(files)}
+    records.sort(key=lambda r: order[r["data_file"]])
+    summary = pd.DataFrame.from_records(records)
+    if report:
+        from .writers import write_table
+
+        write_table(summary, out / report)
+    return summary
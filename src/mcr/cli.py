@@ -15,18 +15,30 @@ Why does this file exist, and why not put this in __main__?
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
 
-from typing import Optional
+from typing import Optional, Tuple
 
 import logging
-from copy import deepcopy
 from pathlib import Path
 
 import click
 import numpy as np
 import pandas as pd
 
-from .clustering import label_clusters
+# igraph, leidenalg, and the reductions' libraries are slow to import, so
+# the commands that need them import them when run rather than here
+from . import jit, profiling
+from .model import PROJECTABLE_REDUCTIONS, MCRModel
+from .neighbors import NEIGHBOR_BACKENDS, GraphCache
+from .readers import CSV_SUFFIXES, read_columns, read_data, select_features
 from .reduction import perform_reducion
+from .subsample import SUBSAMPLE_STRATEGIES
+from .writers import write_sidecar, write_table
+
+DEFAULT_IGNORE_COLUMNS = (
+    "Object Id,XMin,XMax,YMin,YMax,Cell Area (µm²),Cytoplasm Area (µm²),"
+    "Membrane Area (µm²),Nucleus Area (µm²),Nucleus Perimeter (µm),"
+    "Nucleus Roundness"
+)
 
 
 def setup_logging(name: Optional[str] = None):
@@ -52,38 +64,58 @@ def setup_logging(name: Optional[str] = None):
     logger.addHandler(st)
 
 
-def read_data(filename: str) -> Optional[pd.DataFrame]:
+def load_input(
+    data_file: str, ignore_columns: Optional[str], add_to_source: bool
+) -> Tuple[Optional[pd.DataFrame], pd.DataFrame]:
     """
-    Read in csv or excel file containing data.
+    Read `data_file`, returning the full table (only if `add_to_source`, since
+    it is otherwise not needed) and the float32 columns to analyze.
     """
-
-    # This is just here because I cannot rely on people giving me a csv
-    # no matter how many times I tell them Excel is crap
-
-    datafile = Path(filename)
-
-    if datafile.suffix in [".xlsx", ".xls"]:
-        df = pd.read_excel(datafile)
-    elif datafile.suffix in [".csv", ".tsv", ".txt"]:
-        df = pd.read_csv(datafile, engine="python")
+    ignored = ignore_columns.split(",") if ignore_columns else None
+    if add_to_source:
+        original_df = read_data(data_file, downcast=False)
+        return original_df, select_features(original_df, ignored)
     else:
-        logging.error(
-            "That file type is unknown.  Please provide a CSV, XLSX, or XLS file to use."
-        )
-        return None
-
-    return df
+        return None, read_data(data_file, ignore_columns=ignored)
 
 
 @click.group()
-def main():
+@click.option(
+    "--profile",
+    help=(
+        "Write the wall time, CPU time, and peak memory of each stage of "
+        "the command (reading, neighbor search, clustering, reduction, "
+        "writing) to this JSON file"
+    ),
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.pass_context
+def main(ctx: click.Context, profile: Optional[str] = None):
     setup_logging("mcr")
+    # before numba is imported, so compiled kernels are reused between runs
+    jit.configure_cache()
+    if profile:
+        profiler = ctx.with_resource(profiling.profile())
+
+        def report():
+            profiler.write_json(profile)
+            logging.getLogger("mcr").info(
+                f"stage timings written to {profile}\n{profiler.summary()}"
+            )
+
+        ctx.call_on_close(report)
 
 
 @main.command()
 @click.option(
     "--data_file",
-    help="File containing antigen expression",
+    help=(
+        "File containing antigen expression (CSV, TSV, Excel, Parquet, "
+        "Feather, or HDF5)"
+    ),
     type=str,
     default=None,
     show_default=True,
@@ -111,28 +143,51 @@ def main():
         "might be irrelvant"
     ),
     type=str,
-    default=(
-        "Object Id,XMin,XMax,YMin,YMax,Cell Area (µm²),Cytoplasm Area (µm²),"
-        "Membrane Area (µm²),Nucleus Area (µm²),Nucleus Perimeter (µm),"
-        "Nucleus Roundness"
-    ),
+    default=DEFAULT_IGNORE_COLUMNS,
     show_default=True,
     required=False,
 )
 @click.option(
     "--output",
-    help="Filename to write results to",
+    help=(
+        "Filename to write results to.  The format (CSV, TSV, Parquet, or "
+        "Feather) is chosen by the file extension."
+    ),
     type=str,
     default="output.csv",
     show_default=True,
     required=False,
 )
+@click.option(
+    "--add_to_source",
+    help=(
+        "If true, embeddings are added as columns to the original data;"
+        "if false, the embeddings alone are saved."
+    ),
+    type=bool,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--sidecar",
+    help=(
+        "Write only the new columns, keyed by row, rather than a copy of "
+        "the whole input with them appended.  Use a .parquet or .feather "
+        "`output` to avoid any parsing when the results are read back."
+    ),
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
 def reduce_data(
     data_file: str,
     output: str,
     reduction: str = "umap",
     ignore_columns: Optional[str] = None,
     add_to_source: bool = False,
+    sidecar: bool = False,
     **kwargs,
 ) -> None:
     """Perform dimensional reduction on mass cytometry data
@@ -143,27 +198,30 @@ def reduce_data(
     Returns
     -------
     """
-    df: pd.DataFrame = read_data(data_file)
-
-    original_df: pd.DataFrame = deepcopy(df)
-    if ignore_columns:
-        df = df.loc[:, ~df.columns.isin(ignore_columns.split(","))]
+    original_df, df = load_input(
+        data_file, ignore_columns, add_to_source and not sidecar
+    )
 
     processed_data = perform_reducion(df, reduction, **kwargs)
 
-    if add_to_source:
+    if sidecar:
+        write_sidecar(processed_data, output, source=data_file)
+    elif add_to_source:
         combined_data = pd.concat(
             [original_df.reset_index(drop=True), processed_data], axis=1
         )
-        combined_data.to_csv(output)
+        write_table(combined_data, output, index=True)
     else:
-        processed_data.to_csv(output)
+        write_table(processed_data, output, index=True)
 
 
 @main.command()
 @click.option(
     "--data_file",
-    help="File containing antigen expression",
+    help=(
+        "File containing antigen expression (CSV, TSV, Excel, Parquet, "
+        "Feather, or HDF5)"
+    ),
     type=str,
     default=None,
     show_default=True,
@@ -171,7 +229,10 @@ def reduce_data(
 )
 @click.option(
     "--output",
-    help="Filename to write results to",
+    help=(
+        "Filename to write results to.  The format (CSV, TSV, Parquet, or "
+        "Feather) is chosen by the file extension."
+    ),
     type=str,
     default="output.csv",
     show_default=True,
@@ -193,11 +254,7 @@ def reduce_data(
         "might be irrelvant"
     ),
     type=str,
-    default=(
-        "Object Id,XMin,XMax,YMin,YMax,Cell Area (µm²),Cytoplasm Area (µm²),"
-        "Membrane Area (µm²),Nucleus Area (µm²),Nucleus Perimeter (µm),"
-        "Nucleus Roundness"
-    ),
+    default=DEFAULT_IGNORE_COLUMNS,
     show_default=True,
     required=False,
 )
@@ -212,6 +269,146 @@ def reduce_data(
     show_default=True,
     required=False,
 )
+@click.option(
+    "--cache_dir",
+    help=(
+        "Directory in which to keep computed neighbor graphs, so that "
+        "clustering the same data again at a different resolution skips "
+        "the nearest neighbor search."
+    ),
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--resolutions",
+    help=(
+        "A list of resolutions (seperated by commas) at which to cluster.  "
+        "The neighbor graph is built once and the clusterings are run in "
+        "parallel, with one `res_X` column written per resolution."
+    ),
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_jobs",
+    help=(
+        "Number of processes to use when clustering at several resolutions "
+        "or with several seeds"
+    ),
+    type=int,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--sidecar",
+    help=(
+        "Write only the new columns, keyed by row, rather than a copy of "
+        "the whole input with them appended.  Use a .parquet or .feather "
+        "`output` to avoid any parsing when the results are read back."
+    ),
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--neighbor_backend",
+    help=(
+        "Method used to find nearest neighbors.  'kdtree' and 'balltree' "
+        "are exact and often fastest for panels of a few dozen markers; "
+        "'hnsw' requires hnswlib."
+    ),
+    type=click.Choice(NEIGHBOR_BACKENDS),
+    default="nndescent",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--subsample",
+    help=(
+        "Cluster only this many representative cells and assign the rest "
+        "to the cluster of their nearest clustered neighbors"
+    ),
+    type=int,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--subsample_strategy",
+    help="How the representative cells are chosen",
+    type=click.Choice(SUBSAMPLE_STRATEGIES),
+    default="uniform",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--report_agreement",
+    help=(
+        "With --subsample, also cluster every cell and log how well the "
+        "two results agree and how long each took"
+    ),
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--out_of_core",
+    help=(
+        "Work directory for clustering data too large for memory: the input "
+        "is converted to a memory-mapped matrix there and the neighbor graph "
+        "is built and written to disk in blocks.  Reused by later runs on "
+        "the same file.  Writes only the cluster columns."
+    ),
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--block_rows",
+    help="Rows processed at a time with --out_of_core",
+    type=int,
+    default=500_000,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_seeds",
+    help=(
+        "Run Leiden with this many seeds in parallel (using --n_jobs "
+        "processes) and combine the results as chosen by --consensus"
+    ),
+    type=int,
+    default=1,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--consensus",
+    help=(
+        "With --n_seeds, keep the best partition or recluster the graph "
+        "weighted by how often each pair of neighbors is clustered together"
+    ),
+    type=click.Choice(["best", "consensus"]),
+    default="consensus",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--stability",
+    help="With --n_seeds, write the size and stability of each cluster here",
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
 def cluster_cells(
     data_file: str,
     output: str,
@@ -219,6 +416,19 @@ def cluster_cells(
     resolution: float = 0.6,
     ignore_columns: Optional[str] = None,
     add_to_source: bool = False,
+    cache_dir: Optional[str] = None,
+    resolutions: Optional[str] = None,
+    n_jobs: Optional[int] = None,
+    sidecar: bool = False,
+    neighbor_backend: str = "nndescent",
+    subsample: Optional[int] = None,
+    subsample_strategy: str = "uniform",
+    report_agreement: bool = False,
+    out_of_core: Optional[str] = None,
+    block_rows: int = 500_000,
+    n_seeds: int = 1,
+    consensus: str = "consensus",
+    stability: Optional[str] = None,
     **kwargs,
 ) -> None:
     """Identify clusters in mass cytometry data
@@ -243,6 +453,36 @@ def cluster_cells(
         "Object Id", or "Cell Area".
     add_to_source : `bool`, (default: `False`)
         Return the cluster information added as a new column in the original table.
+    cache_dir : `str`, optional
+        Directory used to persist neighbor graphs between runs.
+    resolutions : `str`, optional
+        Comma-separated resolutions to cluster at in a single run.  Overrides
+        `resolution` and `cluster_name`.
+    n_jobs : `int`, optional
+        Number of worker processes used when `resolutions` or `n_seeds` is
+        given.
+    sidecar : `bool`, (default: `False`)
+        Write only the cluster columns, keyed by row, so that they can be
+        joined back onto `data_file` with :func:`~mcr.writers.read_with_sidecars`.
+    neighbor_backend : `str`, (default: `"nndescent"`)
+        See :func:`~mcr.neighbors.nearest_neighbors`.
+    subsample : `int`, optional
+        Number of cells to cluster, the rest being assigned by label transfer.
+    subsample_strategy : `str`, (default: `"uniform"`)
+        See :func:`~mcr.subsample.subsample_cells`.
+    report_agreement : `bool`, (default: `False`)
+        Log the agreement between the subsampled and a full clustering.
+    out_of_core : `str`, optional
+        Work directory for :func:`~mcr.outofcore.cluster_out_of_core`.
+    block_rows : `int`, (default: `500000`)
+        Rows per block with `out_of_core`.
+    n_seeds : `int`, (default: `1`)
+        Number of seeded Leiden runs; see
+        :func:`~mcr.clustering.label_clusters_consensus`.
+    consensus : `str`, (default: `"consensus"`)
+        How the seeded runs are combined.
+    stability : `str`, optional
+        File to write the stability of each cluster to.
     **kwargs :
         Additional arguments to pass to the :func:`~nearest_neighbors` or
         :func:`~fuzzy_simplicial_set` functions.
@@ -255,19 +495,891 @@ def cluster_cells(
         if `add_to_source` is true, writes results to a new column appened to
         the input dataframe.
     """
-    df: pd.DataFrame = read_data(data_file)
+    from .clustering import (
+        label_clusters,
+        label_clusters_consensus,
+        label_clusters_sweep,
+        subsample_agreement,
+    )
+
+    if n_seeds > 1 and (resolutions or subsample or out_of_core):
+        raise click.UsageError(
+            "--n_seeds cannot be combined with --resolutions, --subsample, "
+            "or --out_of_core"
+        )
 
     if not cluster_name:
         cluster_name = f"res_{resolution}"
 
-    original_df: pd.DataFrame = deepcopy(df)
-    if ignore_columns:
-        df = df.loc[:, ~df.columns.isin(ignore_columns.split(","))]
+    if out_of_core:
+        from .outofcore import OUT_OF_CORE_BACKENDS, cluster_out_of_core
+
+        if neighbor_backend not in OUT_OF_CORE_BACKENDS:
+            logging.getLogger("mcr").info(
+                f"{neighbor_backend} cannot run out of core; using hnsw"
+            )
+            neighbor_backend = "hnsw"
+        resolution_list = (
+            [float(x) for x in resolutions.split(",")]
+            if resolutions
+            else [resolution]
+        )
+        clusters = cluster_out_of_core(
+            data_file,
+            out_of_core,
+            resolutions=resolution_list,
+            ignore_columns=(
+                ignore_columns.split(",") if ignore_columns else None
+            ),
+            neighbor_backend=neighbor_backend,
+            block_rows=block_rows,
+        )
+        if not resolutions:
+            clusters.columns = [cluster_name]
+        # the input is never loaded as a whole, so it is not rewritten either
+        if add_to_source or sidecar:
+            write_sidecar(clusters, output, source=data_file)
+        else:
+            write_table(clusters, output)
+        return
+
+    original_df, df = load_input(
+        data_file, ignore_columns, add_to_source and not sidecar
+    )
 
-    clusters = label_clusters(data_df=df, resolution=resolution, **kwargs)
+    kwargs["neighbor_backend"] = neighbor_backend
+    if cache_dir:
+        kwargs["cache"] = GraphCache(cache_dir=cache_dir)
 
-    if add_to_source:
-        original_df[cluster_name] = clusters
-        original_df.to_csv(output, index=False)
+    if n_seeds > 1:
+        result = label_clusters_consensus(
+            data_df=df,
+            resolution=resolution,
+            n_seeds=n_seeds,
+            method=consensus,
+            n_jobs=n_jobs,
+            **kwargs,
+        )
+        clusters = pd.DataFrame({cluster_name: result.membership})
+        if stability:
+            write_table(result.stability, stability)
+    elif resolutions:
+        clusters = label_clusters_sweep(
+            data_df=df,
+            resolutions=[float(x) for x in resolutions.split(",")],
+            n_jobs=n_jobs,
+            **kwargs,
+        )
+    else:
+        if subsample and report_agreement:
+            # the subsampled run of the comparison is the result
+            agreement, labels = subsample_agreement(
+                df,
+                subsample=subsample,
+                subsample_strategy=subsample_strategy,
+                resolution=resolution,
+                return_labels=True,
+                **kwargs,
+            )
+            logging.getLogger("mcr").info(
+                "subsample agreement with the full clustering: "
+                + ", ".join(f"{k}={v:.3g}" for k, v in agreement.items())
+            )
+        else:
+            labels = label_clusters(
+                data_df=df,
+                resolution=resolution,
+                subsample=subsample,
+                subsample_strategy=subsample_strategy,
+                **kwargs,
+            )
+        clusters = pd.DataFrame({cluster_name: labels})
+
+    if sidecar:
+        write_sidecar(clusters, output, source=data_file)
+    elif add_to_source:
+        write_table(
+            pd.concat([original_df.reset_index(drop=True), clusters], axis=1),
+            output,
+        )
+    elif resolutions or Path(output).suffix not in CSV_SUFFIXES:
+        write_table(clusters, output)
+    else:
+        np.savetxt(
+            fname=output, X=clusters[cluster_name].astype(int), fmt="%i"
+        )
+
+
+@main.command()
+@click.option(
+    "--data_file",
+    help=(
+        "File containing antigen expression (CSV, TSV, Excel, Parquet, "
+        "Feather, or HDF5)"
+    ),
+    type=str,
+    default=None,
+    show_default=True,
+    required=True,
+)
+@click.option(
+    "--output",
+    help=(
+        "Filename to write the embeddings and clusters to.  The format (CSV, "
+        "TSV, Parquet, or Feather) is chosen by the file extension."
+    ),
+    type=str,
+    default="output.csv",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--reduction",
+    help=(
+        "Type of dimensional reduction to perform.  Only UMAP reuses the "
+        "clustering's neighbor graph."
+    ),
+    type=click.Choice(
+        ["umap", "pumap", "tsne", "pacmap", "openTSNE", "optsne"]
+    ),
+    default="umap",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--resolutions",
+    help=(
+        "A list of resolutions (seperated by commas) at which to cluster, "
+        "with one `res_X` column written per resolution"
+    ),
+    type=str,
+    default="0.6",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_neighbors",
+    help="Number of neighbors used for both the reduction and clustering",
+    type=int,
+    default=30,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--ignore_columns",
+    help=(
+        "A list of columns (seperated by commas) in the `data_file` to "
+        "ignore.  Generally stuff like cell name or size or anything that "
+        "might be irrelvant"
+    ),
+    type=str,
+    default=DEFAULT_IGNORE_COLUMNS,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--add_to_source",
+    help=(
+        "If true, embeddings and clusters are added as columns to the "
+        "original data; if false, they are saved alone."
+    ),
+    type=bool,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--sidecar",
+    help="Write only the new columns, keyed by row",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--neighbor_backend",
+    help="Method used to find nearest neighbors",
+    type=click.Choice(NEIGHBOR_BACKENDS),
+    default="nndescent",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--cache_dir",
+    help="Directory in which to keep computed neighbor graphs",
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_jobs",
+    help="Number of processes to use when clustering at several resolutions",
+    type=int,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--random_state",
+    help="Seed for the neighbor search and the reduction",
+    type=int,
+    default=None,
+    show_default=True,
+    required=False,
+)
+def analyze(
+    data_file: str,
+    output: str,
+    reduction: str = "umap",
+    resolutions: str = "0.6",
+    n_neighbors: int = 30,
+    ignore_columns: Optional[str] = None,
+    add_to_source: bool = False,
+    sidecar: bool = False,
+    neighbor_backend: str = "nndescent",
+    cache_dir: Optional[str] = None,
+    n_jobs: Optional[int] = None,
+    random_state: Optional[int] = None,
+) -> None:
+    """Reduce and cluster in one pass, sharing a single neighbor graph
+    \f
+    Parameters
+    ----------
+    data_file : `str`
+        Cells in rows and analytes in columns.
+    output : `str`
+        File to write the embeddings and cluster identities to.
+    reduction : `str`
+        As for `reduce-data`.
+    resolutions : `str`
+        Comma-separated clustering resolutions.
+    n_neighbors : `int`
+        Neighbors in the graph shared by the reduction and the clustering.
+    ignore_columns : `str`
+        Comma-separated columns of `data_file` to leave out.
+    add_to_source : `bool`
+        Append the results to a copy of `data_file`.
+    sidecar : `bool`
+        Write only the result columns, keyed by row.
+    neighbor_backend : `str`
+        See :func:`~mcr.neighbors.nearest_neighbors`.
+    cache_dir : `str`, optional
+        Directory used to persist neighbor graphs between runs.
+    n_jobs : `int`, optional
+        Worker processes used when clustering at several resolutions.
+    random_state : `int`, optional
+        Seed for reproducible results.
+    """
+    from .pipeline import reduce_and_cluster
+
+    original_df, df = load_input(
+        data_file, ignore_columns, add_to_source and not sidecar
+    )
+
+    results = reduce_and_cluster(
+        df,
+        reduction=reduction,
+        resolutions=[float(x) for x in resolutions.split(",")],
+        n_neighbors=n_neighbors,
+        neighbor_backend=neighbor_backend,
+        random_state=random_state,
+        cache=GraphCache(cache_dir=cache_dir) if cache_dir else None,
+        n_jobs=n_jobs,
+    )
+
+    if sidecar:
+        write_sidecar(results, output, source=data_file)
+    elif add_to_source:
+        write_table(
+            pd.concat([original_df.reset_index(drop=True), results], axis=1),
+            output,
+        )
     else:
-        np.savetxt(fname=output, X=clusters.astype(int), fmt="%i")
+        write_table(results, output)
+
+
+@main.command()
+@click.option(
+    "--data_file",
+    help=(
+        "File containing antigen expression (CSV, TSV, Excel, Parquet, "
+        "Feather, or HDF5)"
+    ),
+    type=str,
+    default=None,
+    show_default=True,
+    required=True,
+)
+@click.option(
+    "--output",
+    help="File to write the table of resolutions and cluster counts to",
+    type=str,
+    default="resolution_profile.csv",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--memberships",
+    help="If given, also write each distinct partition, one column each, here",
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--min_resolution",
+    help="Lowest resolution to scan",
+    type=float,
+    default=0.05,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--max_resolution",
+    help="Highest resolution to scan",
+    type=float,
+    default=3.0,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--min_diff_resolution",
+    help="Stop bisecting intervals narrower than this",
+    type=float,
+    default=1e-3,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_neighbors",
+    help="Number of neighbors used to build the clustering graph",
+    type=int,
+    default=30,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--ignore_columns",
+    help=(
+        "A list of columns (seperated by commas) in the `data_file` to "
+        "ignore.  Generally stuff like cell name or size or anything that "
+        "might be irrelvant"
+    ),
+    type=str,
+    default=DEFAULT_IGNORE_COLUMNS,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--neighbor_backend",
+    help="Nearest-neighbor search to build the graph with",
+    type=click.Choice(NEIGHBOR_BACKENDS),
+    default="nndescent",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--cache_dir",
+    help="Directory in which to cache neighbor graphs between runs",
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+def resolution_profile(
+    data_file: str,
+    output: str = "resolution_profile.csv",
+    memberships: Optional[str] = None,
+    min_resolution: float = 0.05,
+    max_resolution: float = 3.0,
+    min_diff_resolution: float = 1e-3,
+    n_neighbors: int = 30,
+    ignore_columns: Optional[str] = DEFAULT_IGNORE_COLUMNS,
+    neighbor_backend: str = "nndescent",
+    cache_dir: Optional[str] = None,
+) -> None:
+    """Find every distinct Leiden partition across a range of resolutions
+    \f
+    Parameters
+    ----------
+    data_file : `str`
+        Cells in rows and analytes in columns.
+    output : `str`
+        File to write one row per partition to: the range of resolutions
+        giving it, its number of clusters, and its quality.
+    memberships : `str`, optional
+        File to write the cluster identities of every partition to.
+    min_resolution, max_resolution : `float`
+        Range of resolutions to bisect.
+    min_diff_resolution : `float`
+        Narrowest interval of resolutions that is bisected further.
+    n_neighbors : `int`
+        Neighbors in the clustering graph.
+    ignore_columns : `str`
+        Comma-separated columns of `data_file` to leave out.
+    neighbor_backend : `str`
+        See :func:`~mcr.neighbors.nearest_neighbors`.
+    cache_dir : `str`, optional
+        Directory used to persist neighbor graphs between runs.
+    """
+    from .clustering import scan_resolution_profile
+
+    _, df = load_input(data_file, ignore_columns, False)
+
+    scan = scan_resolution_profile(
+        data_df=df,
+        resolution_range=(min_resolution, max_resolution),
+        min_diff_resolution=min_diff_resolution,
+        n_neighbors=n_neighbors,
+        neighbor_backend=neighbor_backend,
+        cache=GraphCache(cache_dir=cache_dir) if cache_dir else None,
+    )
+    logging.getLogger("mcr").info(
+        f"found {len(scan.table)} partitions between resolutions "
+        f"{min_resolution} and {max_resolution}"
+    )
+    write_table(scan.table, output)
+    if memberships:
+        write_table(scan.memberships, memberships)
+
+
+@main.command()
+@click.option(
+    "--data_file",
+    help="File containing the reference cells",
+    type=str,
+    default=None,
+    show_default=True,
+    required=True,
+)
+@click.option(
+    "--model",
+    help="Filename to save the fitted model to",
+    type=str,
+    default="model.joblib",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--reduction",
+    help="Type of dimensional reduction to fit",
+    type=click.Choice(PROJECTABLE_REDUCTIONS),
+    default="umap",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--resolution",
+    help="Resolution at which to cluster the reference cells",
+    type=float,
+    default=0.6,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_neighbors",
+    help="Number of neighbors used to build the clustering graph",
+    type=int,
+    default=30,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--ignore_columns",
+    help=(
+        "A list of columns (seperated by commas) in the `data_file` to "
+        "ignore.  Generally stuff like cell name or size or anything that "
+        "might be irrelvant"
+    ),
+    type=str,
+    default=DEFAULT_IGNORE_COLUMNS,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--output",
+    help="If given, also write the reference embeddings and clusters here",
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+def fit(
+    data_file: str,
+    model: str,
+    reduction: str = "umap",
+    resolution: float = 0.6,
+    n_neighbors: int = 30,
+    ignore_columns: Optional[str] = None,
+    output: Optional[str] = None,
+) -> None:
+    """Fit a reduction and clustering that new cells can be projected into
+    \f
+    Parameters
+    ----------
+    data_file : `str`
+        Reference cells, in the same layout as for `reduce-data`.
+    model : `str`
+        File to save the fitted :class:`~mcr.model.MCRModel` to.
+    reduction : `str`
+        One of :data:`~mcr.model.PROJECTABLE_REDUCTIONS`.
+    resolution : `float`
+        Clustering resolution.
+    n_neighbors : `int`
+        Neighbors used for the clustering graph.
+    ignore_columns : `str`
+        Comma-separated columns to leave out of the model.
+    output : `str`, optional
+        Where to write the embeddings and clusters of the reference cells.
+    """
+    _, df = load_input(data_file, ignore_columns, add_to_source=False)
+
+    fitted = MCRModel.fit(
+        df, reduction=reduction, resolution=resolution, n_neighbors=n_neighbors
+    )
+    fitted.save(model)
+
+    if output:
+        write_table(fitted.reference, output)
+
+
+@main.command()
+@click.option(
+    "--data_file",
+    help="File containing the new cells",
+    type=str,
+    default=None,
+    show_default=True,
+    required=True,
+)
+@click.option(
+    "--model",
+    help="A model saved by `mcr fit`",
+    type=str,
+    default="model.joblib",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--output",
+    help=(
+        "Filename to write results to.  The format (CSV, TSV, Parquet, or "
+        "Feather) is chosen by the file extension."
+    ),
+    type=str,
+    default="output.csv",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--add_to_source",
+    help=(
+        "If true, embeddings and clusters are added as columns to the "
+        "original data; if false, they are saved alone."
+    ),
+    type=bool,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--sidecar",
+    help="Write only the new columns, keyed by row",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+def project(
+    data_file: str,
+    model: str,
+    output: str,
+    add_to_source: bool = False,
+    sidecar: bool = False,
+) -> None:
+    """Place new cells into the embedding and clusters of a fitted model
+    \f
+    Parameters
+    ----------
+    data_file : `str`
+        New cells, with at least the columns the model was fit on.
+    model : `str`
+        File written by `mcr fit`.
+    output : `str`
+        File to write results to.
+    add_to_source : `bool`
+        Append the results to a copy of `data_file` rather than writing
+        them alone.
+    sidecar : `bool`
+        Write only the result columns, keyed by row.
+    """
+    fitted = MCRModel.load(model)
+
+    if add_to_source and not sidecar:
+        original_df = read_data(data_file, downcast=False)
+        df = original_df
+    else:
+        features = set(fitted.feature_columns)
+        ignored = [x for x in read_columns(data_file) if x not in features]
+        df = read_data(data_file, ignore_columns=ignored)
+
+    projected = fitted.project(df)
+
+    if sidecar:
+        write_sidecar(projected, output, source=data_file)
+    elif add_to_source:
+        write_table(
+            pd.concat([original_df.reset_index(drop=True), projected], axis=1),
+            output,
+        )
+    else:
+        write_table(projected, output)
+
+
+@main.command()
+@click.option(
+    "--inputs",
+    help=(
+        "Glob pattern of data files to process (quote it so the shell does "
+        "not expand it; '**' matches subdirectories).  May be repeated."
+    ),
+    type=str,
+    multiple=True,
+    default=(),
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--manifest",
+    help="Text file listing data files to process, one per line",
+    type=str,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--output_dir",
+    help="Directory to write one output per input file to",
+    type=str,
+    default="mcr_output",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--output_format",
+    help="Format of the output files",
+    type=click.Choice([".parquet", ".feather", ".csv", ".tsv"]),
+    default=".parquet",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--reduction",
+    help="Type of dimensional reduction to perform",
+    type=click.Choice(
+        ["umap", "pumap", "tsne", "pacmap", "openTSNE", "optsne"]
+    ),
+    default="umap",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--resolution",
+    help="Resolution at which to cluster",
+    type=float,
+    default=0.6,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_neighbors",
+    help="Number of neighbors used for both the reduction and clustering",
+    type=int,
+    default=30,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--ignore_columns",
+    help=(
+        "A list of columns (seperated by commas) in the data files to "
+        "ignore.  Generally stuff like cell name or size or anything that "
+        "might be irrelvant"
+    ),
+    type=str,
+    default=DEFAULT_IGNORE_COLUMNS,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--neighbor_backend",
+    help="Method used to find nearest neighbors",
+    type=click.Choice(NEIGHBOR_BACKENDS),
+    default="nndescent",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--add_to_source",
+    help=(
+        "If true, embeddings and clusters are added as columns to the "
+        "original data; if false, they are saved alone."
+    ),
+    type=bool,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--n_jobs",
+    help="Number of worker processes (default: one per file, up to the CPUs)",
+    type=int,
+    default=None,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--force",
+    help="Process every file, even those whose outputs are up to date",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--report",
+    help="Summary of the run, written to `output_dir`",
+    type=str,
+    default="batch_report.csv",
+    show_default=True,
+    required=False,
+)
+def batch(
+    inputs: Tuple[str, ...] = (),
+    manifest: Optional[str] = None,
+    output_dir: str = "mcr_output",
+    output_format: str = ".parquet",
+    reduction: str = "umap",
+    resolution: float = 0.6,
+    n_neighbors: int = 30,
+    ignore_columns: Optional[str] = None,
+    neighbor_backend: str = "nndescent",
+    add_to_source: bool = False,
+    n_jobs: Optional[int] = None,
+    force: bool = False,
+    report: str = "batch_report.csv",
+) -> None:
+    """Reduce and cluster many data files with one pool of worker processes
+    \f
+    Parameters
+    ----------
+    inputs : `tuple` of `str`
+        Glob patterns of data files.
+    manifest : `str`, optional
+        File listing data files, one per line.
+    output_dir : `str`
+        Where outputs, the report, and the record of the settings each
+        output was made with are written.
+    output_format : `str`
+        Suffix, and so format, of the outputs.
+    reduction, resolution, n_neighbors, ignore_columns, neighbor_backend
+        As for `reduce-data` and `cluster-cells`; a single neighbor graph
+        per file is used for both.
+    add_to_source : `bool`
+        Include the original columns in each output.
+    n_jobs : `int`, optional
+        Number of worker processes.
+    force : `bool`
+        Reprocess files whose outputs are newer than them and were made with
+        the same settings, which are otherwise skipped.
+    report : `str`
+        Name of the summary table written to `output_dir`.
+    """
+    from .batch import collect_inputs, run_batch
+
+    files = collect_inputs(inputs, manifest)
+    if not files:
+        raise click.UsageError("no data files given by --inputs or --manifest")
+
+    summary = run_batch(
+        files,
+        output_dir=output_dir,
+        output_format=output_format,
+        n_jobs=n_jobs,
+        force=force,
+        report=report,
+        reduction=reduction,
+        resolution=resolution,
+        n_neighbors=n_neighbors,
+        ignore_columns=ignore_columns.split(",") if ignore_columns else None,
+        neighbor_backend=neighbor_backend,
+        add_to_source=add_to_source,
+    )
+    logging.getLogger("mcr").info(
+        "batch finished: "
+        + ", ".join(
+            f"{n} {status}"
+            for status, n in summary["status"].value_counts().items()
+        )
+    )
+
+
+@main.command()
+@click.option(
+    "--reduction",
+    help="Reduction whose kernels to compile as well as the clustering's",
+    type=click.Choice(["umap", "none"]),
+    default="umap",
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--check",
+    help="Only report whether the cache is warm for the installed versions",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--prune",
+    help="Delete kernels cached for previously installed versions",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    required=False,
+)
+def warmup(
+    reduction: str = "umap", check: bool = False, prune: bool = False
+) -> None:
+    """Compile numba kernels into mcr's on-disk cache
+    \f
+    Run this once after installing or upgrading (for instance when building a
+    container image) so later runs load the compiled kernels rather than
+    compiling them again.  The cache lives in ``$MCR_CACHE_DIR/numba`` or
+    ``~/.cache/mcr/numba``, unless ``NUMBA_CACHE_DIR`` is set.
+
+    Parameters
+    ----------
+    reduction : `str`
+        "umap" or "none".
+    check : `bool`
+        Report on the cache without compiling anything; exits with status 1
+        if it is not warm.
+    prune : `bool`
+        Remove caches made for other versions of mcr and its dependencies.
+    """
+    if prune:
+        removed = jit.prune()
+        logging.critical(f"removed {removed} stale kernel caches")
+
+    if check:
+        status = jit.cache_status()
+    else:
+        status = jit.warmup(None if reduction == "none" else reduction)
+
+    for key, value in status.items():
+        click.echo(f"{key}: {value}")
+    if check and not status["warm"]:
+        raise SystemExit(1)
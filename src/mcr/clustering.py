@@ -1,12 +1,31 @@
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple, Type, Union
 
 import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 
 import igraph as ig
 import leidenalg as la
 import numpy as np
 import pandas as pd
-import scipy
+import scipy.sparse
+
+from .neighbors import (
+    GraphCache,
+    NeighborGraph,
+    as_feature_matrix,
+    build_neighbor_graph,
+    get_graph_cache,
+    graph_key,
+)
+from .profiling import stage
+from .shared import SharedArray, SharedArrays, attach_shared
+from .subsample import compare_partitions, subsample_cells, transfer_labels
 
 try:
     from leidenalg.VertexPartition import MutableVertexPartition
@@ -18,30 +37,177 @@ except ImportError:
     MutableVertexPartition.__module__ = "leidenalg.VertexPartition"
 
 
-# taken from scanpy._utils
-def get_igraph_from_adjacency(adjacency, directed=None):
+class PartitionCache:
     """\
-    Get igraph graph from adjacency matrix.
+    Memberships already found on each graph, by resolution, so that a
+    clustering at a new resolution can start from the nearest one rather
+    than from singletons (see `warm_start` in :func:`label_clusters`).
+
+    Memberships are kept in memory for the `max_graphs` most recently used
+    graphs and, if `cache_dir` is given, also written there as ``.npy``
+    files, so other processes (such as the GUI's job workers) can use them.
+
+    Parameters
+    ----------
+    max_graphs
+        int
+        default = 16
+    cache_dir
+        Optional[Union[str, Path]]
+        default = None
     """
-    sources, targets = adjacency.nonzero()
-    weights = adjacency[sources, targets]
-    if isinstance(weights, np.matrix):
-        weights = weights.A1
-    g = ig.Graph(directed=directed)
-    g.add_vertices(adjacency.shape[0])  # this adds adjacency.shape[0] vertices
-    g.add_edges(list(zip(sources, targets)))
-    g.es["weight"] = weights
 
-    if g.vcount() != adjacency.shape[0]:
-        logging.warning(
-            f"The constructed graph has only {g.vcount()} nodes. "
-            "Your adjacency matrix contained redundant nodes."
+    def __init__(self, max_graphs: int = 16, cache_dir=None):
+        self.max_graphs = max_graphs
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self._memory: "OrderedDict[str, Dict[float, np.ndarray]]" = (
+            OrderedDict()
+        )
+
+    def _disk_dir(self, key: str) -> Optional[Path]:
+        return None if self.cache_dir is None else self.cache_dir / key
+
+    def _resolutions(self, key: str) -> Dict[float, Any]:
+        found: Dict[float, Any] = {}
+        disk_dir = self._disk_dir(key)
+        if disk_dir is not None and disk_dir.exists():
+            found.update({float(p.stem): p for p in disk_dir.glob("*.npy")})
+        found.update(self._memory.get(key, {}))
+        return found
+
+    def nearest(
+        self, key: str, resolution: float
+    ) -> Optional[Tuple[float, np.ndarray]]:
+        """\
+        The cached resolution closest to `resolution` on the graph `key`,
+        and its membership, or None.
+        """
+        found = self._resolutions(key)
+        if not found:
+            return None
+        nearest = min(found, key=lambda r: abs(r - resolution))
+        membership = found[nearest]
+        if isinstance(membership, Path):
+            membership = np.load(membership)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+        return nearest, membership
+
+    def put(self, key: str, resolution: float, membership: np.ndarray) -> None:
+        self._memory.setdefault(key, {})[float(resolution)] = membership
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_graphs:
+            self._memory.popitem(last=False)
+
+        disk_dir = self._disk_dir(key)
+        if disk_dir is not None:
+            disk_dir.mkdir(parents=True, exist_ok=True)
+            path = disk_dir / f"{float(resolution)}.npy"
+            tmp_path = path.with_suffix(".tmp.npy")
+            np.save(tmp_path, membership)
+            os.replace(tmp_path, path)
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+
+_default_partition_cache: Optional[PartitionCache] = None
+
+
+def get_partition_cache() -> PartitionCache:
+    """\
+    Return the process-wide partition cache, which, like the graph cache, is
+    also kept on disk in ``$MCR_CACHE_DIR/partitions`` if that is set.
+    """
+    global _default_partition_cache
+    if _default_partition_cache is None:
+        cache_dir = os.environ.get("MCR_CACHE_DIR")
+        _default_partition_cache = PartitionCache(
+            cache_dir=Path(cache_dir, "partitions") if cache_dir else None
+        )
+    return _default_partition_cache
+
+
+def _partition_key(
+    graph: NeighborGraph,
+    partition_type: Optional[Type[MutableVertexPartition]],
+    directed_graph: bool,
+    use_weights: bool,
+) -> str:
+    # memberships can only seed a partition of the same kind on the same graph
+    partition_type = partition_type or la.RBConfigurationVertexPartition
+    return graph_key(
+        graph.key,
+        partition_type=partition_type.__name__,
+        directed=directed_graph,
+        use_weights=use_weights,
+    )
+
+
+def graph_from_adjacency(
+    adjacency, directed: bool = False
+) -> Tuple[ig.Graph, np.ndarray]:
+    """\
+    Build an igraph graph directly from the COO arrays of a sparse adjacency
+    matrix, without materializing Python tuples for the edges.
+
+    For undirected graphs each pair of vertices gets a single edge whose
+    weight is `adjacency[i, j] + adjacency[j, i]`, which is what the duplicate
+    edges produced by :func:`get_igraph_from_adjacency` used to add up to.
+
+    Parameters
+    ----------
+    adjacency
+        :class:`scipy.sparse.spmatrix` or array-like
+    directed
+        bool
+        default = False
+
+    Returns
+    -------
+    the graph, without any edge attributes, and a float64 array of edge
+    weights in edge order
+    """
+    adjacency = scipy.sparse.csr_matrix(adjacency)
+    edges, weights = _edge_arrays(adjacency, directed=directed)
+    g = ig.Graph(n=adjacency.shape[0], edges=edges, directed=directed)
+    return g, weights
+
+
+def _edge_arrays(
+    adjacency, directed: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    # the (n_edges, 2) endpoints and the weights of the edges of the graph
+    # built by graph_from_adjacency, in the same order
+    adjacency = scipy.sparse.csr_matrix(adjacency)
+    if not directed:
+        diagonal = adjacency.diagonal()
+        adjacency = scipy.sparse.triu(
+            adjacency + adjacency.T, k=1, format="csr"
         )
+        if diagonal.any():
+            adjacency = adjacency + scipy.sparse.diags(diagonal, format="csr")
+    adjacency.eliminate_zeros()
+    adjacency = adjacency.tocoo()
+
+    edges = np.empty((adjacency.nnz, 2), dtype=np.int64)
+    edges[:, 0] = adjacency.row
+    edges[:, 1] = adjacency.col
+    return edges, adjacency.data.astype(np.float64, copy=False)
+
+
+def get_igraph_from_adjacency(adjacency, directed=None):
+    """\
+    Get igraph graph from adjacency matrix, with the edge weights stored in
+    the "weight" edge attribute.
+    """
+    g, weights = graph_from_adjacency(adjacency, directed=bool(directed))
+    g.es["weight"] = weights
     return g
 
 
 def label_clusters(
-    data_df: pd.DataFrame,
+    data_df: Optional[pd.DataFrame] = None,
     resolution: float = 1.0,
     partition_type: Optional[Type[MutableVertexPartition]] = None,
     n_neighbors: int = 30,
@@ -55,6 +221,16 @@ def label_clusters(
     directed_graph: bool = False,
     use_weights: bool = True,
     n_iterations: int = -1,
+    neighbor_backend: str = "nndescent",
+    graph: Optional[NeighborGraph] = None,
+    use_cache: bool = False,
+    cache: Optional[GraphCache] = None,
+    subsample: Optional[int] = None,
+    subsample_strategy: str = "uniform",
+    transfer_neighbors: int = 15,
+    initial_membership: Optional[Sequence[int]] = None,
+    warm_start: bool = False,
+    partition_cache: Optional[PartitionCache] = None,
     **partition_kwargs,
 ) -> np.array:
     """\
@@ -98,58 +274,810 @@ def label_clusters(
     directed_graph
         bool
         default = False
+    neighbor_backend
+        str
+        default = "nndescent".  How neighbors are found; see
+        :func:`~mcr.neighbors.nearest_neighbors`.
+    graph
+        Optional[:class:`~mcr.neighbors.NeighborGraph`]
+        default = None.  A precomputed neighbor graph; if given, `data_df` and
+        the neighbor/fuzzy parameters are ignored.  In a worker process,
+        `graph` (like `data_df`) can be a descriptor from
+        :class:`~mcr.shared.SharedArrays`, which is used without copying.
+    use_cache
+        bool
+        default = False.  Look up and store the neighbor graph in the
+        process-wide cache from :func:`~mcr.neighbors.get_graph_cache`, so
+        that repeated calls on the same data with the same neighbor
+        parameters (e.g. at several resolutions) only compute it once.
+    cache
+        Optional[:class:`~mcr.neighbors.GraphCache`]
+        default = None.  A cache to use instead of the process-wide one;
+        if given, it is used whatever `use_cache` is.
+    subsample
+        Optional[int]
+        default = None.  If given and there are more cells than this, only
+        this many cells are clustered and every other cell is assigned the
+        majority cluster of its `transfer_neighbors` nearest clustered cells.
+        See :func:`subsample_agreement` to judge what this costs in accuracy.
+    subsample_strategy
+        str
+        default = "uniform".  How the clustered cells are chosen; see
+        :func:`~mcr.subsample.subsample_cells`.
+    transfer_neighbors
+        int
+        default = 15
+    initial_membership
+        Optional[Sequence[int]]
+        default = None.  A partition of the clustered cells to refine,
+        instead of starting from every cell in its own cluster.
+    warm_start
+        bool
+        default = False.  Start from the membership found at the nearest
+        resolution already clustered on the same graph, if any, and remember
+        this result for later calls.  Much faster when only the resolution
+        changes, but the result depends on the order of the calls.
+    partition_cache
+        Optional[PartitionCache]
+        default = None, meaning the cache from :func:`get_partition_cache`
 
     Returns
     -------
     np.array of cluster identities
     """
-    from umap.umap_ import fuzzy_simplicial_set, nearest_neighbors
+    graph = attach_shared(graph)
+    sampled = None
+    if (
+        subsample is not None
+        and graph is None
+        and data_df.shape[0] > subsample
+    ):
+        X = as_feature_matrix(data_df)
+        with stage("subsample", strategy=subsample_strategy):
+            sampled = subsample_cells(
+                X,
+                subsample,
+                strategy=subsample_strategy,
+                random_state=random_state,
+            )
+        logging.critical(
+            f"clustering a {subsample_strategy} subsample of {len(sampled)} "
+            f"out of {X.shape[0]} cells"
+        )
+        data_df = X[sampled]
 
-    partition_kwargs = dict(partition_kwargs)
+    if graph is None:
+        if cache is None and use_cache:
+            cache = get_graph_cache()
+        graph = build_neighbor_graph(
+            data_df,
+            n_neighbors=n_neighbors,
+            random_state=random_state,
+            neighbor_metric=neighbor_metric,
+            neighbor_kwds=neighbor_kwds,
+            neighbor_angular=neighbor_angular,
+            neighbor_verbose=neighbor_verbose,
+            fuzzy_metric=fuzzy_metric,
+            fuzzy_metric_kwds=fuzzy_metric_kwds,
+            neighbor_backend=neighbor_backend,
+            cache=cache,
+        )
+    connectivities = graph.connectivities
 
-    logging.critical(
-        f"running nearest_neighbor().  Dataset is {data_df.shape[0]} by {data_df.shape[1]}."
-    )
-    knn_indices, knn_distances, *_ = nearest_neighbors(
-        X=data_df,
-        n_neighbors=n_neighbors,
-        random_state=random_state,
-        metric=neighbor_metric,
-        metric_kwds=neighbor_kwds,
-        angular=neighbor_angular,
-        verbose=neighbor_verbose,
+    logging.critical("running graph_from_adjacency()")
+    with stage("graph_build", edges=connectivities.nnz):
+        g, weights = graph_from_adjacency(
+            connectivities, directed=directed_graph
+        )
+
+    if warm_start:
+        partition_cache = partition_cache or get_partition_cache()
+        partition_key = _partition_key(
+            graph, partition_type, directed_graph, use_weights
+        )
+        if initial_membership is None:
+            cached = partition_cache.nearest(partition_key, resolution)
+            if cached is not None:
+                logging.critical(
+                    f"refining the partition found at resolution {cached[0]}"
+                )
+                initial_membership = cached[1]
+
+    with stage(
+        "partition",
+        resolution=resolution,
+        warm_start=initial_membership is not None,
+    ):
+        membership = _find_partition(
+            g,
+            resolution=resolution,
+            partition_type=partition_type,
+            weights=weights if use_weights else None,
+            n_iterations=n_iterations,
+            initial_membership=initial_membership,
+            **partition_kwargs,
+        )
+
+    if warm_start:
+        partition_cache.put(partition_key, resolution, membership)
+
+    if sampled is not None:
+        logging.critical("transferring cluster labels to the remaining cells")
+        with stage("transfer_labels"):
+            membership = transfer_labels(
+                X, sampled, membership, n_neighbors=transfer_neighbors
+            )
+    return membership
+
+
+def subsample_agreement(
+    data_df: pd.DataFrame,
+    subsample: int = 200_000,
+    subsample_strategy: str = "uniform",
+    resolution: float = 1.0,
+    return_labels: bool = False,
+    **kwargs,
+) -> Union[Dict[str, float], Tuple[Dict[str, float], np.ndarray]]:
+    """\
+    Cluster `data_df` both in full and through a subsample, and report how
+    well the two agree and how long each took.
+
+    Parameters
+    ----------
+    data_df:
+        :class:`pandas.DataFrame`
+    subsample
+        int
+        default = 200,000
+    subsample_strategy
+        str
+        default = "uniform"
+    resolution
+        float
+        default = 1.0
+    return_labels
+        bool
+        default = False.  Also return the labels of the subsampled run, so
+        that callers wanting them do not cluster a third time.
+    **kwargs
+        passed to :func:`label_clusters` for both runs
+
+    Returns
+    -------
+    the output of :func:`~mcr.subsample.compare_partitions`, plus the wall
+    time in seconds of the full ("full_seconds") and subsampled
+    ("subsample_seconds") runs, and the subsampled labels if `return_labels`
+    """
+    start = time.perf_counter()
+    full = label_clusters(data_df, resolution=resolution, **kwargs)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approximate = label_clusters(
+        data_df,
+        resolution=resolution,
+        subsample=subsample,
+        subsample_strategy=subsample_strategy,
+        **kwargs,
     )
+    subsample_seconds = time.perf_counter() - start
 
-    logging.critical("running fuzzy_simplicial_set()")
-    connectivities, *_ = fuzzy_simplicial_set(
-        X=scipy.sparse.coo_matrix(([], ([], [])), shape=(data_df.shape[0], 1)),
-        n_neighbors=n_neighbors,
-        random_state=random_state,
-        metric=fuzzy_metric,
-        metric_kwds=fuzzy_metric_kwds,
-        knn_indices=knn_indices,
-        knn_dists=knn_distances,
-        return_dists=True,
+    agreement = compare_partitions(full, approximate)
+    agreement["full_seconds"] = full_seconds
+    agreement["subsample_seconds"] = subsample_seconds
+    if return_labels:
+        return agreement, approximate
+    return agreement
+
+
+def _find_partition(
+    g: ig.Graph,
+    resolution: Optional[float],
+    partition_type: Optional[Type[MutableVertexPartition]] = None,
+    weights: Optional[np.ndarray] = None,
+    n_iterations: int = -1,
+    initial_membership: Optional[Sequence[int]] = None,
+    **partition_kwargs,
+) -> np.array:
+    partition = _leiden_partition(
+        g,
+        resolution,
+        partition_type=partition_type,
+        weights=weights,
+        n_iterations=n_iterations,
+        initial_membership=initial_membership,
+        **partition_kwargs,
     )
+    return np.array(partition.membership)
 
-    logging.critical("running get_igraph_from_adjacency()")
-    g = get_igraph_from_adjacency(connectivities, directed=directed_graph)
 
-    logging.critical("running find_partition()")
+def _leiden_partition(
+    g: ig.Graph,
+    resolution: Optional[float],
+    partition_type: Optional[Type[MutableVertexPartition]] = None,
+    weights: Optional[np.ndarray] = None,
+    n_iterations: int = -1,
+    initial_membership: Optional[Sequence[int]] = None,
+    seed: int = 0,
+    **partition_kwargs,
+) -> MutableVertexPartition:
+    logging.critical(f"running find_partition() at resolution {resolution}")
 
     if partition_type is None:
         partition_type = la.RBConfigurationVertexPartition
-    if use_weights:
-        partition_kwargs["weights"] = np.array(g.es["weight"]).astype(
-            np.float64
-        )
+    if weights is not None:
+        partition_kwargs["weights"] = weights
     partition_kwargs["n_iterations"] = n_iterations
-    partition_kwargs["seed"] = 0
+    partition_kwargs["seed"] = seed
     if resolution is not None:
         partition_kwargs["resolution_parameter"] = resolution
+    if initial_membership is not None:
+        # find_partition refines this with Optimiser.optimise_partition,
+        # which moves, merges, and splits its clusters as needed
+        partition_kwargs["initial_membership"] = np.asarray(
+            initial_membership
+        ).tolist()
 
-    partition = la.find_partition(
+    return la.find_partition(
         graph=g, partition_type=partition_type, **partition_kwargs
     )
 
-    return np.array(partition.membership)
+
+_NEIGHBOR_PARAMETERS = {
+    "n_neighbors",
+    "random_state",
+    "neighbor_metric",
+    "neighbor_kwds",
+    "neighbor_angular",
+    "neighbor_verbose",
+    "fuzzy_metric",
+    "fuzzy_metric_kwds",
+    "neighbor_backend",
+}
+
+
+# graph built by each sweep worker once, by the pool initializer, rather
+# than pickled along with every resolution
+_sweep_graph: Optional[ig.Graph] = None
+_sweep_weights: Optional[np.ndarray] = None
+
+
+def _init_sweep_worker(
+    n_vertices: int,
+    edges: SharedArray,
+    weights: Optional[SharedArray],
+    directed: bool,
+) -> None:
+    global _sweep_graph, _sweep_weights
+    _sweep_graph = ig.Graph(
+        n=n_vertices, edges=edges.attach(), directed=directed
+    )
+    _sweep_weights = None if weights is None else weights.attach()
+
+
+@contextmanager
+def _partition_pool(
+    n_jobs: int,
+    n_vertices: int,
+    edges: np.ndarray,
+    weights: Optional[np.ndarray],
+    directed: bool,
+):
+    # the edge arrays reach the workers through shared memory rather than as
+    # a pickled igraph graph, so starting one does not grow with the graph;
+    # "spawn" since forking after numba has started its threads can deadlock
+    with SharedArrays() as shared, ProcessPoolExecutor(
+        max_workers=n_jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_sweep_worker,
+        initargs=(
+            n_vertices,
+            shared.array(edges),
+            None if weights is None else shared.array(weights),
+            directed,
+        ),
+    ) as executor:
+        yield executor
+
+
+def _sweep_partition(resolution: float, kwargs: Dict[str, Any]) -> np.array:
+    return _find_partition(
+        _sweep_graph, resolution=resolution, weights=_sweep_weights, **kwargs
+    )
+
+
+def label_clusters_sweep(
+    data_df: Optional[pd.DataFrame] = None,
+    resolutions: Sequence[float] = (0.2, 0.4, 0.6, 0.8, 1.0),
+    n_jobs: Optional[int] = None,
+    partition_type: Optional[Type[MutableVertexPartition]] = None,
+    directed_graph: bool = False,
+    use_weights: bool = True,
+    n_iterations: int = -1,
+    graph: Optional[NeighborGraph] = None,
+    use_cache: bool = False,
+    cache: Optional[GraphCache] = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """\
+    Assign cluster identities at several resolutions at once.
+
+    The neighbor graph is built a single time and the Leiden partitions for
+    the different resolutions are then found in parallel, one resolution per
+    worker process.  The workers get the graph's edges through shared memory
+    (see :mod:`mcr.shared`) instead of a pickled copy each.
+
+    Parameters
+    ----------
+    data_df:
+        :class:`pandas.DataFrame`
+    resolutions
+        Sequence[float]
+        default = (0.2, 0.4, 0.6, 0.8, 1.0)
+    n_jobs
+        Optional[int]
+        default = None, one process per resolution up to the number of CPUs.
+        With `n_jobs=1` the partitions are found in the calling process.
+    partition_type, directed_graph, use_weights, n_iterations, graph,
+    use_cache, cache
+        as for :func:`label_clusters`
+    **kwargs
+        Parameters for :func:`~mcr.neighbors.build_neighbor_graph` (e.g.
+        `n_neighbors`); anything else is passed to :func:`leidenalg.find_partition`.
+
+    Returns
+    -------
+    :class:`pandas.DataFrame` with one column of cluster identities, named
+    `res_X`, per resolution
+    """
+    neighbor_kwargs = {
+        k: kwargs.pop(k) for k in list(kwargs) if k in _NEIGHBOR_PARAMETERS
+    }
+    graph = attach_shared(graph)
+    if graph is None:
+        if cache is None and use_cache:
+            cache = get_graph_cache()
+        graph = build_neighbor_graph(
+            data_df,
+            cache=cache,
+            **neighbor_kwargs,
+        )
+
+    logging.critical("running graph_from_adjacency()")
+    with stage("graph_build", edges=graph.connectivities.nnz):
+        edges, weights = _edge_arrays(
+            graph.connectivities, directed=directed_graph
+        )
+        g = ig.Graph(
+            n=graph.connectivities.shape[0],
+            edges=edges,
+            directed=directed_graph,
+        )
+    if not use_weights:
+        weights = None
+
+    partition_kwargs = dict(
+        partition_type=partition_type,
+        n_iterations=n_iterations,
+        **kwargs,
+    )
+
+    if n_jobs is None:
+        n_jobs = min(len(resolutions), os.cpu_count() or 1)
+
+    with stage("partition_sweep", resolutions=len(resolutions), n_jobs=n_jobs):
+        if n_jobs == 1:
+            memberships = [
+                _find_partition(
+                    g, resolution=r, weights=weights, **partition_kwargs
+                )
+                for r in resolutions
+            ]
+        else:
+            with _partition_pool(
+                n_jobs, g.vcount(), edges, weights, directed_graph
+            ) as executor:
+                memberships = list(
+                    executor.map(
+                        _sweep_partition,
+                        resolutions,
+                        [partition_kwargs] * len(resolutions),
+                    )
+                )
+
+    return pd.DataFrame(
+        {f"res_{r}": m for r, m in zip(resolutions, memberships)}
+    )
+
+
+CONSENSUS_METHODS = ["best", "consensus"]
+
+
+def _seeded_partition(
+    seed: int, kwargs: Dict[str, Any]
+) -> Tuple[np.ndarray, float]:
+    partition = _leiden_partition(
+        _sweep_graph, weights=_sweep_weights, seed=seed, **kwargs
+    )
+    return np.array(partition.membership), partition.quality()
+
+
+class ConsensusClusters(NamedTuple):
+    """\
+    The result of :func:`label_clusters_consensus`.
+
+    membership
+        np.ndarray of cluster identities
+    stability
+        :class:`pandas.DataFrame` with one row per cluster, as returned by
+        :func:`cluster_stability`
+    qualities
+        np.ndarray of the quality of each seeded partition, in seed order
+    """
+
+    membership: np.ndarray
+    stability: pd.DataFrame
+    qualities: np.ndarray
+
+
+def cluster_stability(
+    membership: Sequence[int], runs: Sequence[Sequence[int]]
+) -> pd.DataFrame:
+    """\
+    How reproducible each cluster of `membership` is across `runs`: the mean,
+    over the runs, of the highest Jaccard index between the cluster and any
+    cluster of that run.  Clusters with a stability below about 0.6 are
+    usually not found consistently.
+
+    Parameters
+    ----------
+    membership
+        Sequence[int] of cluster identities
+    runs
+        Sequence[Sequence[int]] of other partitions of the same cells
+
+    Returns
+    -------
+    :class:`pandas.DataFrame` with the `cluster`, its `size`, and its
+    `stability`
+    """
+    labels, codes, sizes = np.unique(
+        np.asarray(membership), return_inverse=True, return_counts=True
+    )
+    best = np.zeros((len(runs), len(labels)))
+    for i, run in enumerate(runs):
+        run_labels, run_codes, run_sizes = np.unique(
+            np.asarray(run), return_inverse=True, return_counts=True
+        )
+        # cells shared by each pair of clusters; tocsr() adds them up
+        overlap = scipy.sparse.coo_matrix(
+            (np.ones(len(codes)), (codes, run_codes)),
+            shape=(len(labels), len(run_labels)),
+        ).tocsr()
+        rows = np.repeat(np.arange(len(labels)), np.diff(overlap.indptr))
+        jaccard = overlap.data / (
+            sizes[rows] + run_sizes[overlap.indices] - overlap.data
+        )
+        np.maximum.at(best[i], rows, jaccard)
+
+    return pd.DataFrame(
+        {"cluster": labels, "size": sizes, "stability": best.mean(axis=0)}
+    )
+
+
+def label_clusters_consensus(
+    data_df: Optional[pd.DataFrame] = None,
+    resolution: float = 1.0,
+    n_seeds: int = 8,
+    method: str = "consensus",
+    n_jobs: Optional[int] = None,
+    partition_type: Optional[Type[MutableVertexPartition]] = None,
+    directed_graph: bool = False,
+    use_weights: bool = True,
+    n_iterations: int = -1,
+    graph: Optional[NeighborGraph] = None,
+    use_cache: bool = False,
+    cache: Optional[GraphCache] = None,
+    **kwargs,
+) -> ConsensusClusters:
+    """\
+    Run Leiden with `n_seeds` different seeds in parallel and combine the
+    results, reporting how stable each cluster is across them.
+
+    A single Leiden run depends on its seed.  Here the graph's edges are
+    placed in shared memory once, each worker process builds its igraph
+    graph from them when it starts, and the seeded partitions are found
+    concurrently.  With `method="best"` the partition of highest
+    quality is kept.  With `method="consensus"` every edge of the neighbor
+    graph is reweighted by the fraction of runs placing its two cells in the
+    same cluster, a co-association matrix restricted to the graph's edges,
+    and that graph is partitioned once more, starting from the best run.
+
+    Parameters
+    ----------
+    data_df:
+        :class:`pandas.DataFrame`
+    resolution
+        float
+        default = 1.0
+    n_seeds
+        int
+        default = 8.  The seeds used are 0 to `n_seeds` - 1, so the first
+        run is the one :func:`label_clusters` does.
+    method
+        str
+        default = "consensus".  One of `CONSENSUS_METHODS`.
+    n_jobs
+        Optional[int]
+        default = None, one process per seed up to the number of CPUs.  With
+        `n_jobs=1` the partitions are found in the calling process.
+    partition_type, directed_graph, use_weights, n_iterations, graph,
+    use_cache, cache
+        as for :func:`label_clusters`
+    **kwargs
+        Parameters for :func:`~mcr.neighbors.build_neighbor_graph` (e.g.
+        `n_neighbors`); anything else is passed to :func:`leidenalg.find_partition`.
+
+    Returns
+    -------
+    :class:`ConsensusClusters`
+    """
+    if method not in CONSENSUS_METHODS:
+        raise ValueError(
+            f"method must be one of {CONSENSUS_METHODS}, not {method}"
+        )
+
+    neighbor_kwargs = {
+        k: kwargs.pop(k) for k in list(kwargs) if k in _NEIGHBOR_PARAMETERS
+    }
+    graph = attach_shared(graph)
+    if graph is None:
+        if cache is None and use_cache:
+            cache = get_graph_cache()
+        graph = build_neighbor_graph(
+            data_df,
+            cache=cache,
+            **neighbor_kwargs,
+        )
+
+    logging.critical("running graph_from_adjacency()")
+    with stage("graph_build", edges=graph.connectivities.nnz):
+        edges, weights = _edge_arrays(
+            graph.connectivities, directed=directed_graph
+        )
+        g = ig.Graph(
+            n=graph.connectivities.shape[0],
+            edges=edges,
+            directed=directed_graph,
+        )
+    if not use_weights:
+        weights = None
+
+    partition_kwargs = dict(
+        resolution=resolution,
+        partition_type=partition_type,
+        n_iterations=n_iterations,
+        **kwargs,
+    )
+
+    if n_jobs is None:
+        n_jobs = min(n_seeds, os.cpu_count() or 1)
+
+    with stage("partition_seeds", seeds=n_seeds, n_jobs=n_jobs):
+        if n_jobs == 1:
+            results = []
+            for seed in range(n_seeds):
+                partition = _leiden_partition(
+                    g, weights=weights, seed=seed, **partition_kwargs
+                )
+                results.append(
+                    (np.array(partition.membership), partition.quality())
+                )
+        else:
+            with _partition_pool(
+                n_jobs, g.vcount(), edges, weights, directed_graph
+            ) as executor:
+                results = list(
+                    executor.map(
+                        _seeded_partition,
+                        range(n_seeds),
+                        [partition_kwargs] * n_seeds,
+                    )
+                )
+    runs = [membership for membership, _ in results]
+    qualities = np.array([quality for _, quality in results])
+    best = runs[int(np.argmax(qualities))]
+    logging.critical(
+        f"partition qualities across {n_seeds} seeds range from "
+        f"{qualities.min():.4g} to {qualities.max():.4g}"
+    )
+
+    if method == "best":
+        membership = best
+    else:
+        with stage("consensus", seeds=n_seeds):
+            agreement = np.zeros(len(edges))
+            for run in runs:
+                agreement += run[edges[:, 0]] == run[edges[:, 1]]
+            agreement /= n_seeds
+            membership = _find_partition(
+                g,
+                weights=agreement if weights is None else weights * agreement,
+                initial_membership=best,
+                **partition_kwargs,
+            )
+
+    return ConsensusClusters(
+        membership=membership,
+        stability=cluster_stability(membership, runs),
+        qualities=qualities,
+    )
+
+
+class ResolutionProfile(NamedTuple):
+    """\
+    The distinct partitions found by :func:`scan_resolution_profile`.
+
+    table
+        :class:`pandas.DataFrame` with one row per partition: the
+        `resolution` range over which it is optimal (up to `resolution_end`),
+        its number of clusters, its quality, and the `column` of
+        `memberships` that holds it
+    memberships
+        :class:`pandas.DataFrame` with one column of cluster identities per
+        partition
+    """
+
+    table: pd.DataFrame
+    memberships: pd.DataFrame
+
+    def membership_at(self, resolution: float) -> np.ndarray:
+        """\
+        The partition found for `resolution`, without running Leiden again.
+        """
+        below = self.table[self.table["resolution"] <= resolution]
+        row = below.iloc[-1] if len(below) else self.table.iloc[0]
+        return self.memberships[row["column"]].to_numpy()
+
+
+def scan_resolution_profile(
+    data_df: Optional[pd.DataFrame] = None,
+    resolution_range: Tuple[float, float] = (0.05, 3.0),
+    partition_type: Optional[Type[MutableVertexPartition]] = None,
+    directed_graph: bool = False,
+    use_weights: bool = True,
+    n_iterations: int = -1,
+    min_diff_resolution: float = 1e-3,
+    linear_bisection: bool = False,
+    graph: Optional[NeighborGraph] = None,
+    use_cache: bool = False,
+    cache: Optional[GraphCache] = None,
+    partition_cache: Optional[PartitionCache] = None,
+    **kwargs,
+) -> ResolutionProfile:
+    """\
+    Find every distinct partition across `resolution_range` with as few
+    Leiden runs as possible, using
+    :meth:`leidenalg.Optimiser.resolution_profile`.
+
+    The range is bisected, and an interval is only split further while the
+    partitions at its two ends differ, so the number of runs grows with the
+    number of distinct partitions rather than with how finely the range is
+    searched.  The partitions are also added to the partition cache, so that
+    :func:`label_clusters` with `warm_start` at any resolution in the range
+    starts from the nearest of them.
+
+    Parameters
+    ----------
+    data_df
+        Optional[:class:`pandas.DataFrame`]
+    resolution_range
+        Tuple[float, float]
+        default = (0.05, 3.0)
+    partition_type
+        Optional[:class:`leidenalg.VertexPartition.MutableVertexPartition`]
+        default = la.RBConfigurationVertexPartition.  Must be a type whose
+        quality is linear in the resolution, such as
+        :class:`leidenalg.CPMVertexPartition`.
+    directed_graph
+        bool
+        default = False
+    use_weights
+        bool
+        default = True
+    n_iterations
+        int
+        default = -1, optimize each partition until it is stable
+    min_diff_resolution
+        float
+        default = 0.001.  Intervals narrower than this are not split.
+    linear_bisection
+        bool
+        default = False, bisect on a logarithmic scale
+    graph
+        Optional[:class:`~mcr.neighbors.NeighborGraph`]
+        default = None
+    use_cache, cache
+        as for :func:`label_clusters`
+    partition_cache
+        Optional[PartitionCache]
+        default = None, meaning the cache from :func:`get_partition_cache`
+    kwargs
+        neighbor graph parameters, as for :func:`label_clusters`
+
+    Returns
+    -------
+    :class:`ResolutionProfile`
+    """
+    partition_type = partition_type or la.RBConfigurationVertexPartition
+    if partition_type not in (
+        la.RBConfigurationVertexPartition,
+        la.CPMVertexPartition,
+    ):
+        raise ValueError(
+            f"{partition_type.__name__} does not have a linear resolution "
+            f"parameter, which a resolution profile requires"
+        )
+
+    graph = attach_shared(graph)
+    if graph is None:
+        if cache is None and use_cache:
+            cache = get_graph_cache()
+        graph = build_neighbor_graph(
+            data_df,
+            cache=cache,
+            **kwargs,
+        )
+
+    logging.critical("running graph_from_adjacency()")
+    with stage("graph_build", edges=graph.connectivities.nnz):
+        g, weights = graph_from_adjacency(
+            graph.connectivities, directed=directed_graph
+        )
+
+    logging.critical(
+        f"scanning resolutions from {resolution_range[0]} to "
+        f"{resolution_range[1]}"
+    )
+    optimiser = la.Optimiser()
+    optimiser.set_rng_seed(0)
+    with stage("resolution_profile", resolution_range=list(resolution_range)):
+        partitions = optimiser.resolution_profile(
+            g,
+            partition_type,
+            resolution_range=resolution_range,
+            weights=weights if use_weights else None,
+            min_diff_resolution=min_diff_resolution,
+            linear_bisection=linear_bisection,
+            number_iterations=n_iterations,
+        )
+
+    partition_cache = partition_cache or get_partition_cache()
+    partition_key = _partition_key(
+        graph, partition_type, directed_graph, use_weights
+    )
+    # each partition is optimal from its resolution up to the next one's
+    ends = [p.resolution_parameter for p in partitions[1:]]
+    ends.append(resolution_range[1])
+
+    rows = []
+    memberships = {}
+    for partition, end in zip(partitions, ends):
+        resolution = partition.resolution_parameter
+        column = f"res_{resolution:.6g}"
+        membership = np.array(partition.membership)
+        memberships[column] = membership
+        partition_cache.put(partition_key, resolution, membership)
+        rows.append(
+            {
+                "resolution": resolution,
+                "resolution_end": end,
+                "n_clusters": len(partition),
+                "quality": partition.quality(),
+                "column": column,
+            }
+        )
+    logging.critical(f"found {len(rows)} distinct partitions")
+    return ResolutionProfile(
+        table=pd.DataFrame(rows), memberships=pd.DataFrame(memberships)
+    )
@@ -1,687 +1,1032 @@
-from typing import Dict, List, Optional, Tuple
+from typing import Optional, Tuple
 
 import base64
-import io
 import logging
-from pathlib import Path
-from tempfile import TemporaryDirectory
+import os
+import uuid
 
 import click
-from dash import dcc, Dash, html, dash_table
 import dash_bootstrap_components as dbc
 import dash_daq as daq
-import dash_extensions as dex
 import numpy as np
-import pandas as pd
 import plotly.graph_objs as go
+from dash import Dash, callback_context, dash_table, dcc, html, no_update
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
-from dash_extensions.snippets import send_file
-from mcr.clustering import label_clusters
-from mcr.reduction import perform_reducion
+from mcr import jit
+from mcr.downloads import register_download_routes
+from mcr.jobs import SUMMARY_SUFFIX, JobManager
+from mcr.paging import PAGE_SIZE, page
+from mcr.raster import MAX_POINTS, axis_ranges, in_view, rasterize
+from mcr.store import SessionStore
+from mcr.uploads import (
+    import_file,
+    register_upload_routes,
+    resolve_data_path,
+    save_upload,
+)
 from plotly.express.colors import named_colorscales
 
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 colorscales = named_colorscales()
 
-cytometry_df = None
-rd_df = None
-cluster_df = None
-columns = []
-
-app = Dash(__name__, external_stylesheets=external_stylesheets)
-app.config.suppress_callback_exceptions = True
-app.layout = html.Div(
-    children=[
-        dcc.Tabs(
-            id="main-tabs",
-            value="tab-upload",
-            children=[
-                dcc.Tab(
-                    label="Upload data",
-                    value="tab-upload",
-                    children=(
-                        [
-                            dcc.Upload(
-                                id="upload-data",
-                                children=html.Div(
-                                    [
-                                        "Drag and Drop or ",
-                                        html.A("Select Files"),
-                                    ]
-                                ),
-                                style={
-                                    "width": "100%",
-                                    "height": "60px",
-                                    "lineHeight": "60px",
-                                    "borderWidth": "1px",
-                                    "borderStyle": "dashed",
-                                    "borderRadius": "5px",
-                                    "textAlign": "center",
-                                    "margin": "10px",
-                                },
-                                # Allow multiple files to be uploaded
-                                multiple=False,
-                            ),
-                            html.Hr(),
-                            dcc.Loading(
-                                id="upload-data-loading",
-                                children=html.Div(id="output-data-upload"),
-                                type="default",
+# uploaded data, embeddings, and clusters live on disk, one directory per
+# browser session, and callbacks look them up by the session id in the layout
+DATA = "data"
+REDUCTION = "reduction"
+CLUSTERS = "clusters"
+# every distinct partition found by a resolution scan, one column each
+RESOLUTIONS = "resolution-profile"
+
+# reductions and clusterings run in worker processes, off the request thread;
+# the layout polls for their progress
+JOB_COLUMNS = ["job", "kind", "status", "elapsed", "parameters", "error"]
+PROFILE_COLUMNS = ["stage", "wall_seconds", "cpu_seconds", "peak_rss_mb"]
+RESOLUTION_COLUMNS = ["resolution", "resolution_end", "n_clusters", "quality"]
+
+
+def serve_layout():
+    # called on every page load, so each browser tab gets its own session
+    session_id = uuid.uuid4().hex
+    return html.Div(
+        children=[
+            dcc.Store(id="session-id", data=session_id),
+            # the same id, readable by the chunked upload script
+            html.Div(
+                id="session-id-div",
+                style={"display": "none"},
+                **{"data-session": session_id},
+            ),
+            build_main_tabs(),
+            html.Div(id="main-tabs-content"),
+        ]
+    )
+
+
+def build_main_tabs():
+    return dcc.Tabs(
+        id="main-tabs",
+        value="tab-upload",
+        children=[
+            dcc.Tab(
+                label="Upload data",
+                value="tab-upload",
+                children=(
+                    [
+                        dcc.Upload(
+                            id="upload-data",
+                            children=html.Div(
+                                [
+                                    "Drag and Drop or ",
+                                    html.A("Select Files"),
+                                ]
                             ),
-                        ]
-                    ),
+                            style={
+                                "width": "100%",
+                                "height": "60px",
+                                "lineHeight": "60px",
+                                "borderWidth": "1px",
+                                "borderStyle": "dashed",
+                                "borderRadius": "5px",
+                                "textAlign": "center",
+                                "margin": "10px",
+                            },
+                            # Allow multiple files to be uploaded
+                            multiple=False,
+                        ),
+                        html.B("Large files, or a file on the server:"),
+                        html.Div(
+                            [
+                                # sent in chunks by assets/chunked_upload.js
+                                html.Input(
+                                    id="chunked-upload-file",
+                                    type="file",
+                                ),
+                                html.Span(id="chunked-upload-progress"),
+                            ]
+                        ),
+                        dcc.Input(
+                            id="data-path",
+                            type="text",
+                            placeholder="Path of a data file on the server",
+                            style={"width": "60%"},
+                        ),
+                        dbc.Button(
+                            "Load",
+                            id="load-path-btn",
+                            className="mr-2",
+                        ),
+                        html.Hr(),
+                        dcc.Loading(
+                            id="upload-data-loading",
+                            children=html.Div(id="output-data-upload"),
+                            type="default",
+                        ),
+                    ]
                 ),
-                dcc.Tab(
-                    label="Reduce and Cluster",
-                    value="tab-reduce",
-                    children=(
-                        [
-                            # hidden signal values to deal with multiple sources
-                            # trying to update the possible graph colors
-                            dcc.Store(id="color-store-import"),
-                            dcc.Store(id="color-store-cluster"),
-                            dcc.Store(id="colorscale-store"),
-                            html.Div(
-                                className="four columns div-for-charts bg-grey",
-                                children=[
-                                    html.B(
-                                        "Choose dimensional reduction method:"
-                                    ),
-                                    dcc.Dropdown(
-                                        id="reduce-alg",
-                                        options=[
-                                            {"label": "UMAP", "value": "umap"},
-                                            {"label": "tSNE", "value": "tsne"},
-                                            {
-                                                "label": "PaCMAP",
-                                                "value": "pacmap",
-                                            },
-                                            {
-                                                "label": "openTSNE",
-                                                "value": "opentsne",
-                                            },
-                                            {
-                                                "label": "optSNE",
-                                                "value": "optsne",
-                                            },
-                                        ],
-                                    ),
-                                    html.B(
-                                        "(Optional) Choose columns to ignore:"
-                                    ),
-                                    dcc.Dropdown(
-                                        id="reduce-columns",
-                                        options=[
-                                            {"label": "None", "value": "None"}
-                                        ],
-                                        value=[
-                                            "Object Id",
-                                            "XMin",
-                                            "XMax",
-                                            "YMin",
-                                            "YMax",
-                                            "Cell Area (µm²)",
-                                            "Cytoplasm Area (µm²)",
-                                            "Membrane Area (µm²)",
-                                            "Nucleus Area (µm²)",
-                                            "Nucleus Perimeter (µm)",
-                                            "Nucleus Roundness",
-                                        ],
-                                        multi=True,
-                                    ),
-                                    dbc.Button(
-                                        "Perform reduction",
-                                        id="reduce-submit",
-                                        className="mr-2",
-                                    ),
-                                    dcc.Loading(
-                                        id="reduce-loading",
-                                        type="default",
-                                        children=html.Div(
-                                            id="hidden-div",
-                                            style={"display": "none"},
-                                        ),
-                                    ),
-                                    html.Span(
-                                        id="reduction-complete",
-                                        style={"vertical-align": "middle"},
-                                    ),
-                                    dbc.Button(
-                                        "Graph data",
-                                        id="reduce-graph",
-                                        className="mr-2",
-                                    ),
-                                    html.Hr(),
-                                    dbc.Button(
-                                        "Label clusters",
-                                        id="cluster-data-btn",
-                                        className="mr-1",
-                                    ),
-                                    html.Div(
-                                        "Clustering resolution",
-                                        id="hidden-div2",
-                                        style={
-                                            "width": "100%",
-                                            "display": "inline-block",
+            ),
+            dcc.Tab(
+                label="Reduce and Cluster",
+                value="tab-reduce",
+                children=(
+                    [
+                        # hidden signal values to deal with multiple sources
+                        # trying to update the possible graph colors
+                        dcc.Store(id="color-store-import"),
+                        dcc.Store(id="color-store-cluster"),
+                        dcc.Store(id="color-store-resolution"),
+                        dcc.Store(id="colorscale-store"),
+                        # ids of this session's most recent background jobs
+                        dcc.Store(id="reduce-job"),
+                        dcc.Store(id="cluster-job"),
+                        dcc.Store(id="resolution-job"),
+                        dcc.Interval(id="job-poll", interval=1000),
+                        html.Div(
+                            className="four columns div-for-charts bg-grey",
+                            children=[
+                                html.B(
+                                    "Choose dimensional reduction method:"
+                                ),
+                                dcc.Dropdown(
+                                    id="reduce-alg",
+                                    options=[
+                                        {"label": "UMAP", "value": "umap"},
+                                        {"label": "tSNE", "value": "tsne"},
+                                        {
+                                            "label": "PaCMAP",
+                                            "value": "pacmap",
                                         },
-                                    ),
-                                    dcc.Slider(
-                                        id="cluster-resolution-sldr",
-                                        min=0.1,
-                                        max=3.0,
-                                        value=0.6,
-                                        step=0.1,
-                                        marks={
-                                            0.2: {"label": "0.2"},
-                                            0.4: {"label": "0.4"},
-                                            0.6: {
-                                                "label": "0.6",
-                                                "style": {"color": "#f50"},
-                                            },
-                                            0.8: {"label": "0.8"},
-                                            1: {"label": "1.0"},
-                                            1.2: {"label": "1.2"},
-                                            1.4: {"label": "1.4"},
-                                            1.6: {"label": "1.6"},
-                                            1.8: {"label": "1.8"},
-                                            2: {"label": "2.0"},
-                                            2.2: {"label": "2.2"},
-                                            2.4: {"label": "2.4"},
-                                            2.6: {"label": "2.6"},
-                                            2.8: {"label": "2.8"},
-                                            3: {"label": "3.0"},
+                                        {
+                                            "label": "openTSNE",
+                                            "value": "opentsne",
                                         },
-                                    ),
-                                    html.Div(
-                                        "N-nearest neighbors",
-                                        id="hidden-div3",
-                                        style={
-                                            "width": "100%",
-                                            "display": "inline-block",
+                                        {
+                                            "label": "optSNE",
+                                            "value": "optsne",
                                         },
+                                    ],
+                                ),
+                                html.B(
+                                    "(Optional) Choose columns to ignore:"
+                                ),
+                                dcc.Dropdown(
+                                    id="reduce-columns",
+                                    options=[
+                                        {"label": "None", "value": "None"}
+                                    ],
+                                    value=[
+                                        "Object Id",
+                                        "XMin",
+                                        "XMax",
+                                        "YMin",
+                                        "YMax",
+                                        "Cell Area (µm²)",
+                                        "Cytoplasm Area (µm²)",
+                                        "Membrane Area (µm²)",
+                                        "Nucleus Area (µm²)",
+                                        "Nucleus Perimeter (µm)",
+                                        "Nucleus Roundness",
+                                    ],
+                                    multi=True,
+                                ),
+                                dbc.Button(
+                                    "Perform reduction",
+                                    id="reduce-submit",
+                                    className="mr-2",
+                                ),
+                                dcc.Loading(
+                                    id="reduce-loading",
+                                    type="default",
+                                    children=html.Div(
+                                        id="hidden-div",
+                                        style={"display": "none"},
                                     ),
-                                    dcc.Slider(
-                                        id="cluster-n-neighbors-sldr",
-                                        min=1,
-                                        max=100,
-                                        value=30,
-                                        step=1,
-                                        marks={
-                                            10: {"label": "10"},
-                                            20: {"label": "20"},
-                                            30: {
-                                                "label": "30",
-                                                "style": {"color": "#f50"},
-                                            },
-                                            40: {"label": "40"},
-                                            50: {"label": "50"},
-                                            60: {"label": "60"},
-                                            70: {"label": "70"},
-                                            80: {"label": "80"},
-                                            90: {"label": "90"},
-                                            100: {"label": "100"},
+                                ),
+                                html.Span(
+                                    id="reduction-complete",
+                                    style={"vertical-align": "middle"},
+                                ),
+                                dbc.Button(
+                                    "Graph data",
+                                    id="reduce-graph",
+                                    className="mr-2",
+                                ),
+                                html.Hr(),
+                                dbc.Button(
+                                    "Label clusters",
+                                    id="cluster-data-btn",
+                                    className="mr-1",
+                                ),
+                                html.Div(
+                                    "Clustering resolution",
+                                    id="hidden-div2",
+                                    style={
+                                        "width": "100%",
+                                        "display": "inline-block",
+                                    },
+                                ),
+                                dcc.Slider(
+                                    id="cluster-resolution-sldr",
+                                    min=0.1,
+                                    max=3.0,
+                                    value=0.6,
+                                    step=0.1,
+                                    marks={
+                                        0.2: {"label": "0.2"},
+                                        0.4: {"label": "0.4"},
+                                        0.6: {
+                                            "label": "0.6",
+                                            "style": {"color": "#f50"},
                                         },
-                                    ),
-                                    dcc.Loading(
-                                        id="cluster-loading",
-                                        type="default",
-                                        children=html.Div(
-                                            id="hidden-clustering-div",
-                                            style={"display": "none"},
-                                        ),
-                                    ),
-                                    html.Hr(),
-                                    daq.BooleanSwitch(
-                                        id="reduce-append",
-                                        on=False,
-                                        color="#AA0000",
-                                        label="Append to data?",
-                                        labelPosition="top",
-                                        style={
-                                            "height": "50%",
-                                            "display": "inline-block",
+                                        0.8: {"label": "0.8"},
+                                        1: {"label": "1.0"},
+                                        1.2: {"label": "1.2"},
+                                        1.4: {"label": "1.4"},
+                                        1.6: {"label": "1.6"},
+                                        1.8: {"label": "1.8"},
+                                        2: {"label": "2.0"},
+                                        2.2: {"label": "2.2"},
+                                        2.4: {"label": "2.4"},
+                                        2.6: {"label": "2.6"},
+                                        2.8: {"label": "2.8"},
+                                        3: {"label": "3.0"},
+                                    },
+                                ),
+                                html.Div(
+                                    "N-nearest neighbors",
+                                    id="hidden-div3",
+                                    style={
+                                        "width": "100%",
+                                        "display": "inline-block",
+                                    },
+                                ),
+                                dcc.Slider(
+                                    id="cluster-n-neighbors-sldr",
+                                    min=1,
+                                    max=100,
+                                    value=30,
+                                    step=1,
+                                    marks={
+                                        10: {"label": "10"},
+                                        20: {"label": "20"},
+                                        30: {
+                                            "label": "30",
+                                            "style": {"color": "#f50"},
                                         },
+                                        40: {"label": "40"},
+                                        50: {"label": "50"},
+                                        60: {"label": "60"},
+                                        70: {"label": "70"},
+                                        80: {"label": "80"},
+                                        90: {"label": "90"},
+                                        100: {"label": "100"},
+                                    },
+                                ),
+                                dcc.Loading(
+                                    id="cluster-loading",
+                                    type="default",
+                                    children=html.Div(
+                                        id="hidden-clustering-div",
+                                        style={"display": "none"},
                                     ),
+                                ),
+                                dbc.Button(
+                                    "Scan resolutions",
+                                    id="resolution-scan-btn",
+                                    className="mr-1",
+                                ),
+                                # pick a row to color by that partition
+                                dash_table.DataTable(
+                                    id="resolution-table",
+                                    columns=[
+                                        {"name": i, "id": i}
+                                        for i in RESOLUTION_COLUMNS
+                                    ],
+                                    data=[],
+                                    row_selectable="single",
+                                    selected_rows=[],
+                                ),
+                                html.Hr(),
+                                daq.BooleanSwitch(
+                                    id="reduce-append",
+                                    on=False,
+                                    color="#AA0000",
+                                    label="Append to data?",
+                                    labelPosition="top",
+                                    style={
+                                        "height": "50%",
+                                        "display": "inline-block",
+                                    },
+                                ),
+                                dcc.RadioItems(
+                                    id="download-format",
+                                    options=[
+                                        {"label": "CSV", "value": "csv"},
+                                        {
+                                            "label": "Parquet",
+                                            "value": "parquet",
+                                        },
+                                    ],
+                                    value="csv",
+                                    inline=True,
+                                ),
+                                # streamed by the route in mcr.downloads
+                                html.A(
                                     dbc.Button(
                                         "Download data",
                                         id="reduce-data-btn",
                                         className="mr-2",
                                     ),
-                                    dex.Download(
-                                        id="reduce-download-link",
-                                    ),
-                                    # dcc.Dropdown(
-                                    #     id="
-                                    # )
-                                ],
-                            ),
-                            html.Div(
-                                className="eight columns div-for-charts bg-grey",
-                                children=[
-                                    html.Div(
-                                        id="hidden-div4",
-                                        style={
-                                            "height": "100%",
-                                            "display": "inline-block",
-                                        },
-                                    ),
-                                    dcc.Dropdown(
-                                        id="reduced-data-color",
-                                        options=[
-                                            {"label": "None", "value": "None"}
-                                        ],
-                                        value=None,
-                                        multi=False,
-                                    ),
-                                    dcc.Dropdown(
-                                        id="plot-colorscale",
-                                        options=[
-                                            {"value": x, "label": x}
-                                            for x in colorscales
-                                        ],
-                                        value="viridis",
-                                    ),
-                                    dcc.Graph(
-                                        id="reduced-data-plot",
-                                        config={"responsive": False},
-                                    ),
-                                ],
-                            ),
-                        ]
-                    ),
+                                    id="download-link",
+                                    href="",
+                                ),
+                                html.Hr(),
+                                html.B("Jobs"),
+                                dash_table.DataTable(
+                                    id="job-table",
+                                    columns=[
+                                        {"name": i, "id": i}
+                                        for i in JOB_COLUMNS
+                                    ],
+                                    data=[],
+                                    row_selectable="multi",
+                                    selected_rows=[],
+                                ),
+                                dbc.Button(
+                                    "Cancel selected jobs",
+                                    id="job-cancel-btn",
+                                    className="mr-2",
+                                ),
+                                html.Div(
+                                    id="job-cancel-div",
+                                    style={"display": "none"},
+                                ),
+                                html.B("Time spent by the last finished job"),
+                                dash_table.DataTable(
+                                    id="profile-table",
+                                    columns=[
+                                        {"name": i, "id": i}
+                                        for i in PROFILE_COLUMNS
+                                    ],
+                                    data=[],
+                                ),
+                                # dcc.Dropdown(
+                                #     id="
+                                # )
+                            ],
+                        ),
+                        html.Div(
+                            className="eight columns div-for-charts bg-grey",
+                            children=[
+                                html.Div(
+                                    id="hidden-div4",
+                                    style={
+                                        "height": "100%",
+                                        "display": "inline-block",
+                                    },
+                                ),
+                                dcc.Dropdown(
+                                    id="reduced-data-color",
+                                    options=[
+                                        {"label": "None", "value": "None"}
+                                    ],
+                                    value=None,
+                                    multi=False,
+                                ),
+                                dcc.Dropdown(
+                                    id="plot-colorscale",
+                                    options=[
+                                        {"value": x, "label": x}
+                                        for x in colorscales
+                                    ],
+                                    value="viridis",
+                                ),
+                                dcc.Graph(
+                                    id="reduced-data-plot",
+                                    config={"responsive": False},
+                                ),
+                            ],
+                        ),
+                    ]
                 ),
-            ],
+            ),
+        ],
+    )
+
+
+def create_app(session_dir: Optional[str] = None) -> Dash:
+    """\
+    Build the Dash app, with its session store, job manager, and callbacks,
+    so that importing this module creates none of them.
+
+    Parameters
+    ----------
+    session_dir
+        Optional[str]
+        default = None, which uses ``MCR_SESSION_DIR`` or a temporary
+        directory (see :class:`~mcr.store.SessionStore`)
+    """
+    store = SessionStore(root=session_dir or os.environ.get("MCR_SESSION_DIR"))
+    jobs = JobManager(store)
+
+    app = Dash(__name__, external_stylesheets=external_stylesheets)
+    app.config.suppress_callback_exceptions = True
+    app.layout = serve_layout
+    register_callbacks(app, store, jobs)
+    register_upload_routes(app.server, store)
+    register_download_routes(
+        app.server, store, data=DATA, results=(REDUCTION, CLUSTERS)
+    )
+    return app
+
+
+def preview_table(
+    store: SessionStore, table_id: str, session_id: str, name: str
+):
+    # only the first page is sent now; the rest is fetched by the paging
+    # callbacks as the user moves through the table
+    rows, page_count = page(store.get_table(session_id, name))
+    return dash_table.DataTable(
+        id=table_id,
+        data=rows,
+        columns=[{"name": i, "id": i} for i in store.columns(session_id, name)],
+        page_current=0,
+        page_size=PAGE_SIZE,
+        page_count=page_count,
+        page_action="custom",
+        sort_action="custom",
+        sort_mode="multi",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
+    )
+
+
+def _table_page(
+    store, name, session_id, page_current, page_size, sort_by, query
+):
+    table = store.get_table(session_id, name)
+    if table is None:
+        raise PreventUpdate
+    return page(table, page_current, page_size, sort_by, query)
+
+
+def load_data(store, path, session_id):
+    try:
+        n_rows = import_file(store, session_id, DATA, path)
+    except Exception as e:
+        logging.error(f"could not read {path}: {e}")
+        return (
+            html.Div(["There was an error processing this file."]),
+            no_update,
+        )
+
+    logging.critical(f"read {n_rows} rows from {path.name}")
+    # a new upload invalidates anything computed from the previous one
+    store.delete(session_id, REDUCTION)
+    store.delete(session_id, CLUSTERS)
+    return (
+        html.Div(
+            [
+                preview_table(store, "upload-table", session_id, DATA),
+            ]
         ),
-        html.Div(id="main-tabs-content"),
-    ]
-)
+        [{"label": i, "value": i} for i in store.columns(session_id, DATA)],
+    )
 
 
-def parse_contents(contents, filename):
-    global cytometry_df
+def parse_contents(store, contents, filename, session_id):
     if contents is None:
         raise PreventUpdate
 
     content_type, content_string = contents.split(",")
     logging.critical(f"{content_type}")
-    decoded = base64.b64decode(content_string)
-    try:
-        if "csv" in filename:
-            # Assume that the user uploaded a CSV file
-            try:
-                cytometry_df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-            except UnicodeDecodeError:
-                cytometry_df = pd.read_csv(io.StringIO(decoded.decode("latin")))
-            logging.critical(f"{cytometry_df.columns[0]}")
-        elif "xls" in filename or "xlsx" in filename:
-            # Assume that the user uploaded an excel file
-            cytometry_df = pd.read_excel(io.BytesIO(decoded))
-    except Exception as e:
-        print(e)
-        return html.Div(["There was an error processing this file."])
-
-    if cytometry_df is not None:
+    # written to disk and read back like any other file, rather than parsed
+    # from yet another in-memory copy
+    path = save_upload(
+        store, session_id, filename, base64.b64decode(content_string)
+    )
+    if path is None:
         return (
-            html.Div(
-                [
-                    dash_table.DataTable(
-                        data=cytometry_df.to_dict("records"),
-                        columns=[
-                            {"name": i, "id": i} for i in cytometry_df.columns
-                        ],
-                    ),
-                ]
+            html.Div([f"{filename} is not a supported file type."]),
+            no_update,
+        )
+    return load_data(store, path, session_id)
+
+
+def _plot_traces(x, y, color_data, colorscale, categorical, x_range, y_range):
+    # draw the points themselves when few enough are in view, and otherwise
+    # a raster of them binned on the server
+    visible = in_view(x, y, x_range, y_range)
+    if visible.sum() <= MAX_POINTS:
+        return go.Scattergl(
+            x=x[visible],
+            y=y[visible],
+            type="scattergl",
+            mode="markers",
+            marker=dict(
+                colorscale=colorscale,
+                color=None if color_data is None else color_data[visible],
+                showscale=color_data is not None,
             ),
-            [{"label": i, "value": i} for i in cytometry_df.columns],
         )
-    else:
-        return None
-
-
-@app.callback(
-    [
-        Output("output-data-upload", "children"),
-        Output("reduce-columns", "options"),
-        Output("color-store-import", "data"),
-    ],
-    [
-        Input("upload-data", "contents"),
-    ],
-    State("upload-data", "filename"),
-)
-def import_data(list_of_contents, list_of_names):
-    if list_of_contents is None:
-        logging.critical("contents are null")
-        return None, None, None
-    if list_of_contents is not None:
-        logging.critical(f"names: {list_of_names}, type: {type(list_of_names)}")
-        children = parse_contents(list_of_contents, list_of_names)
-        logging.critical(f"{children[1]}")
-        return children[0], children[1], children[1]
-    else:
-        logging.error("Oh, damn, we fucked up.")
-        return None, None, None
 
+    logging.critical(f"rasterizing {visible.sum()} points")
+    raster = rasterize(
+        x,
+        y,
+        values=color_data,
+        x_range=x_range,
+        y_range=y_range,
+        categorical=categorical,
+    )
+    image = raster.image if color_data is not None else np.log1p(raster.image)
+    return go.Heatmap(
+        x=raster.x,
+        y=raster.y,
+        z=image,
+        colorscale=colorscale,
+        showscale=True,
+        hoverongaps=False,
+        customdata=raster.counts,
+        hovertemplate="x: %{x:.2f}<br>y: %{y:.2f}<br>"
+        "cells: %{customdata}<br>value: %{z:.2f}<extra></extra>",
+    )
 
-@app.callback(
-    Output("reduced-data-color", "options"),
-    [Input("color-store-import", "data"), Input("color-store-cluster", "data")],
-    State("reduced-data-color", "options"),
-)
-def update_graph_color_options(
-    import_vars=None, cluster_vars=None, extant_vars=None
-):
 
-    if extant_vars is None:
-        extant_vars = list()
-    if import_vars is not None:
-        extant_vars.extend(x for x in import_vars if x not in extant_vars)
-    if cluster_vars is not None:
-        extant_vars.extend(x for x in cluster_vars if x not in extant_vars)
+def register_callbacks(
+    app: Dash, store: SessionStore, jobs: JobManager
+) -> None:
+    """\
+    Register the GUI's callbacks with `app`, looking data up in `store` and
+    running reductions and clusterings through `jobs`.
+    """
 
-    return extant_vars
+    @app.callback(
+        [Output("upload-table", "data"), Output("upload-table", "page_count")],
+        [
+            Input("upload-table", "page_current"),
+            Input("upload-table", "page_size"),
+            Input("upload-table", "sort_by"),
+            Input("upload-table", "filter_query"),
+        ],
+        State("session-id", "data"),
+    )
+    def page_upload_table(page_current, page_size, sort_by, query, session_id):
+        return _table_page(
+            store, DATA, session_id, page_current, page_size, sort_by, query
+        )
 
+    @app.callback(
+        [
+            Output("reduction-table", "data"),
+            Output("reduction-table", "page_count"),
+        ],
+        [
+            Input("reduction-table", "page_current"),
+            Input("reduction-table", "page_size"),
+            Input("reduction-table", "sort_by"),
+            Input("reduction-table", "filter_query"),
+        ],
+        State("session-id", "data"),
+    )
+    def page_reduction_table(
+        page_current, page_size, sort_by, query, session_id
+    ):
+        return _table_page(
+            store,
+            REDUCTION,
+            session_id,
+            page_current,
+            page_size,
+            sort_by,
+            query,
+        )
 
-@app.callback(
-    Output("hidden-div", "children"),
-    [
-        Input("reduce-submit", "n_clicks"),
-    ],
-    State("reduce-alg", "value"),
-    State("reduce-append", "on"),
-    State("reduce-columns", "value"),
-)
-def reduce_data(btn, alg, append, ignore_columns=None):
-    global cytometry_df
-    global rd_df
-
-    if ignore_columns is None:
-        ignore_columns = ()
-    if type(ignore_columns) is str:
-        ignore_columns = tuple(ignore_columns)
-
-    logging.critical(f"{btn}")
-    logging.critical(f"{alg}")
-    logging.critical(f"{append}")
-    if btn is not None:
-        if cytometry_df is not None:
-            logging.critical(f"performing {alg}")
-            logging.critical(f"ignoring {ignore_columns}")
-            df = perform_reducion(
-                cytometry_df.iloc[
-                    :, ~cytometry_df.columns.isin(ignore_columns)
-                ],
-                reduction=alg,
-            )
-            logging.critical(f"finished {alg}")
-            if append and rd_df is not None:
-                logging.critical("appending data")
-                rd_df = pd.concat([rd_df.reset_index(drop=True), df], axis=1)
-            else:
-                logging.critical("append was False")
-                rd_df = df
+    @app.callback(
+        [
+            Output("output-data-upload", "children"),
+            Output("reduce-columns", "options"),
+            Output("color-store-import", "data"),
+        ],
+        [
+            Input("upload-data", "contents"),
+            Input("load-path-btn", "n_clicks"),
+        ],
+        State("upload-data", "filename"),
+        State("data-path", "value"),
+        State("session-id", "data"),
+    )
+    def import_data(
+        list_of_contents, btn, list_of_names, data_path, session_id
+    ):
+        triggered = [t["prop_id"] for t in callback_context.triggered]
+        if "load-path-btn.n_clicks" in triggered:
+            if not data_path:
+                raise PreventUpdate
+            try:
+                path = resolve_data_path(store, session_id, data_path)
+            except ValueError as e:
+                return html.Div([str(e)]), no_update, no_update
+            children = load_data(store, path, session_id)
+        elif list_of_contents is not None:
             logging.critical(
-                f"sanitiy check: {alg} data has {rd_df.shape[1]} columns"
+                f"names: {list_of_names}, type: {type(list_of_names)}"
             )
-            logging.critical("returning data")
-            return html.Div(
-                [
-                    dash_table.DataTable(
-                        data=rd_df.to_dict("records"),
-                        columns=[{"name": i, "id": i} for i in rd_df.columns],
-                    ),
-                ]
+            children = parse_contents(
+                store, list_of_contents, list_of_names, session_id
             )
         else:
-            dbc.Modal(
-                [
-                    dbc.ModalHeader("No data!"),
-                    dbc.ModalBody(
-                        f"Please load cytometry data before attempting to performing {alg}."
-                    ),
-                    dbc.ModalFooter(
-                        dbc.Button(
-                            "Close",
-                            id="no-data-to-reduce-modal-close",
-                            className="ml-auto",
-                        )
-                    ),
-                ],
-                id="no-data-to-reduce-modal",
+            logging.critical("contents are null")
+            return None, None, None
+
+        logging.critical(f"{children[1]}")
+        return children[0], children[1], children[1]
+
+    @app.callback(
+        Output("reduced-data-color", "options"),
+        [
+            Input("color-store-import", "data"),
+            Input("color-store-cluster", "data"),
+            Input("color-store-resolution", "data"),
+        ],
+        State("reduced-data-color", "options"),
+    )
+    def update_graph_color_options(
+        import_vars=None,
+        cluster_vars=None,
+        resolution_vars=None,
+        extant_vars=None,
+    ):
+
+        if extant_vars is None:
+            extant_vars = list()
+        if import_vars is not None:
+            extant_vars.extend(x for x in import_vars if x not in extant_vars)
+        if cluster_vars is not None:
+            extant_vars.extend(x for x in cluster_vars if x not in extant_vars)
+        if resolution_vars is not None:
+            extant_vars.extend(
+                x for x in resolution_vars if x not in extant_vars
             )
-            return None
-    else:
-        return None
 
+        return extant_vars
 
-@app.callback(
-    Output("reduce-download-link", "data"),
-    [Input("reduce-data-btn", "n_clicks")],
-    State("reduce-append", "on"),
-)
-def func(n_clicks, append_to_input=False):
-    temp_path = TemporaryDirectory()
-    filename = Path(temp_path.name, "reduced_data.csv")
-    logging.critical(f"saving csv at {filename}")
-
-    if append_to_input:
-        if rd_df is not None:
-            if cluster_df is not None:
-                output_df = pd.concat(
-                    objs=[
-                        cytometry_df.reset_index(drop=True),
-                        rd_df.reset_index(drop=True),
-                        cluster_df.reset_index(drop=True),
-                    ],
-                    axis=1,
-                )
-            else:
-                output_df = pd.concat(
-                    objs=[
-                        cytometry_df.reset_index(drop=True),
-                        rd_df.reset_index(drop=True),
-                    ],
-                    axis=1,
-                )
-        else:
-            if cluster_df is not None:
-                output_df = pd.concat(
-                    objs=[
-                        cytometry_df.reset_index(drop=True),
-                        cluster_df.reset_index(drop=True),
-                    ],
-                    axis=1,
-                )
-            else:
-                output_df = pd.concat(
-                    objs=[
-                        cytometry_df.reset_index(drop=True),
-                    ],
-                    axis=1,
-                )
-    else:
-        if rd_df is not None:
-            if cluster_df is not None:
-                output_df = pd.concat(
-                    objs=[
-                        rd_df.reset_index(drop=True),
-                        cluster_df.reset_index(drop=True),
-                    ],
-                    axis=1,
+    @app.callback(
+        Output("reduce-job", "data"),
+        [
+            Input("reduce-submit", "n_clicks"),
+        ],
+        State("reduce-alg", "value"),
+        State("reduce-append", "on"),
+        State("reduce-columns", "value"),
+        State("session-id", "data"),
+    )
+    def reduce_data(btn, alg, append, ignore_columns=None, session_id=None):
+        if ignore_columns is None:
+            ignore_columns = ()
+        if type(ignore_columns) is str:
+            ignore_columns = tuple(ignore_columns)
+
+        logging.critical(f"{btn}")
+        logging.critical(f"{alg}")
+        logging.critical(f"{append}")
+        if btn is not None:
+            if store.has(session_id, DATA):
+                logging.critical(f"submitting {alg}")
+                logging.critical(f"ignoring {ignore_columns}")
+                use_columns = [
+                    x
+                    for x in store.columns(session_id, DATA)
+                    if x not in ignore_columns
+                ]
+                job = jobs.submit(
+                    "reduction",
+                    session_id,
+                    source=DATA,
+                    target=REDUCTION,
+                    columns=use_columns,
+                    replace=not append,
+                    reduction=alg,
                 )
+                return job.job_id
             else:
-                output_df = pd.concat(
-                    objs=[
-                        rd_df.reset_index(drop=True),
+                dbc.Modal(
+                    [
+                        dbc.ModalHeader("No data!"),
+                        dbc.ModalBody(
+                            f"Please load cytometry data before attempting to performing {alg}."
+                        ),
+                        dbc.ModalFooter(
+                            dbc.Button(
+                                "Close",
+                                id="no-data-to-reduce-modal-close",
+                                className="ml-auto",
+                            )
+                        ),
                     ],
-                    axis=1,
+                    id="no-data-to-reduce-modal",
                 )
+                return None
         else:
-            output_df = None
-            dbc.Modal(
-                [
-                    dbc.ModalHeader("No data!"),
-                    dbc.ModalBody("There's no data to return!"),
-                    dbc.ModalFooter(
-                        dbc.Button(
-                            "Close",
-                            id="no-data-to-return-modal-close",
-                            className="ml-auto",
-                        )
-                    ),
-                ],
-                id="no-data-to-return-modal",
+            return None
+
+    @app.callback(
+        [
+            Output("job-table", "data"),
+            Output("profile-table", "data"),
+            Output("hidden-div", "children"),
+            Output("color-store-cluster", "data"),
+            Output("hidden-clustering-div", "children"),
+            Output("resolution-table", "data"),
+        ],
+        Input("job-poll", "n_intervals"),
+        State("session-id", "data"),
+        State("reduce-job", "data"),
+        State("cluster-job", "data"),
+        State("resolution-job", "data"),
+    )
+    def poll_jobs(n_intervals, session_id, reduce_job, cluster_job, scan_job):
+        session_jobs = jobs.jobs(session_id)
+        job_records = [job.as_record() for job in session_jobs]
+        # the profile of the job that finished last, whenever it was submitted
+        latest = max(
+            (
+                job
+                for job in session_jobs
+                if job.profile is not None and job.finished is not None
+            ),
+            key=lambda job: job.finished,
+            default=None,
+        )
+        profile_records = [
+            {
+                "stage": "\u00a0\u00a0" * s["depth"] + s["name"],
+                "wall_seconds": round(s["wall_seconds"], 2),
+                "cpu_seconds": round(s["cpu_seconds"], 2),
+                "peak_rss_mb": s["peak_rss_mb"] and round(s["peak_rss_mb"]),
+            }
+            for s in (latest.profile["stages"] if latest else [])
+        ]
+        reduction_table = no_update
+        cluster_options = no_update
+        clustering_done = no_update
+        resolution_records = no_update
+
+        finished = jobs.collect(reduce_job)
+        if finished is not None and finished.status == "finished":
+            logging.critical(
+                f"sanitiy check: reduced data has "
+                f"{len(store.columns(session_id, REDUCTION))} columns"
+            )
+            reduction_table = html.Div(
+                [preview_table(store, "reduction-table", session_id, REDUCTION)]
             )
 
-    if output_df is not None:
-        output_df.to_csv(path_or_buf=filename, index=False)
-        return send_file(filename.absolute())
+        finished = jobs.collect(cluster_job)
+        if finished is not None and finished.status == "finished":
+            name = finished.parameters["cluster_name"]
+            cluster_options = [{"label": f"Cluster {name}", "value": name}]
+            clustering_done = True
 
+        finished = jobs.collect(scan_job)
+        if finished is not None and finished.status == "finished":
+            summary = store.get(session_id, RESOLUTIONS + SUMMARY_SUFFIX)
+            # kept with the rows, since the slider may have moved by the time
+            # one is picked
+            summary["n_neighbors"] = finished.parameters["n_neighbors"]
+            resolution_records = summary.round(4).to_dict("records")
 
-@app.callback(
-    Output("reduced-data-plot", "figure"),
-    [
-        Input("reduce-graph", "n_clicks"),
-        Input("reduced-data-color", "value"),
-        Input("plot-colorscale", "value"),
-    ],
-)
-def update_reduction_graph(btn, color, colorscale):
-    if btn is not None:
-        if color is None:
+        return (
+            job_records,
+            profile_records,
+            reduction_table,
+            cluster_options,
+            clustering_done,
+            resolution_records,
+        )
+
+    @app.callback(
+        Output("job-cancel-div", "children"),
+        Input("job-cancel-btn", "n_clicks"),
+        State("job-table", "data"),
+        State("job-table", "selected_rows"),
+    )
+    def cancel_jobs(btn, job_records, selected_rows):
+        if btn is None or not selected_rows:
+            raise PreventUpdate
+        cancelled = [
+            job_records[i]["job"]
+            for i in selected_rows
+            if i < len(job_records) and jobs.cancel(job_records[i]["job"])
+        ]
+        logging.critical(f"cancelled jobs {cancelled}")
+        return ", ".join(cancelled)
+
+    @app.callback(
+        Output("download-link", "href"),
+        Input("session-id", "data"),
+        Input("reduce-append", "on"),
+        Input("download-format", "value"),
+    )
+    def update_download_link(session_id, append_to_input=False, fmt="csv"):
+        append = int(bool(append_to_input))
+        return f"mcr-download/{session_id}?format={fmt}&append={append}"
+
+    @app.callback(
+        Output("reduced-data-plot", "figure"),
+        [
+            Input("reduce-graph", "n_clicks"),
+            Input("reduced-data-color", "value"),
+            Input("plot-colorscale", "value"),
+            Input("reduced-data-plot", "relayoutData"),
+        ],
+        State("session-id", "data"),
+    )
+    def update_reduction_graph(
+        btn, color, colorscale, relayout_data=None, session_id=None
+    ):
+        x_range, y_range = axis_ranges(relayout_data)
+        triggered = [t["prop_id"] for t in callback_context.triggered]
+        if triggered == ["reduced-data-plot.relayoutData"] and not any(
+            key.startswith(("xaxis.", "yaxis.")) for key in relayout_data or {}
+        ):
+            # e.g. a change of drag mode; the view is unchanged
+            raise PreventUpdate
+
+        if btn is not None and store.has(session_id, REDUCTION):
+            reduction_columns = store.columns(session_id, REDUCTION)
+            x = store.get_column(session_id, REDUCTION, reduction_columns[0])
+            y = store.get_column(session_id, REDUCTION, reduction_columns[1])
+            color_data = None
+            categorical = False
+            if color is not None:
+                logging.critical(f"{color} selected for color")
+                if color in store.columns(session_id, DATA):
+                    logging.critical(f"{color} is in the uploaded data")
+                    color_data = np.log(
+                        store.get_column(session_id, DATA, color) + 1
+                    )
+                elif color in store.columns(session_id, CLUSTERS):
+                    logging.critical(f"{color} is in the clusters")
+                    color_data = store.get_column(session_id, CLUSTERS, color)
+                    categorical = True
+
+            logging.critical("updating plot")
+            logging.critical(f"colorscale is {colorscale}")
+            layout = go.Layout(
+                height=750,
+                width=900,
+                autosize=False,
+                # keeps the zoom when the figure is replaced by a new raster
+                uirevision=f"{session_id}-{btn}",
+            )
+            if x_range is not None:
+                layout.xaxis.range = x_range
+            if y_range is not None:
+                layout.yaxis.range = y_range
             fig = go.Figure(
                 data=[
-                    go.Scattergl(
-                        x=rd_df.iloc[:, 0],
-                        y=rd_df.iloc[:, 1],
-                        type="scattergl",
-                        mode="markers",
-                        marker=dict(colorscale="viridis"),
+                    _plot_traces(
+                        x,
+                        y,
+                        color_data,
+                        colorscale,
+                        categorical,
+                        x_range,
+                        y_range,
                     )
                 ],
-                layout=go.Layout(height=750, width=900, autosize=False),
+                layout=layout,
             )
         else:
-            logging.critical(f"{color} selected for color")
-            if color in cytometry_df.columns:
-                logging.critical(f"{color} is in cytometry_df")
-                color_data = np.log(cytometry_df[color] + 1)
-                logging.critical(f"{color_data}")
-            elif color in cluster_df.columns:
-                logging.critical(f"{color} is in cluster_df")
-                logging.critical("cluster_df.columns")
-                color_data = cluster_df[color]
-                logging.critical(f"{color_data}")
-            else:
-                color_data = None
-
-            logging.critical("updating plot")
-            logging.critical(f"colorscale is {colorscale}")
             fig = go.Figure(
                 data=[
                     go.Scattergl(
-                        x=rd_df.iloc[:, 0],
-                        y=rd_df.iloc[:, 1],
+                        x=None,
+                        y=None,
                         type="scattergl",
-                        mode="markers",
-                        marker=dict(
-                            colorscale=colorscale,
-                            color=color_data,
-                            showscale=True,
-                        ),
                     )
                 ],
                 layout=go.Layout(height=750, width=900, autosize=False),
             )
-    else:
-        fig = go.Figure(
-            data=[
-                go.Scattergl(
-                    x=None,
-                    y=None,
-                    type="scattergl",
+
+        logging.critical("returning updated graph")
+        return fig
+
+    @app.callback(
+        Output("cluster-job", "data"),
+        [
+            Input("cluster-data-btn", "n_clicks"),
+            Input("cluster-resolution-sldr", "value"),
+            Input("cluster-n-neighbors-sldr", "value"),
+        ],
+        State("reduce-columns", "value"),
+        State("session-id", "data"),
+    )
+    def cluster_data(
+        btn: int,
+        res: float,
+        n_neighbors: int,
+        ignore_columns: Tuple[str] = (),
+        session_id: Optional[str] = None,
+    ) -> Optional[str]:
+        if ignore_columns is None:
+            ignore_columns = ()
+
+        logging.critical(f"{btn}")
+        logging.critical(f"{res}")
+        logging.critical(f"{n_neighbors}")
+        if btn is not None:
+            if store.has(session_id, DATA):
+                all_columns = store.columns(session_id, DATA)
+                use_columns = [
+                    x for x in all_columns if x not in ignore_columns
+                ]
+                logging.critical("submitting clustering")
+                logging.critical(
+                    f"with ignored colums, using {len(use_columns)} of "
+                    f"{len(all_columns)} columns"
                 )
-            ],
-            layout=go.Layout(height=750, width=900, autosize=False),
-        )
+                job = jobs.submit(
+                    "clustering",
+                    session_id,
+                    source=DATA,
+                    target=CLUSTERS,
+                    columns=use_columns,
+                    cluster_name=f"res_{res}_neighbors_{n_neighbors}",
+                    resolution=res,
+                    n_neighbors=n_neighbors,
+                    # refine the partition from the nearest resolution already
+                    # clustered, which workers share if MCR_CACHE_DIR is set
+                    warm_start=True,
+                )
+                return job.job_id
 
-    logging.critical("returning updated graph")
-    return fig
-
-
-@app.callback(
-    [
-        Output("color-store-cluster", "data"),
-        Output("hidden-clustering-div", "children"),
-    ],
-    [
-        Input("cluster-data-btn", "n_clicks"),
-        Input("cluster-resolution-sldr", "value"),
-        Input("cluster-n-neighbors-sldr", "value"),
-    ],
-    State("reduce-columns", "value"),
-)
-def cluster_data(
-    btn: int,
-    res: float,
-    n_neighbors: int,
-    ignore_columns: Tuple[str] = (),
-) -> Optional[List[Dict[str, str]]]:
-    global cluster_df
-
-    logging.critical(f"{btn}")
-    logging.critical(f"{res}")
-    logging.critical(f"{n_neighbors}")
-    if btn is not None:
-        if cytometry_df is not None:
-            data_use = cytometry_df.loc[
-                :, ~cytometry_df.columns.isin(ignore_columns)
-            ]
-            logging.critical("performing clustering")
-            logging.critical(
-                f"data was originally {cytometry_df.shape[0]} by {cytometry_df.shape[1]}"
-            )
-            logging.critical(
-                f"with ignored colums, it is {data_use.shape[0]} by {data_use.shape[1]}"
-            )
-            clusters = label_clusters(
-                data_df=data_use, resolution=res, n_neighbors=n_neighbors
-            )
-            logging.critical("finished clustering")
-            logging.critical("appending data")
-            if cluster_df is not None:
-                cluster_df[f"res_{res}_neighbors_{n_neighbors}"] = clusters
             else:
-                cluster_df = pd.DataFrame(
-                    {f"res_{res}_neighbors_{n_neighbors}": clusters}
+                dbc.Modal(
+                    [
+                        dbc.ModalHeader("No data!"),
+                        dbc.ModalBody(
+                            "Please load cytometry data before attempting to perform clustering."
+                        ),
+                        dbc.ModalFooter(
+                            dbc.Button("Close", id="close", className="ml-auto")
+                        ),
+                    ],
+                    id="modal",
                 )
-            return (
-                [
-                    {
-                        "label": f"Cluster res_{res}_neighbors_{n_neighbors}",
-                        "value": f"res_{res}_neighbors_{n_neighbors}",
-                    }
-                ],
-                True,
-            )
-
+                return None
         else:
-            dbc.Modal(
-                [
-                    dbc.ModalHeader("No data!"),
-                    dbc.ModalBody(
-                        "Please load cytometry data before attempting to perform clustering."
-                    ),
-                    dbc.ModalFooter(
-                        dbc.Button("Close", id="close", className="ml-auto")
-                    ),
-                ],
-                id="modal",
-            )
-            return None, True
-    else:
-        return None, True
+            return None
+
+    @app.callback(
+        Output("resolution-job", "data"),
+        Input("resolution-scan-btn", "n_clicks"),
+        State("cluster-n-neighbors-sldr", "value"),
+        State("reduce-columns", "value"),
+        State("session-id", "data"),
+    )
+    def scan_resolutions(btn, n_neighbors, ignore_columns=(), session_id=None):
+        if btn is None or not store.has(session_id, DATA):
+            raise PreventUpdate
+        ignore_columns = ignore_columns or ()
+        use_columns = [
+            x
+            for x in store.columns(session_id, DATA)
+            if x not in ignore_columns
+        ]
+        job = jobs.submit(
+            "resolution_profile",
+            session_id,
+            source=DATA,
+            target=RESOLUTIONS,
+            columns=use_columns,
+            replace=True,
+            n_neighbors=n_neighbors,
+            resolution_range=(0.05, 3.0),
+        )
+        return job.job_id
+
+    @app.callback(
+        Output("color-store-resolution", "data"),
+        Input("resolution-table", "selected_rows"),
+        State("resolution-table", "data"),
+        State("session-id", "data"),
+    )
+    def pick_resolution(selected_rows, rows, session_id=None):
+        # the scan already holds every partition, so nothing is clustered here
+        if not selected_rows or not rows:
+            raise PreventUpdate
+        row = rows[selected_rows[0]]
+        membership = store.get(session_id, RESOLUTIONS, columns=[row["column"]])
+        name = f"{row['column']}_neighbors_{row['n_neighbors']}"
+        store.add_columns(
+            session_id,
+            CLUSTERS,
+            membership.rename(columns={row["column"]: name}),
+        )
+        return [{"label": f"Cluster {name}", "value": name}]
 
 
 @click.command(
@@ -700,14 +1045,15 @@ def main(debug=False):
     """Run a Dash-based interface for performing
     dimensional reduction and clustering of data.
     """
-    if debug:
-        app.run_server(
-            debug=True, dev_tools_ui=True, dev_tools_props_check=True, port=8787, threaded=True, host='0.0.0.0',
-        )
-    else:
-        app.run_server(
-            debug=False, dev_tools_ui=False, dev_tools_props_check=False, port=8787, threaded=True, host='0.0.0.0',
-        )
+    jit.configure_cache()
+    create_app().run_server(
+        debug=debug,
+        dev_tools_ui=debug,
+        dev_tools_props_check=debug,
+        port=8787,
+        threaded=True,
+        host="0.0.0.0",
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""
+Exporting results from the Dash GUI.
+
+Sending a file through a Dash callback means building the whole joined table,
+writing it out, and base64-encoding it into the callback's JSON response,
+all in the server's memory.  The route added by
+:func:`register_download_routes` instead streams the export: the session's
+data, embeddings, and clusters are read from their memory-mapped Arrow files
+one block of rows at a time, and each block is encoded as CSV or as a Parquet
+row group and sent before the next is read.
+"""
+from typing import Iterator, List, Sequence
+
+import io
+import logging
+from itertools import chain
+
+from .store import SessionStore
+
+DOWNLOAD_FORMATS = {"csv": "text/csv", "parquet": "application/octet-stream"}
+BLOCK_ROWS = 65_536
+
+
+def _joined_blocks(tables: Sequence, block_rows: int) -> Iterator:
+    """\
+    Blocks of rows of `tables` placed side by side, as :class:`pyarrow.Table`
+    objects that share memory with the inputs.
+    """
+    import pyarrow as pa
+
+    n_rows = min(t.num_rows for t in tables)
+    names = [name for t in tables for name in t.column_names]
+    for start in range(0, n_rows, block_rows):
+        length = min(block_rows, n_rows - start)
+        columns = [
+            column.slice(start, length) for t in tables for column in t.columns
+        ]
+        yield pa.Table.from_arrays(columns, names=names)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def stream_tables(
+    tables: Sequence, fmt: str = "csv", block_rows: int = BLOCK_ROWS
+) -> Iterator[bytes]:
+    """\
+    Encode `tables`, joined column-wise, as a CSV or Parquet file, yielding
+    the bytes of each block as soon as it has been written.
+
+    Parameters
+    ----------
+    tables
+        Sequence[:class:`pyarrow.Table`] with the same number of rows
+    fmt
+        str
+        default = "csv".  One of `DOWNLOAD_FORMATS`.
+    block_rows
+        int
+        default = 65,536.  Rows per CSV block or Parquet row group.
+    """
+    buffer = io.BytesIO()
+    blocks = _joined_blocks(tables, block_rows)
+    first = next(blocks, None)
+    if first is None:
+        return
+
+    if fmt == "csv":
+        import pyarrow.csv as pc
+
+        writer = pc.CSVWriter(buffer, first.schema)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(buffer, first.schema)
+    else:
+        raise ValueError(f"{fmt} is not a supported download format")
+
+    for block in chain([first], blocks):
+        writer.write_table(block)
+        yield _drain(buffer)
+    writer.close()
+    yield _drain(buffer)
+
+
+def register_download_routes(
+    server,
+    store: SessionStore,
+    data: str = "data",
+    results: Sequence[str] = ("reduction", "clusters"),
+) -> None:
+    """\
+    Add ``GET mcr-download/<session>?format=<csv|parquet>&append=<0|1>`` to
+    the GUI's Flask `server`.  It streams the session's `results` tables,
+    preceded by its `data` table if `append` is 1, as an attachment.
+    """
+    from flask import Response, jsonify, request, stream_with_context
+
+    @server.route("/mcr-download/<session_id>", methods=["GET"])
+    def download(session_id):
+        fmt = request.args.get("format", "csv")
+        if fmt not in DOWNLOAD_FORMATS:
+            return jsonify(error=f"{fmt} is not a supported format"), 400
+        try:
+            store.session_dir(session_id)
+        except ValueError as error:
+            return jsonify(error=str(error)), 400
+
+        names: List[str] = list(results)
+        if request.args.get("append", "0") == "1":
+            names.insert(0, data)
+        tables = [store.get_table(session_id, name) for name in names]
+        tables = [t for t in tables if t is not None]
+        if not tables:
+            return jsonify(error="there are no results to download"), 404
+
+        logging.critical(f"streaming {fmt} results for session {session_id}")
+        return Response(
+            stream_with_context(stream_tables(tables, fmt)),
+            mimetype=DOWNLOAD_FORMATS[fmt],
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="reduced_data.{fmt}"'
+                )
+            },
+        )
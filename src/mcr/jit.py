@@ -0,0 +1,183 @@
+"""
+A persistent cache for the numba kernels of UMAP and pynndescent.
+
+Those kernels are compiled the first time they run in a process, which on a
+short CLI run, a batch worker, or a freshly started container can take longer
+than the work itself.  Kernels declared with ``cache=True`` are written to
+numba's cache directory and loaded from there by later processes, but the
+default location, next to the installed sources, is often read-only.
+:func:`configure_cache` points numba at a directory managed by mcr instead,
+with one subdirectory per combination of Python, numba, and library versions
+(so an upgrade never loads stale machine code), and :func:`warmup` fills it.
+"""
+from typing import Any, Dict, Optional
+
+import hashlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import time
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+MANIFEST = "mcr-jit.json"
+
+# distributions whose versions decide whether cached kernels can be reused
+JIT_PACKAGES = [
+    "mcr",
+    "numba",
+    "llvmlite",
+    "numpy",
+    "umap-learn",
+    "pynndescent",
+]
+
+
+def installed_versions() -> Dict[str, Optional[str]]:
+    versions = {}
+    for package in JIT_PACKAGES:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    versions["python"] = platform.python_version()
+    versions["machine"] = platform.machine()
+    return versions
+
+
+def cache_root() -> Path:
+    """\
+    ``$MCR_CACHE_DIR/numba`` if that variable is set (as for the neighbor
+    graph cache), otherwise ``mcr/numba`` in the user's cache directory.
+    """
+    if os.environ.get("MCR_CACHE_DIR"):
+        return Path(os.environ["MCR_CACHE_DIR"], "numba")
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base, "mcr", "numba")
+
+
+def cache_dir() -> Path:
+    """The subdirectory of :func:`cache_root` for the installed versions."""
+    description = json.dumps(installed_versions(), sort_keys=True)
+    key = hashlib.blake2b(description.encode(), digest_size=8).hexdigest()
+    return cache_root() / key
+
+
+def configure_cache() -> Optional[Path]:
+    """\
+    Point numba's on-disk cache at :func:`cache_dir`, unless the user has
+    chosen a location by setting ``NUMBA_CACHE_DIR`` themselves.  Worker
+    processes started afterwards inherit the setting.
+
+    Returns
+    -------
+    the cache directory in use, or `None` if it could not be created
+    """
+    if "NUMBA_CACHE_DIR" in os.environ:
+        return Path(os.environ["NUMBA_CACHE_DIR"])
+
+    directory = cache_dir()
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError as error:
+        logging.warning(f"not caching compiled kernels: {error}")
+        return None
+    os.environ["NUMBA_CACHE_DIR"] = str(directory)
+    if "numba" in sys.modules:
+        # numba reads its configuration once, when it is first imported
+        sys.modules["numba"].config.reload_config()
+    return directory
+
+
+def cache_status() -> Dict[str, Any]:
+    """\
+    Describe the cache for the installed versions: whether :func:`warmup` has
+    filled it, and how many compiled kernels it holds.
+    """
+    directory = Path(os.environ.get("NUMBA_CACHE_DIR") or cache_dir())
+    manifest = directory / MANIFEST
+    recorded = json.loads(manifest.read_text()) if manifest.exists() else {}
+    kernels = list(directory.rglob("*.nbc")) if directory.exists() else []
+    return {
+        "cache_dir": str(directory),
+        "warm": recorded.get("versions") == installed_versions(),
+        "kernels": len(kernels),
+        "warmed_at": recorded.get("warmed_at"),
+    }
+
+
+def compile_kernels(reduction: Optional[str] = "umap") -> None:
+    """\
+    Run the neighbor search, clustering, and (if it is UMAP) the reduction on
+    a tiny dataset, so that their numba kernels are compiled, or loaded from
+    the cache, in this process.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from .clustering import label_clusters
+    from .neighbors import build_neighbor_graph
+    from .reduction import perform_reducion
+
+    X = np.random.default_rng(0).normal(size=(500, 10)).astype(np.float32)
+    graph = build_neighbor_graph(X, n_neighbors=15, neighbor_verbose=False)
+    label_clusters(X, graph=graph)
+    if reduction == "umap":
+        perform_reducion(
+            pd.DataFrame(X), reduction="umap", graph=graph, n_epochs=10
+        )
+
+
+def warmup(reduction: Optional[str] = "umap") -> Dict[str, Any]:
+    """\
+    Compile the kernels used by mcr into the cache and record the versions
+    they were compiled for.
+
+    Parameters
+    ----------
+    reduction
+        Optional[str]
+        default = "umap".  Set to None to skip the reduction.
+
+    Returns
+    -------
+    :func:`cache_status` after compiling
+    """
+    directory = configure_cache()
+    if directory is None:
+        raise OSError("no writable directory for the numba cache")
+
+    start = time.perf_counter()
+    compile_kernels(reduction)
+    logging.critical(
+        f"compiled kernels into {directory} in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+    (directory / MANIFEST).write_text(
+        json.dumps(
+            {
+                "versions": installed_versions(),
+                "warmed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            indent=2,
+        )
+    )
+    return cache_status()
+
+
+def prune(keep: Optional[Path] = None) -> int:
+    """\
+    Delete cached kernels compiled for other versions than the installed
+    ones, returning how many version directories were removed.
+    """
+    keep = keep or cache_dir()
+    removed = 0
+    if cache_root().exists():
+        for directory in cache_root().iterdir():
+            if directory.is_dir() and directory != keep:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+    return removed
@@ -0,0 +1,441 @@
+"""
+Background jobs for the Dash GUI.
+
+Reductions and clusterings can take many minutes on large datasets, far longer
+than a browser will wait on a callback.  :class:`JobManager` runs them in a
+pool of worker processes instead, keeping a table of submitted jobs that the
+GUI polls.  Workers exchange data with the server through the
+:class:`~mcr.store.SessionStore` rather than by pickling frames, and write
+their results to a table of their own that is only merged into the session's
+results once the job finishes and has not been cancelled.  Finished results
+are remembered by the content of the input table and the job's parameters,
+so asking for the same work twice returns at once.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from .profiling import profile, stage
+from .readers import select_features
+from .store import SessionStore
+
+JOB_STATES = ["queued", "running", "finished", "failed", "cancelled"]
+# a job may also write a small table describing its results under this suffix
+SUMMARY_SUFFIX = "-summary"
+
+# each worker keeps neighbor graphs in memory up to this size, so that
+# clustering the same data again at another resolution skips the neighbor
+# search; the workers do not share them, so it is kept small
+WORKER_GRAPH_CACHE_BYTES = 256 * 1024**2
+
+_worker_store: Optional[SessionStore] = None
+
+
+def _init_job_worker(store_root: str) -> None:
+    from .neighbors import configure_graph_cache
+
+    global _worker_store
+    _worker_store = SessionStore(root=store_root)
+    configure_graph_cache(max_memory_bytes=WORKER_GRAPH_CACHE_BYTES)
+
+
+def _read_features(
+    session_id: str, source: str, columns: Sequence[str]
+) -> pd.DataFrame:
+    # the session keeps the columns as they were uploaded; markers are only
+    # converted to float32 here, for the analysis
+    return select_features(
+        _worker_store.get(session_id, source, columns=columns)
+    )
+
+
+def _reduction_job(
+    session_id: str,
+    source: str,
+    result: str,
+    columns: Sequence[str],
+    reduction: str,
+) -> Tuple[str, Dict[str, Any]]:
+    from .reduction import perform_reducion
+
+    with profile() as profiler:
+        with stage("read"):
+            df = _read_features(session_id, source, columns)
+        embeddings = perform_reducion(df, reduction=reduction)
+        with stage("write"):
+            _worker_store.put(session_id, result, embeddings)
+    return result, profiler.to_dict()
+
+
+def _clustering_job(
+    session_id: str,
+    source: str,
+    result: str,
+    columns: Sequence[str],
+    cluster_name: str,
+    **kwargs,
+) -> Tuple[str, Dict[str, Any]]:
+    from .clustering import label_clusters
+
+    with profile() as profiler:
+        with stage("read"):
+            df = _read_features(session_id, source, columns)
+        clusters = label_clusters(data_df=df, use_cache=True, **kwargs)
+        with stage("write"):
+            _worker_store.put(
+                session_id, result, pd.DataFrame({cluster_name: clusters})
+            )
+    return result, profiler.to_dict()
+
+
+def _resolution_profile_job(
+    session_id: str,
+    source: str,
+    result: str,
+    columns: Sequence[str],
+    **kwargs,
+) -> Tuple[str, Dict[str, Any]]:
+    from .clustering import scan_resolution_profile
+
+    with profile() as profiler:
+        with stage("read"):
+            df = _read_features(session_id, source, columns)
+        scan = scan_resolution_profile(data_df=df, use_cache=True, **kwargs)
+        with stage("write"):
+            _worker_store.put(session_id, result, scan.memberships)
+            _worker_store.put(session_id, result + SUMMARY_SUFFIX, scan.table)
+    return result, profiler.to_dict()
+
+
+JOB_KINDS: Dict[str, Callable[..., Tuple[str, Dict[str, Any]]]] = {
+    "reduction": _reduction_job,
+    "clustering": _clustering_job,
+    "resolution_profile": _resolution_profile_job,
+}
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    session_id: str
+    target: str
+    parameters: Dict[str, Any]
+    replace: bool = False
+    submitted: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    status: str = "queued"
+    error: Optional[str] = None
+    cached: bool = False
+    collected: bool = False
+    profile: Optional[Dict[str, Any]] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def result_table(self) -> str:
+        return f"job-{self.job_id}"
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.submitted
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def as_record(self) -> Dict[str, Any]:
+        return {
+            "job": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "elapsed": f"{self.elapsed:.0f} s",
+            "parameters": ", ".join(
+                f"{k}={v}" for k, v in self.parameters.items()
+            ),
+            "error": self.error or "",
+        }
+
+
+class JobManager:
+    """\
+    Run reductions and clusterings for GUI sessions in worker processes.
+
+    Parameters
+    ----------
+    store
+        :class:`~mcr.store.SessionStore` shared with the workers
+    max_workers
+        Optional[int]
+        default = None, the number of CPUs
+    max_history
+        int
+        default = 1,000.  Finished jobs beyond this many, oldest first, are
+        forgotten.
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        max_workers: Optional[int] = None,
+        max_history: int = 1000,
+    ):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Job] = {}
+        self._results: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # started on first use, so importing the GUI does not spawn workers;
+        # "spawn" avoids forking a multi-threaded web server
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_job_worker,
+                initargs=(str(self.store.root),),
+            )
+        return self._executor
+
+    def _cache_key(
+        self, kind: str, session_id: str, source: str, parameters: Dict
+    ) -> str:
+        stat = self.store.stat(session_id, source)
+        if stat is None:
+            raise ValueError(f"session {session_id} has no table {source}")
+        description = json.dumps(
+            [kind, session_id, source, stat.st_mtime_ns, stat.st_size]
+            + [parameters],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.blake2b(
+            description.encode(), digest_size=16
+        ).hexdigest()
+
+    def submit(
+        self,
+        kind: str,
+        session_id: str,
+        source: str,
+        target: str,
+        columns: Sequence[str],
+        replace: bool = False,
+        **parameters,
+    ) -> Job:
+        """\
+        Queue a job reading `columns` of the table `source` and adding its
+        results to the table `target` of the same session.
+
+        Parameters
+        ----------
+        kind
+            str
+            one of `JOB_KINDS`
+        session_id
+            str
+        source
+            str
+            name of the input table in the session store
+        target
+            str
+            name of the table the results are added to
+        columns
+            Sequence[str]
+        replace
+            bool
+            default = False.  Replace `target` with the results instead of
+            adding them to it as new columns.
+        parameters
+            passed on to :func:`~mcr.reduction.perform_reducion`,
+            :func:`~mcr.clustering.label_clusters`, or
+            :func:`~mcr.clustering.scan_resolution_profile`
+
+        Returns
+        -------
+        :class:`Job`, already finished if the same work has been done before
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(
+                f"{kind} is not a recognized job.  Choose one of "
+                f"{', '.join(JOB_KINDS)}."
+            )
+        key = self._cache_key(
+            kind, session_id, source, dict(parameters, columns=list(columns))
+        )
+        job = Job(
+            job_id=uuid.uuid4().hex[:12],
+            kind=kind,
+            session_id=session_id,
+            target=target,
+            parameters=parameters,
+            replace=replace,
+        )
+
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+            cached = self._results.get(key)
+        if cached is not None and self.store.has(session_id, cached):
+            logging.critical(f"reusing results of an earlier {kind}")
+            job.cached = True
+            job.finished = job.submitted
+            self._complete(job, key, cached)
+            return job
+
+        with self._lock:
+            logging.critical(f"queueing {kind} job {job.job_id}")
+            job.future = self.executor.submit(
+                JOB_KINDS[kind],
+                session_id,
+                source,
+                job.result_table,
+                list(columns),
+                **parameters,
+            )
+            job.future.add_done_callback(
+                lambda future: self._finish(job, key, future)
+            )
+        return job
+
+    def _merge(self, job: Job, result_table: str) -> None:
+        results = self.store.get(job.session_id, result_table)
+        if job.replace:
+            self.store.put(job.session_id, job.target, results)
+        else:
+            self.store.add_columns(job.session_id, job.target, results)
+        summary = self.store.get(job.session_id, result_table + SUMMARY_SUFFIX)
+        if summary is not None:
+            self.store.put(
+                job.session_id, job.target + SUMMARY_SUFFIX, summary
+            )
+
+    def _finish(self, job: Job, key: str, future: Future) -> None:
+        with self._lock:
+            cancelled = job.status == "cancelled" or future.cancelled()
+            if cancelled:
+                job.status = "cancelled"
+            else:
+                job.finished = time.time()
+        if cancelled:
+            self.store.delete(job.session_id, job.result_table)
+            self.store.delete(job.session_id, job.result_table + SUMMARY_SUFFIX)
+            return
+
+        try:
+            result_table, job.profile = future.result()
+        except CancelledError:
+            job.status = "cancelled"
+            return
+        except Exception as error:
+            self._fail(job, error)
+            return
+        self._complete(job, key, result_table)
+
+    def _complete(self, job: Job, key: str, result_table: str) -> None:
+        # reading and rewriting the target can take a while for large
+        # results, so it is done without holding the lock that polling needs
+        try:
+            self._merge(job, result_table)
+        except Exception as error:
+            self._fail(job, error)
+            return
+        with self._lock:
+            self._results[key] = result_table
+            job.status = "finished"
+        logging.critical(
+            f"{job.kind} job {job.job_id} finished in {job.elapsed:.1f} s"
+        )
+
+    def _fail(self, job: Job, error: Exception) -> None:
+        logging.error(f"{job.kind} job {job.job_id} failed: {error}")
+        with self._lock:
+            job.status, job.error = "failed", str(error)
+            job.finished = job.finished or time.time()
+
+    def _prune(self) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if not job.active),
+            key=lambda job: job.submitted,
+        )
+        for job in finished[: max(0, len(finished) - self.max_history)]:
+            del self._jobs[job.job_id]
+
+    def cancel(self, job_id: str) -> bool:
+        """\
+        Cancel a job.  Queued jobs never start; a job that is already running
+        is left to complete in its worker, but its results are discarded.  A
+        job whose worker is done and whose results are being merged can no
+        longer be cancelled.
+
+        Returns
+        -------
+        whether the job was still active, and is now cancelled
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            if job.future is not None and job.future.done():
+                return False
+            job.status = "cancelled"
+            job.finished = time.time()
+            if job.future is not None:
+                job.future.cancel()
+            return True
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        return self._jobs.get(job_id) if job_id is not None else None
+
+    def jobs(self, session_id: Optional[str]) -> List[Job]:
+        """\
+        Jobs submitted for a session, most recent first, with their status
+        brought up to date.
+        """
+        with self._lock:
+            session_jobs = [
+                job
+                for job in self._jobs.values()
+                if job.session_id == session_id
+            ]
+            for job in session_jobs:
+                if (
+                    job.status == "queued"
+                    and job.future is not None
+                    and job.future.running()
+                ):
+                    job.status = "running"
+        return sorted(session_jobs, key=lambda job: job.submitted, reverse=True)
+
+    def collect(self, job_id: Optional[str]) -> Optional[Job]:
+        """\
+        The job, if it has finished and has not been collected before; lets a
+        polling callback act on each finished job exactly once.
+        """
+        with self._lock:
+            job = self.get(job_id)
+            if job is None or job.active or job.collected:
+                return None
+            job.collected = True
+            return job
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            for job in self._jobs.values():
+                if job.future is not None:
+                    job.future.cancel()
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,190 @@
+"""
+Fitted embeddings and clusterings that new cells can be projected into.
+
+Re-running the reduction and clustering over every cell each time a new batch
+is acquired costs time proportional to the whole project.  A :class:`MCRModel`
+keeps the fitted reduction and the clustered reference cells, so new cells are
+placed into the existing embedding with the reducer's ``transform`` and given
+the majority cluster of their nearest reference cells instead.
+"""
+from typing import Any, List, Optional, Union
+
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .neighbors import NeighborGraph
+from .readers import select_features
+from .reduction import embedding_frame, fit_reducer
+
+# reductions whose fitted objects can embed new data
+PROJECTABLE_REDUCTIONS = ["umap", "openTSNE", "pacmap"]
+
+
+class MCRModel:
+    """\
+    A fitted reduction plus a clustering reference.
+
+    Use :meth:`MCRModel.fit` to create one rather than the constructor.
+
+    Attributes
+    ----------
+    reduction
+        name of the reduction, as passed to :func:`~mcr.reduction.perform_reducion`
+    reducer
+        the fitted reduction object
+    feature_columns
+        the columns, in order, that the model was fit on
+    cluster_name
+        name of the cluster column produced by :meth:`project`
+    classifier
+        :class:`sklearn.neighbors.KNeighborsClassifier` fit on the reference
+        cells and their cluster identities
+    reference
+        embeddings and cluster identities of the reference cells
+    """
+
+    def __init__(
+        self,
+        reduction: str,
+        reducer: Any,
+        feature_columns: List[str],
+        cluster_name: str,
+        classifier: Any,
+        reference: Optional[pd.DataFrame] = None,
+    ):
+        self.reduction = reduction
+        self.reducer = reducer
+        self.feature_columns = feature_columns
+        self.cluster_name = cluster_name
+        self.classifier = classifier
+        self.reference = reference
+
+    @classmethod
+    def fit(
+        cls,
+        df: pd.DataFrame,
+        reduction: str = "umap",
+        resolution: float = 0.6,
+        n_neighbors: int = 30,
+        transfer_neighbors: int = 15,
+        cluster_name: Optional[str] = None,
+        graph: Optional[NeighborGraph] = None,
+        **reduction_kwargs,
+    ) -> "MCRModel":
+        """\
+        Fit the reduction and clustering on a reference dataset.
+
+        Parameters
+        ----------
+        df
+            :class:`pandas.DataFrame` of the columns to analyze
+        reduction
+            str
+            default = "umap".  One of `PROJECTABLE_REDUCTIONS`.
+        resolution
+            float
+            default = 0.6
+        n_neighbors
+            int
+            default = 30.  Neighbors used to build the clustering graph.
+        transfer_neighbors
+            int
+            default = 15.  Reference cells that vote on the cluster of each
+            projected cell.
+        cluster_name
+            Optional[str]
+            default = None, which gives `res_X` where X is the resolution
+        graph
+            Optional[:class:`~mcr.neighbors.NeighborGraph`]
+            default = None.  A precomputed neighbor graph for clustering.
+        **reduction_kwargs
+            passed to the reduction
+
+        Returns
+        -------
+        :class:`MCRModel`
+        """
+        from sklearn.neighbors import KNeighborsClassifier
+
+        if reduction not in PROJECTABLE_REDUCTIONS:
+            raise ValueError(
+                f"{reduction} cannot embed new data.  Choose one of "
+                f"{', '.join(PROJECTABLE_REDUCTIONS)}."
+            )
+        if reduction == "pacmap":
+            # PaCMAP needs its neighbor index to transform new data
+            reduction_kwargs.setdefault("save_tree", True)
+
+        from .clustering import label_clusters
+
+        df = select_features(df)
+        cluster_name = cluster_name or f"res_{resolution}"
+        reducer, embeddings = fit_reducer(df, reduction, **reduction_kwargs)
+
+        clusters = label_clusters(
+            data_df=df,
+            resolution=resolution,
+            n_neighbors=n_neighbors,
+            graph=graph,
+        )
+        classifier = KNeighborsClassifier(n_neighbors=transfer_neighbors)
+        classifier.fit(df.to_numpy(), clusters)
+
+        reference = embedding_frame(embeddings, reduction)
+        reference[cluster_name] = clusters
+
+        return cls(
+            reduction=reduction,
+            reducer=reducer,
+            feature_columns=list(df.columns),
+            cluster_name=cluster_name,
+            classifier=classifier,
+            reference=reference,
+        )
+
+    def _features(self, df: pd.DataFrame) -> pd.DataFrame:
+        missing = [x for x in self.feature_columns if x not in df.columns]
+        if missing:
+            raise KeyError(
+                f"The data is missing columns the model was fit on: {missing}"
+            )
+        return select_features(df.loc[:, self.feature_columns])
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """\
+        Place new cells into the fitted embedding.
+        """
+        embeddings = self.reducer.transform(self._features(df).to_numpy())
+        return embedding_frame(embeddings, self.reduction)
+
+    def predict_clusters(self, df: pd.DataFrame) -> np.ndarray:
+        """\
+        Assign new cells the majority cluster of their nearest reference cells.
+        """
+        return self.classifier.predict(self._features(df).to_numpy())
+
+    def project(self, df: pd.DataFrame) -> pd.DataFrame:
+        """\
+        Embeddings and cluster identities for new cells, one row per cell.
+        """
+        embeddings = self.transform(df)
+        embeddings[self.cluster_name] = self.predict_clusters(df)
+        return embeddings
+
+    def save(self, filename: Union[str, Path]) -> None:
+        import joblib
+
+        logging.info(f"saving model to {filename}")
+        joblib.dump(self, filename)
+
+    @staticmethod
+    def load(filename: Union[str, Path]) -> "MCRModel":
+        import joblib
+
+        model = joblib.load(filename)
+        if not isinstance(model, MCRModel):
+            raise TypeError(f"{filename} does not contain an MCRModel")
+        return model
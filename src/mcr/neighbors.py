@@ -0,0 +1,562 @@
+"""
+Nearest-neighbor graph construction and caching.
+
+Building the kNN graph and its fuzzy simplicial set is the most expensive part
+of :func:`~mcr.clustering.label_clusters` and is repeated, unchanged, every time
+only the clustering resolution changes.  Graphs are therefore cached by content:
+the key is a hash of the feature matrix together with the parameters that
+affect the result, so the same data always maps to the same graph no matter
+which caller asks for it.
+"""
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from .profiling import stage
+from .shared import SharedArray
+
+
+class NeighborGraph(NamedTuple):
+    """\
+    A kNN graph together with the fuzzy simplicial set derived from it.
+
+    knn_indices
+        (n_cells, n_neighbors) array of neighbor indices, each cell first
+    knn_dists
+        (n_cells, n_neighbors) array of distances matching `knn_indices`
+    connectivities
+        symmetric :class:`scipy.sparse.csr_matrix` of membership strengths
+    key
+        cache key the graph was stored under
+    """
+
+    knn_indices: np.ndarray
+    knn_dists: np.ndarray
+    connectivities: scipy.sparse.csr_matrix
+    key: str
+
+    @property
+    def n_neighbors(self) -> int:
+        return self.knn_indices.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.knn_indices.nbytes
+            + self.knn_dists.nbytes
+            + self.connectivities.data.nbytes
+            + self.connectivities.indices.nbytes
+            + self.connectivities.indptr.nbytes
+        )
+
+
+def as_feature_matrix(
+    data: Union[pd.DataFrame, np.ndarray, SharedArray]
+) -> np.ndarray:
+    """\
+    Return `data` as a C-contiguous 2D array without copying when possible.
+    """
+    if isinstance(data, SharedArray):
+        data = data.attach()
+    if isinstance(data, pd.DataFrame):
+        data = data.to_numpy()
+    return np.ascontiguousarray(data)
+
+
+def hash_features(data: Union[pd.DataFrame, np.ndarray]) -> str:
+    """\
+    Content hash of a feature matrix, including its shape and dtype.
+    """
+    X = as_feature_matrix(data)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{X.shape}{X.dtype.str}".encode())
+    digest.update(memoryview(X).cast("B"))
+    return digest.hexdigest()
+
+
+def graph_key(data_hash: str, **params: Any) -> str:
+    """\
+    Combine a feature hash with the graph parameters into a cache key.
+    """
+    encoded = json.dumps(params, sort_keys=True, default=str).encode()
+    return f"{data_hash}-{hashlib.blake2b(encoded, digest_size=8).hexdigest()}"
+
+
+class GraphCache:
+    """\
+    Two-tier LRU cache of :class:`NeighborGraph` objects.
+
+    Graphs are kept in memory until `max_memory_bytes` is exceeded, at which
+    point the least recently used ones are dropped.  If `cache_dir` is given,
+    every graph is also written there as an uncompressed ``.npz`` file and the
+    directory is trimmed, oldest access first, to `max_disk_bytes`.
+
+    Parameters
+    ----------
+    max_memory_bytes
+        int
+        default = 2 GiB
+    cache_dir
+        Optional[Union[str, Path]]
+        default = None
+    max_disk_bytes
+        int
+        default = 20 GiB
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 2 * 1024**3,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_disk_bytes: int = 20 * 1024**3,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._memory: "OrderedDict[str, NeighborGraph]" = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or (
+            self.cache_dir is not None and self._disk_path(key).exists()
+        )
+
+    def get(self, key: str) -> Optional[NeighborGraph]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            logging.debug(f"graph {key} found in memory cache")
+            return self._memory[key]
+
+        if self.cache_dir is not None:
+            path = self._disk_path(key)
+            if path.exists():
+                logging.debug(f"graph {key} found in disk cache")
+                graph = self._load(path, key)
+                os.utime(path)
+                self._remember(graph)
+                return graph
+
+        return None
+
+    def put(self, graph: NeighborGraph) -> None:
+        self._remember(graph)
+        if self.cache_dir is not None:
+            self._save(self._disk_path(graph.key), graph)
+            self._evict_disk()
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.cache_dir is not None:
+            for path in self.cache_dir.glob("*.npz"):
+                path.unlink()
+
+    def _remember(self, graph: NeighborGraph) -> None:
+        self._memory[graph.key] = graph
+        self._memory.move_to_end(graph.key)
+        used = sum(g.nbytes for g in self._memory.values())
+        # always keep the graph that was just added, even if it alone is
+        # larger than the budget
+        while used > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            used -= evicted.nbytes
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def _evict_disk(self) -> None:
+        entries = sorted(
+            self.cache_dir.glob("*.npz"), key=lambda p: p.stat().st_mtime
+        )
+        used = sum(p.stat().st_size for p in entries)
+        while used > self.max_disk_bytes and len(entries) > 1:
+            oldest = entries.pop(0)
+            used -= oldest.stat().st_size
+            oldest.unlink()
+
+    @staticmethod
+    def _save(path: Path, graph: NeighborGraph) -> None:
+        # write to a temporary name first so that a concurrent reader never
+        # sees a partially written file
+        tmp_path = path.with_suffix(".tmp.npz")
+        connectivities = graph.connectivities
+        np.savez(
+            tmp_path,
+            knn_indices=graph.knn_indices,
+            knn_dists=graph.knn_dists,
+            data=connectivities.data,
+            indices=connectivities.indices,
+            indptr=connectivities.indptr,
+            shape=np.array(connectivities.shape),
+        )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _load(path: Path, key: str) -> NeighborGraph:
+        with np.load(path) as stored:
+            connectivities = scipy.sparse.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]),
+                shape=tuple(stored["shape"]),
+            )
+            return NeighborGraph(
+                knn_indices=stored["knn_indices"],
+                knn_dists=stored["knn_dists"],
+                connectivities=connectivities,
+                key=key,
+            )
+
+
+# in-memory size of the process-wide cache, unless MCR_GRAPH_CACHE_MB is set
+DEFAULT_GRAPH_CACHE_BYTES = 512 * 1024**2
+
+_default_cache: Optional[GraphCache] = None
+
+
+def configure_graph_cache(max_memory_bytes: Optional[int] = None) -> GraphCache:
+    """\
+    Replace the process-wide graph cache with an empty one.
+
+    Parameters
+    ----------
+    max_memory_bytes
+        Optional[int]
+        default = None, which reads the size in megabytes from the
+        ``MCR_GRAPH_CACHE_MB`` environment variable or falls back to
+        `DEFAULT_GRAPH_CACHE_BYTES`
+
+    Returns
+    -------
+    :class:`GraphCache`
+    """
+    global _default_cache
+    if max_memory_bytes is None:
+        megabytes = os.environ.get("MCR_GRAPH_CACHE_MB")
+        max_memory_bytes = (
+            int(float(megabytes) * 1024**2)
+            if megabytes
+            else DEFAULT_GRAPH_CACHE_BYTES
+        )
+    cache_dir = os.environ.get("MCR_CACHE_DIR")
+    _default_cache = GraphCache(
+        max_memory_bytes=max_memory_bytes,
+        cache_dir=Path(cache_dir, "graphs") if cache_dir else None,
+    )
+    return _default_cache
+
+
+def get_graph_cache() -> GraphCache:
+    """\
+    Return the process-wide graph cache, used by
+    :func:`~mcr.clustering.label_clusters` and friends with `use_cache=True`.
+
+    The cache is memory-only unless the ``MCR_CACHE_DIR`` environment variable
+    is set, in which case graphs are also persisted to ``$MCR_CACHE_DIR/graphs``.
+    Its in-memory size is set by :func:`configure_graph_cache`.
+    """
+    if _default_cache is None:
+        return configure_graph_cache()
+    return _default_cache
+
+
+NEIGHBOR_BACKENDS = ["nndescent", "kdtree", "balltree", "brute_blas", "hnsw"]
+
+
+def _brute_blas_neighbors(
+    X: np.ndarray, n_neighbors: int, metric: str, block_bytes: int = 2**28
+) -> Tuple[np.ndarray, np.ndarray]:
+    # exact search as a sequence of matrix products: for euclidean distance,
+    # |q - x|^2 = |q|^2 - 2 q.x + |x|^2, computed one block of queries at a time
+    # so that the distance block never exceeds `block_bytes`.  The expansion
+    # cancels badly for close points, so it is done in float64.
+    if metric not in ("euclidean", "sqeuclidean", "cosine"):
+        raise ValueError(
+            f"The brute_blas backend does not support the {metric} metric"
+        )
+    X = X.astype(np.float64, copy=False)
+    if metric == "cosine":
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        X = X / np.where(norms == 0, 1, norms)
+    sq_norms = np.einsum("ij,ij->i", X, X)
+
+    n_cells = X.shape[0]
+    block_size = max(1, block_bytes // (8 * n_cells))
+    knn_indices = np.empty((n_cells, n_neighbors), dtype=np.int32)
+    knn_dists = np.empty((n_cells, n_neighbors), dtype=np.float32)
+
+    for start in range(0, n_cells, block_size):
+        stop = min(start + block_size, n_cells)
+        block = sq_norms[start:stop, None] - 2 * (X[start:stop] @ X.T)
+        block += sq_norms[None, :]
+        # each cell is exactly at distance 0 from itself
+        block[np.arange(stop - start), np.arange(start, stop)] = 0
+        np.maximum(block, 0, out=block)
+        nearest = np.argpartition(block, n_neighbors - 1, axis=1)[
+            :, :n_neighbors
+        ]
+        dists = np.take_along_axis(block, nearest, axis=1)
+        order = np.argsort(dists, axis=1)
+        knn_indices[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        knn_dists[start:stop] = np.take_along_axis(dists, order, axis=1)
+
+    if metric == "euclidean":
+        np.sqrt(knn_dists, out=knn_dists)
+    elif metric == "cosine":
+        # for unit vectors |q - x|^2 = 2 - 2 cos(q, x)
+        knn_dists /= 2
+    return knn_indices, knn_dists
+
+
+def _hnsw_neighbors(
+    X: np.ndarray,
+    n_neighbors: int,
+    metric: str,
+    random_state: Optional[int],
+    n_jobs: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    try:
+        import hnswlib
+    except ImportError as error:
+        raise ImportError(
+            "The hnsw backend requires hnswlib.  Please ensure it is installed"
+        ) from error
+
+    spaces = {"euclidean": "l2", "sqeuclidean": "l2", "cosine": "cosine"}
+    if metric not in spaces:
+        raise ValueError(
+            f"The hnsw backend does not support the {metric} metric"
+        )
+
+    index = hnswlib.Index(space=spaces[metric], dim=X.shape[1])
+    index.init_index(
+        max_elements=X.shape[0],
+        ef_construction=200,
+        M=16,
+        random_seed=random_state if random_state is not None else 100,
+    )
+    index.set_num_threads(n_jobs if n_jobs > 0 else os.cpu_count() or 1)
+    index.add_items(X)
+    index.set_ef(max(2 * n_neighbors, 50))
+    knn_indices, knn_dists = index.knn_query(X, k=n_neighbors)
+    if metric == "euclidean":
+        # hnswlib reports squared euclidean distances
+        np.sqrt(knn_dists, out=knn_dists)
+    return knn_indices.astype(np.int32), knn_dists
+
+
+def nearest_neighbors(
+    X: np.ndarray,
+    n_neighbors: int = 30,
+    backend: str = "nndescent",
+    metric: str = "euclidean",
+    metric_kwds: Optional[Dict[str, Any]] = None,
+    angular: bool = False,
+    random_state: Optional[int] = None,
+    verbose: bool = False,
+    n_jobs: int = -1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """\
+    Find the `n_neighbors` nearest neighbors of every row of `X`, each row
+    counting as its own first neighbor, as :func:`umap.umap_.nearest_neighbors`
+    does.
+
+    Parameters
+    ----------
+    X
+        :class:`numpy.ndarray`
+    n_neighbors
+        int
+        default = 30
+    backend
+        str
+        default = "nndescent".  One of
+
+        - "nndescent": approximate, via pynndescent (what UMAP uses)
+        - "kdtree", "balltree": exact, via :mod:`sklearn.neighbors`.  Usually
+          the fastest choice for the 30-50 markers of a cytometry panel.
+        - "brute_blas": exact, as blocked matrix products; euclidean and
+          cosine only
+        - "hnsw": approximate, via hnswlib, for very large inputs
+    metric
+        str
+        default = "euclidean"
+    metric_kwds
+        Optional[Dict[str, Any]]
+        default = None
+    angular
+        bool
+        default = False.  Only used by "nndescent".
+    random_state
+        Optional[int]
+        default = None
+    verbose
+        bool
+        default = False
+    n_jobs
+        int
+        default = -1, all CPUs
+
+    Returns
+    -------
+    `knn_indices` and `knn_dists`, both (n_cells, n_neighbors)
+    """
+    if backend == "nndescent":
+        from umap.umap_ import nearest_neighbors as nndescent_neighbors
+
+        knn_indices, knn_dists, *_ = nndescent_neighbors(
+            X=X,
+            n_neighbors=n_neighbors,
+            random_state=random_state,
+            metric=metric,
+            metric_kwds=metric_kwds,
+            angular=angular,
+            verbose=verbose,
+        )
+        return knn_indices, knn_dists
+    elif backend in ("kdtree", "balltree"):
+        from sklearn.neighbors import NearestNeighbors
+
+        index = NearestNeighbors(
+            n_neighbors=n_neighbors,
+            algorithm="kd_tree" if backend == "kdtree" else "ball_tree",
+            metric=metric,
+            metric_params=metric_kwds,
+            n_jobs=n_jobs,
+        ).fit(X)
+        knn_dists, knn_indices = index.kneighbors(X)
+        return knn_indices.astype(np.int32), knn_dists.astype(np.float32)
+    elif backend == "brute_blas":
+        return _brute_blas_neighbors(X, n_neighbors, metric)
+    elif backend == "hnsw":
+        return _hnsw_neighbors(X, n_neighbors, metric, random_state, n_jobs)
+    else:
+        raise ValueError(
+            f"{backend} is not a recognized neighbor backend.  Choose one of "
+            f"{', '.join(NEIGHBOR_BACKENDS)}."
+        )
+
+
+def build_neighbor_graph(
+    data: Union[pd.DataFrame, np.ndarray, SharedArray],
+    n_neighbors: int = 30,
+    random_state: Optional[int] = None,
+    neighbor_metric: str = "euclidean",
+    neighbor_kwds: Optional[Dict[str, Any]] = None,
+    neighbor_angular: bool = False,
+    neighbor_verbose: bool = True,
+    fuzzy_metric: str = "euclidean",
+    fuzzy_metric_kwds: Optional[Dict[str, Any]] = None,
+    neighbor_backend: str = "nndescent",
+    cache: Optional[GraphCache] = None,
+) -> NeighborGraph:
+    """\
+    Compute, or fetch from `cache`, the kNN graph and fuzzy simplicial set
+    for a cell-by-analyte matrix.
+
+    Parameters
+    ----------
+    data
+        :class:`pandas.DataFrame`, :class:`numpy.ndarray`, or
+        :class:`~mcr.shared.SharedArray`
+    n_neighbors
+        int
+        default = 30
+    random_state
+        Optional[int]
+        default = None
+    neighbor_metric
+        str
+        default = "euclidean"
+    neighbor_kwds
+        Optional[Dict[str, Any]]
+        default = None
+    neighbor_angular
+        bool
+        default = False
+    neighbor_verbose
+        bool
+        default = True
+    fuzzy_metric
+        str
+        default = "euclidean"
+    fuzzy_metric_kwds
+        Optional[Dict[str, Any]]
+        default = None
+    neighbor_backend
+        str
+        default = "nndescent".  See :func:`nearest_neighbors`.
+    cache
+        Optional[GraphCache]
+        default = None, in which case nothing is cached
+
+    Returns
+    -------
+    :class:`NeighborGraph`
+    """
+    from umap.umap_ import fuzzy_simplicial_set
+
+    X = as_feature_matrix(data)
+    key = graph_key(
+        hash_features(X),
+        n_neighbors=n_neighbors,
+        random_state=random_state,
+        neighbor_metric=neighbor_metric,
+        neighbor_kwds=neighbor_kwds,
+        neighbor_angular=neighbor_angular,
+        fuzzy_metric=fuzzy_metric,
+        fuzzy_metric_kwds=fuzzy_metric_kwds,
+        neighbor_backend=neighbor_backend,
+    )
+
+    if cache is not None:
+        graph = cache.get(key)
+        if graph is not None:
+            logging.critical(f"using cached neighbor graph {key}")
+            return graph
+
+    logging.critical(
+        f"running nearest_neighbor() with the {neighbor_backend} backend.  "
+        f"Dataset is {X.shape[0]} by {X.shape[1]}."
+    )
+    with stage("knn", backend=neighbor_backend, cells=X.shape[0]):
+        knn_indices, knn_dists = nearest_neighbors(
+            X,
+            n_neighbors=n_neighbors,
+            backend=neighbor_backend,
+            metric=neighbor_metric,
+            metric_kwds=neighbor_kwds,
+            angular=neighbor_angular,
+            random_state=random_state,
+            verbose=neighbor_verbose,
+        )
+
+    logging.critical("running fuzzy_simplicial_set()")
+    with stage("fuzzy_simplicial_set"):
+        connectivities, *_ = fuzzy_simplicial_set(
+            X=scipy.sparse.coo_matrix(([], ([], [])), shape=(X.shape[0], 1)),
+            n_neighbors=n_neighbors,
+            random_state=random_state,
+            metric=fuzzy_metric,
+            metric_kwds=fuzzy_metric_kwds,
+            knn_indices=knn_indices,
+            knn_dists=knn_dists,
+            return_dists=True,
+        )
+
+    graph = NeighborGraph(
+        knn_indices=knn_indices,
+        knn_dists=knn_dists,
+        connectivities=connectivities.tocsr(),
+        key=key,
+    )
+    if cache is not None:
+        cache.put(graph)
+    return graph
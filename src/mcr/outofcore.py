@@ -0,0 +1,557 @@
+"""
+Clustering of datasets that are larger than memory.
+
+The in-memory path holds the whole cell-by-marker frame, copies of it made by
+the neighbor search and UMAP, and the kNN graph in several forms at once.
+Here each of those steps works on files instead:
+
+1. :func:`convert_to_store` streams the input, in blocks of rows, into a
+   float32 matrix on disk that is memory-mapped from then on.
+2. :func:`blocked_neighbors` builds a neighbor index from, and queries it
+   with, blocks of that matrix, writing the neighbors to memory-mapped
+   ``.npy`` files.
+3. :func:`membership_strengths` and :func:`write_edges` compute UMAP's fuzzy
+   simplicial set (the same graph :func:`~mcr.neighbors.build_neighbor_graph`
+   makes) block by block, appending its edges to disk.
+4. :func:`leiden_from_edges` builds the igraph graph from those edges and
+   partitions it.
+
+Every file is kept in a work directory, so clustering the same data again at
+other resolutions starts from step 4.  The output is one cluster column per
+resolution, as from :func:`~mcr.clustering.label_clusters_sweep`.
+"""
+from typing import Any, Optional, Sequence, Tuple, Union
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from .neighbors import graph_key
+from .profiling import stage
+from .readers import iter_data
+
+FEATURES = "features.f32"
+FEATURES_META = "features.json"
+GRAPH_META = "graph.json"
+
+OUT_OF_CORE_BACKENDS = ["hnsw", "kdtree"]
+
+
+def _open_memmap(path: Path, dtype, shape: Tuple[int, ...]) -> np.memmap:
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+def convert_to_store(
+    data_file: str,
+    work_dir: Union[str, Path],
+    ignore_columns: Optional[Sequence[str]] = None,
+    chunksize: int = 1_000_000,
+) -> Path:
+    """\
+    Write the marker columns of `data_file` to a float32 matrix in
+    `work_dir`, one block of rows at a time.  Nothing is done if the matrix
+    was already made from the same file (by modification time and size) and
+    columns.
+
+    CSV and Parquet inputs are streamed; other formats are read in full
+    first (see :func:`~mcr.readers.iter_data`).
+
+    Returns
+    -------
+    `work_dir`, as a :class:`~pathlib.Path`
+    """
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    stat = os.stat(data_file)
+    signature = {
+        "source": str(Path(data_file).resolve()),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "ignore_columns": sorted(ignore_columns or []),
+    }
+    meta_path = work_dir / FEATURES_META
+    if meta_path.exists():
+        if json.loads(meta_path.read_text())["signature"] == signature:
+            logging.critical(f"using the converted copy of {data_file}")
+            return work_dir
+        # the features changed, so any graph built from them is stale
+        (work_dir / GRAPH_META).unlink(missing_ok=True)
+        meta_path.unlink()
+
+    columns = None
+    n_cells = 0
+    with stage("convert", file=Path(data_file).name):
+        with open(work_dir / FEATURES, "wb") as out:
+            for chunk in iter_data(data_file, chunksize, ignore_columns):
+                if columns is None:
+                    columns = list(chunk.columns)
+                    non_numeric = [
+                        c
+                        for c in columns
+                        if not pd.api.types.is_numeric_dtype(chunk[c])
+                    ]
+                    if non_numeric:
+                        raise ValueError(
+                            f"{', '.join(non_numeric)} are not numeric.  "
+                            f"Please add them to the ignored columns."
+                        )
+                chunk.to_numpy(dtype=np.float32).tofile(out)
+                n_cells += chunk.shape[0]
+
+    meta_path.write_text(
+        json.dumps(
+            {"signature": signature, "columns": columns, "n_cells": n_cells}
+        )
+    )
+    logging.critical(f"converted {n_cells} cells to {work_dir / FEATURES}")
+    return work_dir
+
+
+def open_features(work_dir: Union[str, Path]) -> np.memmap:
+    """The matrix written by :func:`convert_to_store`, memory-mapped."""
+    meta = json.loads(Path(work_dir, FEATURES_META).read_text())
+    return np.memmap(
+        Path(work_dir, FEATURES),
+        dtype=np.float32,
+        mode="r",
+        shape=(meta["n_cells"], len(meta["columns"])),
+    )
+
+
+def blocked_neighbors(
+    X: np.ndarray,
+    work_dir: Union[str, Path],
+    n_neighbors: int = 30,
+    backend: str = "hnsw",
+    block_rows: int = 500_000,
+    random_state: Optional[int] = None,
+    n_jobs: int = -1,
+) -> Tuple[np.memmap, np.memmap]:
+    """\
+    Euclidean nearest neighbors of every row of `X`, each row counting as its
+    own first neighbor, with `X` read and queried `block_rows` at a time.
+
+    Parameters
+    ----------
+    X
+        :class:`numpy.ndarray` or :class:`numpy.memmap`
+    work_dir
+        Union[str, Path].  Where ``knn_indices.npy`` and ``knn_dists.npy``
+        are written.
+    n_neighbors
+        int
+        default = 30
+    backend
+        str
+        default = "hnsw".  One of
+
+        - "hnsw": approximate, via hnswlib.  The index is built by adding
+          blocks of rows, and takes about (`n_cells` * 200) bytes beyond the
+          data.
+        - "kdtree": exact, via :mod:`sklearn.neighbors`, which keeps a
+          float64 copy of `X` in memory.
+    block_rows
+        int
+        default = 500,000
+    random_state
+        Optional[int]
+        default = None
+    n_jobs
+        int
+        default = -1, all CPUs
+
+    Returns
+    -------
+    memory-mapped `knn_indices` and `knn_dists`, both (n_cells, n_neighbors)
+    """
+    n_cells = X.shape[0]
+    knn_indices = _open_memmap(
+        Path(work_dir, "knn_indices.npy"), np.int32, (n_cells, n_neighbors)
+    )
+    knn_dists = _open_memmap(
+        Path(work_dir, "knn_dists.npy"), np.float32, (n_cells, n_neighbors)
+    )
+    blocks = [
+        (start, min(start + block_rows, n_cells))
+        for start in range(0, n_cells, block_rows)
+    ]
+
+    if backend == "hnsw":
+        try:
+            import hnswlib
+        except ImportError as error:
+            raise ImportError(
+                "The hnsw backend requires hnswlib.  Please ensure it is "
+                "installed"
+            ) from error
+
+        index = hnswlib.Index(space="l2", dim=X.shape[1])
+        index.init_index(
+            max_elements=n_cells,
+            ef_construction=200,
+            M=16,
+            random_seed=random_state if random_state is not None else 100,
+        )
+        index.set_num_threads(n_jobs if n_jobs > 0 else os.cpu_count() or 1)
+        with stage("knn_index", backend=backend, cells=n_cells):
+            for start, stop in blocks:
+                index.add_items(
+                    np.asarray(X[start:stop]), np.arange(start, stop)
+                )
+        index.set_ef(max(2 * n_neighbors, 50))
+        with stage("knn_query", backend=backend):
+            for start, stop in blocks:
+                labels, dists = index.knn_query(
+                    np.asarray(X[start:stop]), k=n_neighbors
+                )
+                knn_indices[start:stop] = labels
+                # hnswlib reports squared euclidean distances
+                knn_dists[start:stop] = np.sqrt(dists)
+    elif backend == "kdtree":
+        from sklearn.neighbors import NearestNeighbors
+
+        with stage("knn_index", backend=backend, cells=n_cells):
+            index = NearestNeighbors(
+                n_neighbors=n_neighbors, algorithm="kd_tree", n_jobs=n_jobs
+            ).fit(X)
+        with stage("knn_query", backend=backend):
+            for start, stop in blocks:
+                dists, labels = index.kneighbors(np.asarray(X[start:stop]))
+                knn_indices[start:stop] = labels
+                knn_dists[start:stop] = dists
+    else:
+        raise ValueError(
+            f"{backend} cannot be used out of core.  Choose one of "
+            f"{', '.join(OUT_OF_CORE_BACKENDS)}."
+        )
+
+    knn_indices.flush()
+    knn_dists.flush()
+    return knn_indices, knn_dists
+
+
+def membership_strengths(
+    knn_indices: np.ndarray,
+    knn_dists: np.ndarray,
+    work_dir: Union[str, Path],
+    block_rows: int = 500_000,
+    local_connectivity: float = 1.0,
+) -> np.memmap:
+    """\
+    The directed membership strength of each kNN edge, as computed by
+    :func:`umap.umap_.fuzzy_simplicial_set`, written to ``strengths.npy`` in
+    `work_dir` one block of rows at a time.  Each row's distances are
+    normalized independently, so blocks give the same result as the whole.
+    """
+    from umap.umap_ import smooth_knn_dist
+
+    n_cells, n_neighbors = knn_indices.shape
+    strengths = _open_memmap(
+        Path(work_dir, "strengths.npy"), np.float32, knn_indices.shape
+    )
+    with stage("membership_strengths"):
+        for start in range(0, n_cells, block_rows):
+            stop = min(start + block_rows, n_cells)
+            dists = np.asarray(knn_dists[start:stop], dtype=np.float32)
+            sigmas, rhos = smooth_knn_dist(
+                dists,
+                float(n_neighbors),
+                local_connectivity=float(local_connectivity),
+            )
+            excess = dists - rhos[:, None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.exp(-excess / sigmas[:, None])
+            values[(excess <= 0) | (sigmas[:, None] == 0)] = 1.0
+            # a cell is not a member of its own neighborhood
+            self_edges = knn_indices[start:stop] == np.arange(start, stop)[
+                :, None
+            ]
+            values[self_edges] = 0.0
+            strengths[start:stop] = values
+    strengths.flush()
+    return strengths
+
+
+# an entry of the transposed kNN graph, as stored in the shards written by
+# write_edges
+_TRIPLE = np.dtype(
+    [("row", np.int64), ("col", np.int64), ("weight", np.float32)]
+)
+
+
+def _directed_rows(
+    knn_indices: np.ndarray, strengths: np.ndarray, start: int, stop: int
+) -> scipy.sparse.csr_matrix:
+    # rows start:stop of the directed kNN graph
+    n_cells, n_neighbors = knn_indices.shape
+    return scipy.sparse.csr_matrix(
+        (
+            np.asarray(strengths[start:stop]).ravel(),
+            np.asarray(knn_indices[start:stop]).ravel(),
+            np.arange(0, (stop - start) * n_neighbors + 1, n_neighbors),
+        ),
+        shape=(stop - start, n_cells),
+    )
+
+
+def write_edges(
+    knn_indices: np.ndarray,
+    strengths: np.ndarray,
+    work_dir: Union[str, Path],
+    block_rows: int = 500_000,
+) -> int:
+    """\
+    Symmetrize the directed kNN graph by fuzzy union, as UMAP does
+    (``a + b - a * b`` for the strengths `a` and `b` of the two directions of
+    an edge), and append each undirected edge, with its weight, to
+    ``edges.i64`` and ``weights.f64`` in `work_dir`.
+
+    The transposed graph is first sorted into one file per block of rows,
+    under ``transpose/`` in `work_dir`, so that only one block of rows of
+    either direction, and of the symmetric graph, exists at a time.  Weights
+    are doubled, to match :func:`~mcr.clustering.graph_from_adjacency`, which
+    adds the two directions of an undirected edge together.
+
+    Returns
+    -------
+    the number of edges written
+    """
+    n_cells, n_neighbors = knn_indices.shape
+    blocks = [
+        (start, min(start + block_rows, n_cells))
+        for start in range(0, n_cells, block_rows)
+    ]
+    shard_dir = Path(work_dir, "transpose")
+    if shard_dir.exists():
+        shutil.rmtree(shard_dir)
+    shard_dir.mkdir()
+
+    with stage("transpose_edges"):
+        for start, stop in blocks:
+            targets = np.asarray(knn_indices[start:stop], np.int64).ravel()
+            triples = np.empty(len(targets), dtype=_TRIPLE)
+            triples["row"] = targets
+            triples["col"] = np.repeat(np.arange(start, stop), n_neighbors)
+            triples["weight"] = np.asarray(strengths[start:stop]).ravel()
+            # the edge i -> j is row j of the transpose
+            shard = targets // block_rows
+            order = np.argsort(shard, kind="stable")
+            bounds = np.searchsorted(shard[order], np.arange(len(blocks) + 1))
+            for block in np.flatnonzero(np.diff(bounds)):
+                part = order[bounds[block] : bounds[block + 1]]
+                with open(shard_dir / f"{block}.bin", "ab") as fh:
+                    triples[part].tofile(fh)
+
+    n_edges = 0
+    with stage("write_edges"):
+        with open(Path(work_dir, "edges.i64"), "wb") as edges, open(
+            Path(work_dir, "weights.f64"), "wb"
+        ) as weights:
+            for block, (start, stop) in enumerate(blocks):
+                a = _directed_rows(knn_indices, strengths, start, stop)
+                path = shard_dir / f"{block}.bin"
+                triples = (
+                    np.fromfile(path, dtype=_TRIPLE)
+                    if path.exists()
+                    else np.empty(0, dtype=_TRIPLE)
+                )
+                b = scipy.sparse.csr_matrix(
+                    (
+                        triples["weight"],
+                        (triples["row"] - start, triples["col"]),
+                    ),
+                    shape=(stop - start, n_cells),
+                )
+                del triples
+                path.unlink(missing_ok=True)
+                union = (a + b - a.multiply(b)).tocoo()
+                rows = union.row.astype(np.int64) + start
+                upper = (union.col > rows) & (union.data != 0)
+                np.column_stack([rows[upper], union.col[upper]]).astype(
+                    np.int64
+                ).tofile(edges)
+                (2 * union.data[upper].astype(np.float64)).tofile(weights)
+                n_edges += int(upper.sum())
+    shard_dir.rmdir()
+    return n_edges
+
+
+def open_edges(work_dir: Union[str, Path]) -> Tuple[np.memmap, np.memmap]:
+    """The edges and weights written by :func:`write_edges`."""
+    meta = json.loads(Path(work_dir, GRAPH_META).read_text())
+    edges = np.memmap(
+        Path(work_dir, "edges.i64"),
+        dtype=np.int64,
+        mode="r",
+        shape=(meta["n_edges"], 2),
+    )
+    weights = np.memmap(
+        Path(work_dir, "weights.f64"),
+        dtype=np.float64,
+        mode="r",
+        shape=(meta["n_edges"],),
+    )
+    return edges, weights
+
+
+def build_graph_on_disk(
+    work_dir: Union[str, Path],
+    n_neighbors: int = 30,
+    neighbor_backend: str = "hnsw",
+    block_rows: int = 500_000,
+    random_state: Optional[int] = None,
+    n_jobs: int = -1,
+) -> Path:
+    """\
+    Run :func:`blocked_neighbors`, :func:`membership_strengths`, and
+    :func:`write_edges` on the matrix in `work_dir`, unless the edges there
+    were already made with the same parameters.  The intermediate kNN
+    arrays are deleted once the edges are written.
+    """
+    work_dir = Path(work_dir)
+    key = graph_key(
+        "out-of-core",
+        features=json.loads((work_dir / FEATURES_META).read_text()),
+        n_neighbors=n_neighbors,
+        neighbor_backend=neighbor_backend,
+        random_state=random_state,
+    )
+    meta_path = work_dir / GRAPH_META
+    if meta_path.exists() and json.loads(meta_path.read_text())["key"] == key:
+        logging.critical(f"using the neighbor graph in {work_dir}")
+        return work_dir
+
+    X = open_features(work_dir)
+    logging.critical(
+        f"finding neighbors with the {neighbor_backend} backend, out of core.  "
+        f"Dataset is {X.shape[0]} by {X.shape[1]}."
+    )
+    knn_indices, knn_dists = blocked_neighbors(
+        X,
+        work_dir,
+        n_neighbors=n_neighbors,
+        backend=neighbor_backend,
+        block_rows=block_rows,
+        random_state=random_state,
+        n_jobs=n_jobs,
+    )
+    strengths = membership_strengths(
+        knn_indices, knn_dists, work_dir, block_rows=block_rows
+    )
+    del knn_dists
+    n_edges = write_edges(knn_indices, strengths, work_dir, block_rows)
+    del knn_indices, strengths
+    for name in ("knn_indices.npy", "knn_dists.npy", "strengths.npy"):
+        (work_dir / name).unlink()
+
+    meta_path.write_text(
+        json.dumps({"key": key, "n_cells": X.shape[0], "n_edges": n_edges})
+    )
+    logging.critical(f"wrote {n_edges} edges to {work_dir}")
+    return work_dir
+
+
+def leiden_from_edges(
+    work_dir: Union[str, Path],
+    resolutions: Sequence[float] = (0.6,),
+    use_weights: bool = True,
+    **partition_kwargs,
+) -> pd.DataFrame:
+    """\
+    Partition the graph written by :func:`build_graph_on_disk` at each of
+    `resolutions` in turn, reusing a single igraph graph.
+
+    Returns
+    -------
+    :class:`pandas.DataFrame` with one `res_X` column per resolution
+    """
+    import igraph as ig
+
+    from .clustering import _find_partition
+
+    meta = json.loads(Path(work_dir, GRAPH_META).read_text())
+    edges, weights = open_edges(work_dir)
+    logging.critical("building the igraph graph from the edges on disk")
+    with stage("graph_build", edges=meta["n_edges"]):
+        g = ig.Graph(
+            n=meta["n_cells"], edges=np.asarray(edges), directed=False
+        )
+    weights = np.asarray(weights) if use_weights else None
+
+    clusters = {}
+    for resolution in resolutions:
+        with stage("partition", resolution=resolution):
+            clusters[f"res_{resolution}"] = _find_partition(
+                g, resolution=resolution, weights=weights, **partition_kwargs
+            )
+    return pd.DataFrame(clusters)
+
+
+def cluster_out_of_core(
+    data_file: str,
+    work_dir: Union[str, Path],
+    resolutions: Sequence[float] = (0.6,),
+    n_neighbors: int = 30,
+    ignore_columns: Optional[Sequence[str]] = None,
+    neighbor_backend: str = "hnsw",
+    block_rows: int = 500_000,
+    random_state: Optional[int] = None,
+    n_jobs: int = -1,
+    **partition_kwargs: Any,
+) -> pd.DataFrame:
+    """\
+    Cluster the cells in `data_file` without holding them, or their neighbor
+    graph, in memory as a whole.
+
+    Parameters
+    ----------
+    data_file
+        str
+    work_dir
+        Union[str, Path].  Needs room for about (`n_cells` * (4 * markers +
+        50 * `n_neighbors`)) bytes.
+    resolutions
+        Sequence[float]
+        default = (0.6,)
+    n_neighbors
+        int
+        default = 30
+    ignore_columns
+        Optional[Sequence[str]]
+        default = None
+    neighbor_backend
+        str
+        default = "hnsw".  One of `OUT_OF_CORE_BACKENDS`; see
+        :func:`blocked_neighbors`.
+    block_rows
+        int
+        default = 500,000.  Rows read, queried, and symmetrized at a time.
+    random_state
+        Optional[int]
+        default = None
+    n_jobs
+        int
+        default = -1, all CPUs
+    partition_kwargs
+        passed to :func:`leidenalg.find_partition`
+
+    Returns
+    -------
+    :class:`pandas.DataFrame` with one `res_X` column per resolution
+    """
+    convert_to_store(data_file, work_dir, ignore_columns, chunksize=block_rows)
+    build_graph_on_disk(
+        work_dir,
+        n_neighbors=n_neighbors,
+        neighbor_backend=neighbor_backend,
+        block_rows=block_rows,
+        random_state=random_state,
+        n_jobs=n_jobs,
+    )
+    return leiden_from_edges(work_dir, resolutions, **partition_kwargs)
@@ -0,0 +1,148 @@
+"""
+Server-side paging, sorting, and filtering of GUI table previews.
+
+The GUI's tables use Dash's "custom" page, sort, and filter actions: the
+browser only ever receives the rows on the current page, which are cut from
+the Arrow table in the session store.  Without a sort or filter only that page
+is read from the memory-mapped file, so a preview costs the same whether the
+data has a thousand rows or ten million.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import re
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+PAGE_SIZE = 25
+
+# the operators produced by a DataTable's filter row; longer spellings first,
+# so ">=" is not mistaken for ">"
+_OPERATORS = [
+    (("ge", ">="), pc.greater_equal),
+    (("le", "<="), pc.less_equal),
+    (("lt", "<"), pc.less),
+    (("gt", ">"), pc.greater),
+    (("ne", "!="), pc.not_equal),
+    (("eq", "="), pc.equal),
+    (("contains",), None),
+]
+_CANONICAL = {
+    spelling: spellings[0]
+    for spellings, _ in _OPERATORS
+    for spelling in spellings
+}
+
+# a clause is written as {column} operator value; the braced column is
+# matched first, since a name like "Tilt Angle" contains an operator itself
+_CLAUSE = re.compile(
+    r"\s*\{(?P<name>(?:[^}\\]|\\.)*)\}\s*(?P<operator>"
+    + "|".join(
+        spelling + r"(?=\s)" if spelling.isalpha() else re.escape(spelling)
+        for spelling in _CANONICAL
+    )
+    + r")\s*(?P<value>.*?)\s*$",
+    re.DOTALL,
+)
+
+
+def split_filter_part(part: str) -> Tuple[Optional[str], Optional[str], Any]:
+    """\
+    Split one clause of a DataTable `filter_query`, such as ``{CD3} > 2``,
+    into its column, operator, and value.
+    """
+    match = _CLAUSE.match(part)
+    if match is None:
+        return None, None, None
+    name = re.sub(r"\\(.)", r"\1", match["name"])
+    value = match["value"]
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"`":
+        value = value[1:-1].replace("\\" + value[0], value[0])
+    else:
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    return name, _CANONICAL[match["operator"]], value
+
+
+def filter_mask(table: pa.Table, filter_query: Optional[str]):
+    """\
+    Boolean :class:`pyarrow.Array` of the rows matching `filter_query`, or
+    None if there is nothing to filter on.
+    """
+    if not filter_query:
+        return None
+    functions = {spellings[0]: f for spellings, f in _OPERATORS}
+    mask = None
+    for part in filter_query.split(" && "):
+        name, operator, value = split_filter_part(part)
+        if name not in table.column_names:
+            continue
+        column = table.column(name)
+        if operator == "contains":
+            clause = pc.match_substring(
+                pc.cast(column, pa.string()), str(value)
+            )
+        else:
+            if pa.types.is_string(column.type):
+                value = str(value)
+            clause = functions[operator](column, value)
+        mask = clause if mask is None else pc.and_(mask, clause)
+    return mask
+
+
+def page(
+    table: pa.Table,
+    page_current: int = 0,
+    page_size: int = PAGE_SIZE,
+    sort_by: Optional[Sequence[Dict[str, str]]] = None,
+    filter_query: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """\
+    One page of `table`, sorted and filtered as a DataTable asks.
+
+    Parameters
+    ----------
+    table
+        :class:`pyarrow.Table`
+    page_current
+        int
+        default = 0
+    page_size
+        int
+        default = 25
+    sort_by
+        Optional[Sequence[Dict[str, str]]]
+        default = None.  A DataTable's `sort_by`, a list of
+        ``{"column_id": ..., "direction": "asc" | "desc"}``.
+    filter_query
+        Optional[str]
+        default = None.  A DataTable's `filter_query`.
+
+    Returns
+    -------
+    the rows of the page as records, and the number of pages
+    """
+    mask = filter_mask(table, filter_query)
+    if mask is not None:
+        table = table.filter(mask)
+
+    page_current = page_current or 0
+    start = page_current * page_size
+    sort_keys = [
+        (
+            s["column_id"],
+            "ascending" if s["direction"] == "asc" else "descending",
+        )
+        for s in sort_by or []
+        if s["column_id"] in table.column_names
+    ]
+    if sort_keys:
+        order = pc.sort_indices(table, sort_keys=sort_keys)
+        rows = table.take(order.slice(start, page_size))
+    else:
+        rows = table.slice(start, page_size)
+
+    page_count = max(1, -(-table.num_rows // page_size))
+    return rows.to_pylist(), page_count
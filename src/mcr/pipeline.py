@@ -0,0 +1,110 @@
+"""
+Dimensional reduction and clustering from a single neighbor graph.
+
+UMAP and Leiden clustering both start from the same k-nearest-neighbor search,
+which on large datasets is the most expensive step of either.  Running
+`reduce-data` and `cluster-cells` separately does that search (and reads the
+input) twice; :func:`reduce_and_cluster` does it once and hands the graph to
+both.
+"""
+from typing import Any, Dict, Optional, Sequence
+
+import logging
+
+import pandas as pd
+
+from .clustering import label_clusters, label_clusters_sweep
+from .neighbors import GraphCache, build_neighbor_graph, get_graph_cache
+from .reduction import perform_reducion
+
+
+def reduce_and_cluster(
+    df: pd.DataFrame,
+    reduction: str = "umap",
+    resolutions: Sequence[float] = (0.6,),
+    n_neighbors: int = 30,
+    neighbor_backend: str = "nndescent",
+    random_state: Optional[int] = None,
+    use_cache: bool = False,
+    cache: Optional[GraphCache] = None,
+    n_jobs: Optional[int] = None,
+    reduction_kwargs: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """\
+    Embed and cluster the cells of `df` using one neighbor graph.
+
+    Parameters
+    ----------
+    df
+        :class:`pandas.DataFrame` of cells by markers
+    reduction
+        str
+        default = "umap".  Only UMAP can use the graph; the other methods
+        run their own neighbor search as usual.
+    resolutions
+        Sequence[float]
+        default = (0.6,).  Several resolutions are clustered in parallel
+        (see :func:`~mcr.clustering.label_clusters_sweep`).
+    n_neighbors
+        int
+        default = 30.  Used for both the embedding and the clusters.
+    neighbor_backend
+        str
+        default = "nndescent"
+    random_state
+        Optional[int]
+        default = None
+    use_cache
+        bool
+        default = False.  Look the graph up in, and add it to, the
+        in-memory cache of this process.
+    cache
+        Optional[:class:`~mcr.neighbors.GraphCache`]
+        default = None.  A cache to use instead, whatever `use_cache` is.
+    n_jobs
+        Optional[int]
+        default = None
+    reduction_kwargs
+        Optional[Dict[str, Any]]
+        default = None.  Passed to :func:`~mcr.reduction.perform_reducion`.
+
+    Returns
+    -------
+    :class:`pandas.DataFrame` of the embedding columns followed by one
+    `res_X` column of cluster identities per resolution
+    """
+    if cache is None and use_cache:
+        cache = get_graph_cache()
+    graph = build_neighbor_graph(
+        df,
+        n_neighbors=n_neighbors,
+        random_state=random_state,
+        neighbor_backend=neighbor_backend,
+        cache=cache,
+    )
+
+    reduction_kwargs = dict(reduction_kwargs or {})
+    if random_state is not None:
+        reduction_kwargs.setdefault("random_state", random_state)
+    logging.critical(f"running {reduction} on the shared neighbor graph")
+    embeddings = perform_reducion(
+        df, reduction=reduction, graph=graph, **reduction_kwargs
+    )
+
+    if len(resolutions) == 1:
+        clusters = pd.DataFrame(
+            {
+                f"res_{resolutions[0]}": label_clusters(
+                    df, resolution=resolutions[0], graph=graph
+                )
+            }
+        )
+    else:
+        clusters = label_clusters_sweep(
+            df, resolutions=resolutions, n_jobs=n_jobs, graph=graph
+        )
+
+    return pd.concat(
+        [embeddings.reset_index(drop=True), clusters.reset_index(drop=True)],
+        axis=1,
+    )
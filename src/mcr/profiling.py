@@ -0,0 +1,173 @@
+"""
+Stage-level timing and memory use.
+
+The pipeline marks its expensive steps (reading, the neighbor search, the fuzzy
+simplicial set, building the igraph graph, partitioning, each reduction, and
+writing) with :func:`stage`.  Inside a :func:`profile` block every stage
+records its wall time, CPU time (including that of worker processes that
+finished during it), and peak resident memory; outside of one, stages cost
+nothing::
+
+    with profile() as profiler:
+        label_clusters(df)
+    profiler.write_json("profile.json")
+
+Peak memory is measured per stage on Linux, whose kernel allows the
+high-water mark of a process to be reset; elsewhere it is the peak of the
+process up to the end of the stage.
+"""
+from typing import Any, Dict, Iterator, List, Optional
+
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_profiler: contextvars.ContextVar = contextvars.ContextVar(
+    "mcr_profiler", default=None
+)
+
+
+@dataclass
+class StageRecord:
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_mb: Optional[float]
+    depth: int = 0
+    info: Dict[str, Any] = field(default_factory=dict)
+
+
+def _children_cpu() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss() -> bool:
+    # writing 5 to clear_refs resets VmHWM (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024**2 if os.uname().sysname == "Darwin" else 1024)
+
+
+class Profiler:
+    """\
+    Collects a :class:`StageRecord` for every stage run while it is active.
+    """
+
+    def __init__(self):
+        self.records: List[StageRecord] = []
+        self._open_peaks: List[float] = []
+        self.can_reset_peak = _reset_peak_rss()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stages": [asdict(record) for record in self.records],
+            "total_wall_seconds": sum(
+                r.wall_seconds for r in self.records if r.depth == 0
+            ),
+        }
+
+    def write_json(self, filename: str) -> None:
+        Path(filename).write_text(json.dumps(self.to_dict(), indent=2))
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<32} {'wall s':>9} {'cpu s':>9} {'peak MB':>9}"]
+        for r in self.records:
+            peak = f"{r.peak_rss_mb:>9.0f}" if r.peak_rss_mb else f"{'':>9}"
+            lines.append(
+                f"{'  ' * r.depth + r.name:<32} {r.wall_seconds:>9.2f} "
+                f"{r.cpu_seconds:>9.2f} {peak}"
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile() -> Iterator[Profiler]:
+    """\
+    Record the stages run in the enclosed block (in this thread).
+    """
+    profiler = Profiler()
+    token = _profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _profiler.reset(token)
+
+
+def active_profiler() -> Optional[Profiler]:
+    return _profiler.get()
+
+
+@contextmanager
+def stage(name: str, **info) -> Iterator[None]:
+    """\
+    Time the enclosed block as the stage `name`, if a :func:`profile` block is
+    active.  `info` (e.g. the size of the data) is stored with the record.
+    """
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+        return
+
+    # records are listed in the order stages start, so nested stages follow
+    # the stage that contains them
+    record = StageRecord(name, 0.0, 0.0, None, len(profiler._open_peaks), info)
+    profiler.records.append(record)
+    if profiler.can_reset_peak:
+        # keep the peak the enclosing stage has reached so far, which the
+        # reset would otherwise lose
+        peak = _peak_rss_mb()
+        if profiler._open_peaks and peak is not None:
+            profiler._open_peaks[-1] = max(profiler._open_peaks[-1], peak)
+        _reset_peak_rss()
+    profiler._open_peaks.append(0.0)
+    wall, cpu = time.perf_counter(), time.process_time() + _children_cpu()
+    try:
+        yield
+    finally:
+        record.wall_seconds = time.perf_counter() - wall
+        record.cpu_seconds = time.process_time() + _children_cpu() - cpu
+        # a nested stage resets the high-water mark, so this stage's peak is
+        # the larger of what is left of it and its children's peaks
+        children_peak = profiler._open_peaks.pop()
+        peak = _peak_rss_mb()
+        if peak is not None:
+            record.peak_rss_mb = max(peak, children_peak)
+            if profiler._open_peaks:
+                profiler._open_peaks[-1] = max(
+                    profiler._open_peaks[-1], record.peak_rss_mb
+                )
+        logging.debug(
+            f"{name} took {record.wall_seconds:.2f} s "
+            f"({record.cpu_seconds:.2f} s CPU)"
+        )
@@ -0,0 +1,177 @@
+"""
+Server-side rasterization of large embeddings.
+
+Sending millions of points to the browser as a scatter trace makes for a JSON
+payload of hundreds of megabytes.  Above a threshold the GUI instead bins the
+points in view into a fixed grid of pixels, Datashader-style, and sends only
+the grid: a count of cells per pixel, or the mean (or, for cluster labels, the
+most common) value of the coloring variable.  Zooming in re-bins the visible
+region, and once few enough points are in view they are drawn individually.
+"""
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MAX_POINTS = 200_000
+"""Largest number of points in view that are drawn individually."""
+
+Range = Tuple[float, float]
+
+
+class Raster(NamedTuple):
+    image: np.ndarray
+    """Height by width array of pixel values; NaN where there are no points."""
+    x: np.ndarray
+    """Centers of the pixel columns."""
+    y: np.ndarray
+    """Centers of the pixel rows."""
+    counts: np.ndarray
+    """Number of points in each pixel."""
+
+
+def data_range(values: np.ndarray) -> Range:
+    low, high = float(np.nanmin(values)), float(np.nanmax(values))
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return low, high
+
+
+def in_view(
+    x: np.ndarray,
+    y: np.ndarray,
+    x_range: Optional[Range] = None,
+    y_range: Optional[Range] = None,
+) -> np.ndarray:
+    """\
+    Boolean mask of the points inside the given axis ranges.
+    """
+    mask = np.ones(len(x), dtype=bool)
+    if x_range is not None:
+        low, high = sorted(x_range)
+        mask &= (x >= low) & (x <= high)
+    if y_range is not None:
+        low, high = sorted(y_range)
+        mask &= (y >= low) & (y <= high)
+    return mask
+
+
+def _bin_index(values: np.ndarray, value_range: Range, n_bins: int):
+    low, high = value_range
+    index = ((values - low) * (n_bins / (high - low))).astype(np.int64)
+    # points exactly on the upper edge belong to the last bin
+    return np.minimum(index, n_bins - 1)
+
+
+def rasterize(
+    x: np.ndarray,
+    y: np.ndarray,
+    values: Optional[np.ndarray] = None,
+    x_range: Optional[Range] = None,
+    y_range: Optional[Range] = None,
+    width: int = 600,
+    height: int = 500,
+    categorical: bool = False,
+) -> Raster:
+    """\
+    Bin points into a `height` by `width` grid.
+
+    Parameters
+    ----------
+    x, y
+        :class:`numpy.ndarray` of point coordinates
+    values
+        Optional[:class:`numpy.ndarray`]
+        default = None.  If given, each pixel holds the mean of the values
+        of its points; otherwise, the number of points.
+    x_range, y_range
+        Optional[Tuple[float, float]]
+        default = None, the extent of the points.  Points outside are ignored.
+    width, height
+        int
+        default = 600, 500.  Size of the grid in pixels.
+    categorical
+        bool
+        default = False.  Treat `values` as labels, so each pixel holds the
+        most common label of its points instead of their mean.
+
+    Returns
+    -------
+    :class:`Raster`
+    """
+    mask = in_view(x, y, x_range, y_range)
+    x, y = x[mask], y[mask]
+    if values is not None:
+        values = np.asarray(values)[mask]
+    if x_range is None:
+        x_range = data_range(x) if len(x) else (0.0, 1.0)
+    if y_range is None:
+        y_range = data_range(y) if len(y) else (0.0, 1.0)
+    x_range, y_range = sorted(x_range), sorted(y_range)
+
+    n_pixels = width * height
+    pixel = _bin_index(y, y_range, height) * width + _bin_index(
+        x, x_range, width
+    )
+    counts = np.bincount(pixel, minlength=n_pixels)
+    empty = counts == 0
+
+    if values is None:
+        image = counts.astype(np.float64)
+    elif categorical:
+        labels, codes = np.unique(values, return_inverse=True)
+        # one label at a time, rather than a pixels by labels array of votes
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+        best_votes = np.zeros(n_pixels, dtype=np.int64)
+        best_code = np.zeros(n_pixels, dtype=np.int64)
+        for code in range(len(labels)):
+            votes = np.bincount(
+                pixel[order[bounds[code] : bounds[code + 1]]],
+                minlength=n_pixels,
+            )
+            # ties go to the first label, as with argmax
+            better = votes > best_votes
+            best_votes[better] = votes[better]
+            best_code[better] = code
+        image = labels[best_code].astype(np.float64)
+    else:
+        sums = np.bincount(
+            pixel, weights=values.astype(np.float64), minlength=n_pixels
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            image = sums / counts
+    image[empty] = np.nan
+
+    x_edges = np.linspace(*x_range, width + 1)
+    y_edges = np.linspace(*y_range, height + 1)
+    return Raster(
+        image=image.reshape(height, width),
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        counts=counts.reshape(height, width),
+    )
+
+
+def axis_ranges(
+    relayout_data: Optional[dict],
+) -> Tuple[Optional[Range], Optional[Range]]:
+    """\
+    The x and y ranges requested by a Plotly `relayoutData` event, or None
+    for an axis that was reset or not changed.
+    """
+    ranges = []
+    for axis in ("xaxis", "yaxis"):
+        if not relayout_data or relayout_data.get(f"{axis}.autorange"):
+            ranges.append(None)
+        elif f"{axis}.range[0]" in relayout_data:
+            ranges.append(
+                (
+                    float(relayout_data[f"{axis}.range[0]"]),
+                    float(relayout_data[f"{axis}.range[1]"]),
+                )
+            )
+        elif f"{axis}.range" in relayout_data:
+            ranges.append(tuple(map(float, relayout_data[f"{axis}.range"])))
+        else:
+            ranges.append(None)
+    return ranges[0], ranges[1]
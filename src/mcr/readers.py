@@ -0,0 +1,245 @@
+"""
+Reading cell-by-analyte tables from disk.
+
+Only the columns that will actually be analyzed are read when possible (the
+ignored columns are pushed down into the parser), and marker columns are
+stored as float32, which halves memory compared to pandas' default float64
+and is the precision UMAP and the neighbor search work at anyway.
+"""
+from typing import Iterator, List, Optional, Sequence
+
+import importlib.util
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .profiling import stage
+
+MARKER_DTYPE = np.float32
+
+CSV_SUFFIXES = [".csv", ".tsv", ".txt"]
+EXCEL_SUFFIXES = [".xlsx", ".xls"]
+PARQUET_SUFFIXES = [".parquet", ".pq"]
+FEATHER_SUFFIXES = [".feather", ".arrow", ".ipc"]
+HDF_SUFFIXES = [".h5", ".hdf5", ".hdf"]
+
+SUPPORTED_SUFFIXES = (
+    CSV_SUFFIXES
+    + EXCEL_SUFFIXES
+    + PARQUET_SUFFIXES
+    + FEATHER_SUFFIXES
+    + HDF_SUFFIXES
+)
+
+
+def _has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _csv_separator(datafile: Path) -> str:
+    if datafile.suffix == ".tsv":
+        return "\t"
+    if datafile.suffix == ".txt":
+        with open(datafile, "r", errors="replace") as fh:
+            return "\t" if "\t" in fh.readline() else ","
+    return ","
+
+
+def _read_csv(datafile: Path, engine: Optional[str] = None, **kwargs):
+    # every CSV read, including those of only the header or in chunks, goes
+    # through here so that they all fall back to latin-1 the same way
+    sep = _csv_separator(datafile)
+    if engine is None:
+        engine = "pyarrow" if _has_pyarrow() else "c"
+    try:
+        return pd.read_csv(datafile, sep=sep, engine=engine, **kwargs)
+    except (UnicodeDecodeError, ValueError, KeyError):
+        # plenty of exports from Windows machines are latin-1 encoded; pyarrow
+        # reports bad UTF-8 as an ArrowInvalid, which is a ValueError, or,
+        # when it mangles a header named in `usecols`, as a missing column
+        return pd.read_csv(
+            datafile, sep=sep, engine=engine, encoding="latin-1", **kwargs
+        )
+
+
+def read_columns(filename: str) -> List[str]:
+    """\
+    Return the column names of a data file without reading its contents.
+    """
+    datafile = Path(filename)
+
+    if datafile.suffix in CSV_SUFFIXES:
+        return list(_read_csv(datafile, nrows=0, engine="c").columns)
+    elif datafile.suffix in PARQUET_SUFFIXES:
+        import pyarrow.parquet as pq
+
+        return list(pq.read_schema(datafile).names)
+    elif datafile.suffix in FEATHER_SUFFIXES:
+        import pyarrow.ipc as ipc
+
+        with ipc.open_file(datafile) as reader:
+            return list(reader.schema.names)
+    elif datafile.suffix in EXCEL_SUFFIXES:
+        return list(pd.read_excel(datafile, nrows=0).columns)
+    elif datafile.suffix in HDF_SUFFIXES:
+        return list(pd.read_hdf(datafile, stop=0).columns)
+    else:
+        raise ValueError(f"{datafile.suffix} is not a supported file type")
+
+
+def _usecols(
+    filename: str, ignore_columns: Optional[Sequence[str]]
+) -> Optional[List[str]]:
+    if not ignore_columns:
+        return None
+    ignored = set(ignore_columns)
+    return [x for x in read_columns(filename) if x not in ignored]
+
+
+def downcast_markers(
+    df: pd.DataFrame, columns: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """\
+    Convert numeric `columns` (all columns if None) of `df` to float32, in place.
+    """
+    if columns is None:
+        columns = df.columns
+    for column in columns:
+        if pd.api.types.is_numeric_dtype(df[column]) and not (
+            pd.api.types.is_bool_dtype(df[column])
+        ):
+            df[column] = df[column].astype(MARKER_DTYPE)
+    return df
+
+
+def select_features(
+    df: pd.DataFrame, ignore_columns: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """\
+    Return the non-ignored columns of `df`, with markers as float32.
+    """
+    if ignore_columns:
+        df = df.loc[:, ~df.columns.isin(ignore_columns)]
+    return downcast_markers(df.copy(deep=False))
+
+
+def read_data(
+    filename: str,
+    ignore_columns: Optional[Sequence[str]] = None,
+    downcast: bool = True,
+) -> Optional[pd.DataFrame]:
+    """\
+    Read in a delimited, Excel, Parquet, Feather, or HDF5 file containing data.
+
+    Parameters
+    ----------
+    filename
+        str
+    ignore_columns
+        Optional[Sequence[str]]
+        default = None.  Columns that are not read at all.
+    downcast
+        bool
+        default = True.  Store numeric columns that are read as float32.
+
+    Returns
+    -------
+    :class:`pandas.DataFrame`, or None if the file type is not recognized
+    """
+
+    # This is just here because I cannot rely on people giving me a csv
+    # no matter how many times I tell them Excel is crap
+
+    datafile = Path(filename)
+
+    if datafile.suffix not in SUPPORTED_SUFFIXES:
+        logging.error(
+            "That file type is unknown.  Please provide a CSV, TSV, XLSX, XLS, "
+            "Parquet, Feather, or HDF5 file to use."
+        )
+        return None
+
+    usecols = _usecols(filename, ignore_columns)
+
+    with stage("read", file=datafile.name):
+        if datafile.suffix in EXCEL_SUFFIXES:
+            df = pd.read_excel(datafile, usecols=usecols)
+        elif datafile.suffix in CSV_SUFFIXES:
+            df = _read_csv(datafile, usecols=usecols)
+        elif datafile.suffix in PARQUET_SUFFIXES:
+            df = pd.read_parquet(datafile, columns=usecols)
+        elif datafile.suffix in FEATHER_SUFFIXES:
+            df = pd.read_feather(datafile, columns=usecols)
+        else:
+            # only HDF5 files in "table" format support column selection
+            df = pd.read_hdf(datafile)
+            if usecols is not None:
+                df = df.loc[:, usecols]
+
+    if downcast:
+        downcast_markers(df)
+
+    return df
+
+
+def iter_data(
+    filename: str,
+    chunksize: int = 1_000_000,
+    ignore_columns: Optional[Sequence[str]] = None,
+    downcast: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """\
+    Read a data file in blocks of at most `chunksize` rows.
+
+    CSV and Parquet files are streamed from disk; the other formats are read
+    in full and then split.
+
+    Parameters
+    ----------
+    filename
+        str
+    chunksize
+        int
+        default = 1,000,000
+    ignore_columns
+        Optional[Sequence[str]]
+        default = None
+    downcast
+        bool
+        default = True
+
+    Yields
+    ------
+    :class:`pandas.DataFrame` blocks, in row order
+    """
+    datafile = Path(filename)
+
+    usecols = _usecols(filename, ignore_columns)
+
+    if datafile.suffix in CSV_SUFFIXES:
+        # the pyarrow engine cannot read in chunks
+        chunks = _read_csv(
+            datafile, engine="c", usecols=usecols, chunksize=chunksize
+        )
+    elif datafile.suffix in PARQUET_SUFFIXES:
+        import pyarrow.parquet as pq
+
+        chunks = (
+            batch.to_pandas()
+            for batch in pq.ParquetFile(datafile).iter_batches(
+                batch_size=chunksize, columns=usecols
+            )
+        )
+    else:
+        df = read_data(filename, ignore_columns=ignore_columns, downcast=False)
+        if df is None:
+            return
+        chunks = (
+            df.iloc[start : start + chunksize].copy()
+            for start in range(0, df.shape[0], chunksize)
+        )
+
+    for chunk in chunks:
+        yield downcast_markers(chunk) if downcast else chunk
@@ -1,58 +1,118 @@
+from typing import Any, Optional, Tuple, Union
+
 import logging
 
+import numpy as np
 import pandas as pd
 
+from .neighbors import NeighborGraph
+from .profiling import stage
+from .shared import SharedArray, SharedGraph, attach_shared
+
 # add Opt-SNE and/or openTSNE
 # add forceatlas2? Somehow work in PAGA?
 
 
-def perform_reducion(
-    df: pd.DataFrame, reduction: str = "umap", **kwargs
-) -> pd.DataFrame:
+def fit_reducer(
+    df: Union[pd.DataFrame, SharedArray],
+    reduction: str = "umap",
+    graph: Optional[Union[NeighborGraph, SharedGraph]] = None,
+    **kwargs,
+) -> Tuple[Any, np.ndarray]:
+    """\
+    Fit a dimensional reduction to `df`, returning the fitted object along
+    with the embeddings so that the former can later be used to place new
+    cells (see :mod:`mcr.model`).  See :func:`perform_reducion` for the
+    arguments.
+    """
+    if isinstance(df, SharedArray):
+        df = pd.DataFrame(df.attach(), copy=False)
+    graph = attach_shared(graph)
 
-    if reduction == "umap":
-        from umap import UMAP
+    with stage(f"reduction:{reduction}", cells=df.shape[0]):
+        if reduction == "umap":
+            from umap import UMAP
 
-        embeddings = UMAP(**kwargs).fit_transform(df)
-    elif reduction == "tsne":
-        from sklearn.manifold import TSNE
+            if graph is not None:
+                kwargs.setdefault("n_neighbors", graph.n_neighbors)
+                kwargs["precomputed_knn"] = (
+                    graph.knn_indices,
+                    graph.knn_dists,
+                    None,
+                )
+            reducer = UMAP(**kwargs)
+            embeddings = reducer.fit_transform(df)
+        elif reduction == "tsne":
+            from sklearn.manifold import TSNE
 
-        embeddings = TSNE(**kwargs).fit_transform(df)
-    elif reduction == "openTSNE":
-        try:
-            from openTSNE import TSNE
+            reducer = TSNE(**kwargs)
+            embeddings = reducer.fit_transform(df)
+        elif reduction == "openTSNE":
+            try:
+                from openTSNE import TSNE
 
-            embeddings = TSNE(**kwargs).fit(df.values)
-        except ImportError:
-            logging.error(
-                "The openTSNE module is not available.  Please ensure it is installed"
-            )
-    # elif reduction == "optTSNE":
-    #     try:
-    #         from MulticoreTSNE import MulticoreTSNE
-
-    #         embeddings = MulticoreTSNE(**kwargs).fit_transform(df)
-    #     except ImportError as error:
-    #         logging.error(
-    #             "The opt-SNE module is not available.  Please ensure it is installed"
-    #         )
-    elif reduction == "pacmap":
-        try:
-            from pacmap import PaCMAP
-
-            embeddings = PaCMAP(
-                n_dims=2, n_neighbors=None, MN_ratio=0.5, FP_ratio=2.0
-            ).fit_transform(df.values)
-        except ImportError:
+                # openTSNE returns a TSNEEmbedding, which is both the embeddings
+                # and the object that can transform new data
+                reducer = embeddings = TSNE(**kwargs).fit(df.values)
+            except ImportError:
+                logging.error(
+                    "The openTSNE module is not available.  Please ensure it is installed"
+                )
+        # elif reduction == "optTSNE":
+        #     try:
+        #         from MulticoreTSNE import MulticoreTSNE
+
+        #         embeddings = MulticoreTSNE(**kwargs).fit_transform(df)
+        #     except ImportError as error:
+        #         logging.error(
+        #             "The opt-SNE module is not available.  Please ensure it is installed"
+        #         )
+        elif reduction == "pacmap":
+            try:
+                from pacmap import PaCMAP
+
+                pacmap_kwargs = dict(
+                    n_dims=2, n_neighbors=None, MN_ratio=0.5, FP_ratio=2.0
+                )
+                pacmap_kwargs.update(kwargs)
+                reducer = PaCMAP(**pacmap_kwargs)
+                embeddings = reducer.fit_transform(df.values)
+            except ImportError:
+                logging.error(
+                    "The PaCMAP module is not available.  Please ensure it is installed"
+                )
+        else:
             logging.error(
-                "The PaCMAP module is not available.  Please ensure it is installed"
+                "That is not a recognized dimensional reduction algorithm"
             )
-    else:
-        logging.error(
-            "That is not a recognized dimensional reduction algorithm"
-        )
-        raise Exception
+            raise Exception
 
-    return pd.DataFrame(embeddings).rename(
+    return reducer, embeddings
+
+
+def embedding_frame(embeddings: np.ndarray, reduction: str) -> pd.DataFrame:
+    return pd.DataFrame(np.asarray(embeddings)).rename(
         columns={x: f"{reduction}_{x+1}" for x in range(embeddings.shape[1])}
     )
+
+
+def perform_reducion(
+    df: Union[pd.DataFrame, SharedArray],
+    reduction: str = "umap",
+    graph: Optional[Union[NeighborGraph, SharedGraph]] = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """\
+    Embed a cell-by-analyte :class:`~pd.DataFrame` in two dimensions.
+
+    If `graph` is given and `reduction` is "umap", its kNN indices and
+    distances are passed to UMAP as `precomputed_knn` so that the neighbor
+    search done for clustering (see :func:`~mcr.neighbors.build_neighbor_graph`)
+    is not repeated.  `graph` is ignored by the other methods.
+
+    `df` may also be a :class:`~mcr.shared.SharedArray` and `graph` a
+    :class:`~mcr.shared.SharedGraph`, which are attached to without copying,
+    so a worker process can be given the data without pickling it.
+    """
+    _, embeddings = fit_reducer(df, reduction, graph=graph, **kwargs)
+    return embedding_frame(embeddings, reduction)
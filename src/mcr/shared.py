@@ -0,0 +1,189 @@
+"""
+NumPy arrays in shared memory, for handing data to worker processes.
+
+Arguments sent to a process pool are pickled, so a feature matrix or neighbor
+graph given to every worker is copied through a pipe once per worker, at a
+cost that grows with the dataset.  :class:`SharedArrays` copies them once into
+:mod:`multiprocessing.shared_memory` segments and hands out small, picklable
+descriptors instead.  A worker attaches to the segments by name and gets
+arrays backed by the same pages, so starting it costs the same however large
+the data is.  Feature matrices (:class:`SharedArray`), sparse matrices
+(:class:`SharedCSR`), and whole neighbor graphs (:class:`SharedGraph`) can be
+shared, and :func:`~mcr.clustering.label_clusters`,
+:func:`~mcr.neighbors.build_neighbor_graph`, and
+:func:`~mcr.reduction.perform_reducion` accept their descriptors in place of
+the data.
+"""
+from typing import Dict, List, NamedTuple, Tuple
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse
+
+# segments this process has attached to, kept open for as long as it runs
+# since the arrays returned by attach() point into them
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    if name not in _attached:
+        try:
+            # only the owner should unlink the segment (Python >= 3.13)
+            segment = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # older versions register it with the resource tracker, which
+            # pool workers share with the owner, so nothing is unlinked early
+            segment = shared_memory.SharedMemory(name=name)
+        _attached[name] = segment
+    return _attached[name]
+
+
+class SharedArray(NamedTuple):
+    """\
+    Where to find a NumPy array in shared memory.
+
+    name
+        name of the shared memory segment
+    shape
+        shape of the array
+    dtype
+        dtype of the array, as a string
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    def attach(self) -> np.ndarray:
+        """\
+        The array, read-only and without copying.
+        """
+        segment = _attach_segment(self.name)
+        array = np.ndarray(
+            self.shape, dtype=np.dtype(self.dtype), buffer=segment.buf
+        )
+        array.flags.writeable = False
+        return array
+
+
+class SharedCSR(NamedTuple):
+    """\
+    Where to find the components of a :class:`scipy.sparse.csr_matrix` in
+    shared memory.
+    """
+
+    data: SharedArray
+    indices: SharedArray
+    indptr: SharedArray
+    shape: Tuple[int, int]
+
+    def attach(self) -> scipy.sparse.csr_matrix:
+        return scipy.sparse.csr_matrix(
+            (self.data.attach(), self.indices.attach(), self.indptr.attach()),
+            shape=self.shape,
+            copy=False,
+        )
+
+
+class SharedGraph(NamedTuple):
+    """\
+    Where to find the arrays of a :class:`~mcr.neighbors.NeighborGraph` in
+    shared memory.
+    """
+
+    knn_indices: SharedArray
+    knn_dists: SharedArray
+    connectivities: SharedCSR
+    key: str
+
+    def attach(self):
+        from .neighbors import NeighborGraph
+
+        return NeighborGraph(
+            knn_indices=self.knn_indices.attach(),
+            knn_dists=self.knn_dists.attach(),
+            connectivities=self.connectivities.attach(),
+            key=self.key,
+        )
+
+
+SHARED_TYPES = (SharedArray, SharedCSR, SharedGraph)
+
+
+def attach_shared(obj):
+    """\
+    Attach `obj` if it is a :class:`SharedArray`, :class:`SharedCSR`, or
+    :class:`SharedGraph`, and return anything else unchanged.
+    """
+    return obj.attach() if isinstance(obj, SHARED_TYPES) else obj
+
+
+class SharedArrays:
+    """\
+    Owner of the shared memory segments behind a set of descriptors.
+
+    The segments are removed when the owner is closed, which should only
+    happen once the workers using them are done; use it as a context manager
+    around the process pool::
+
+        with SharedArrays() as shared:
+            X = shared.array(X)
+            with ProcessPoolExecutor(initargs=(X,), ...) as executor:
+                ...
+    """
+
+    def __init__(self):
+        self._segments: List[shared_memory.SharedMemory] = []
+
+    def array(self, array: np.ndarray) -> SharedArray:
+        """\
+        Copy `array` into a new segment.
+        """
+        array = np.ascontiguousarray(array)
+        # segments cannot be empty
+        segment = shared_memory.SharedMemory(
+            create=True, size=max(array.nbytes, 1)
+        )
+        self._segments.append(segment)
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+        view[...] = array
+        # the segment cannot be closed while a view of it exists
+        del view
+        return SharedArray(segment.name, array.shape, array.dtype.str)
+
+    def csr(self, matrix) -> SharedCSR:
+        """\
+        Copy the components of the sparse `matrix` into new segments.
+        """
+        matrix = scipy.sparse.csr_matrix(matrix)
+        return SharedCSR(
+            data=self.array(matrix.data),
+            indices=self.array(matrix.indices),
+            indptr=self.array(matrix.indptr),
+            shape=matrix.shape,
+        )
+
+    def graph(self, graph) -> SharedGraph:
+        """\
+        Copy the arrays of a :class:`~mcr.neighbors.NeighborGraph` into new
+        segments.
+        """
+        return SharedGraph(
+            knn_indices=self.array(graph.knn_indices),
+            knn_dists=self.array(graph.knn_dists),
+            connectivities=self.csr(graph.connectivities),
+            key=graph.key,
+        )
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,267 @@
+"""
+Per-session, on-disk storage of tables for the Dash GUI.
+
+Every browser session gets its own directory, in which tables are kept as
+uncompressed Arrow IPC (Feather v2) files.  These are memory-mapped when read,
+so callbacks refer to data by session and name and only pull in the columns
+they need, rather than holding full copies in module globals shared by every
+user of the server.  Sessions that have not been used for `max_age` seconds are
+removed, as are the least recently used ones if the store grows beyond
+`max_bytes`.
+"""
+from typing import Iterable, List, Optional, Sequence, Union
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def is_valid_name(name: str) -> bool:
+    """\
+    Whether `name` can be used as a session id or file name in the store,
+    i.e. cannot step outside of its directory.
+    """
+    return bool(_SAFE_NAME.match(name)) and name not in (".", "..")
+
+
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+class SessionStore:
+    """\
+    Tables stored on local disk, keyed by session id and name.
+
+    Parameters
+    ----------
+    root
+        Optional[Union[str, Path]]
+        default = None, a directory named "mcr-sessions" in the system
+        temporary directory
+    max_age
+        float
+        default = 24 hours.  Seconds since last use after which a session
+        is removed.
+    max_bytes
+        int
+        default = 50 GiB
+    """
+
+    def __init__(
+        self,
+        root: Optional[Union[str, Path]] = None,
+        max_age: float = 24 * 60 * 60,
+        max_bytes: int = 50 * 1024**3,
+    ):
+        if root is None:
+            root = Path(tempfile.gettempdir(), "mcr-sessions")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def session_dir(self, session_id: str, create: bool = False) -> Path:
+        """\
+        The directory of `session_id`, which is only created if `create` is
+        true, so that looking up an unknown session leaves nothing behind.
+        """
+        if not is_valid_name(session_id):
+            raise ValueError(f"{session_id} is not a valid session id")
+        path = self.root / session_id
+        if create:
+            path.mkdir(exist_ok=True)
+        return path
+
+    def _path(self, session_id: str, name: str, create: bool = False) -> Path:
+        if not is_valid_name(name):
+            raise ValueError(f"{name} is not a valid table name")
+        return self.session_dir(session_id, create) / f"{name}.arrow"
+
+    def has(self, session_id: Optional[str], name: str) -> bool:
+        return session_id is not None and self._path(session_id, name).exists()
+
+    def put(self, session_id: str, name: str, df: pd.DataFrame) -> None:
+        """\
+        Store `df` as `name`, replacing any table of that name.
+        """
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        path = self._path(session_id, name, create=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        table = pa.Table.from_pandas(
+            df.reset_index(drop=True), preserve_index=False
+        )
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        # readers holding a memory map of the old file keep their view of it
+        os.replace(tmp_path, path)
+        self.evict(keep=session_id)
+
+    def put_chunks(
+        self, session_id: str, name: str, chunks: Iterable[pd.DataFrame]
+    ) -> int:
+        """\
+        Store the concatenation of the frames in `chunks` as `name`, holding
+        only one of them in memory at a time.
+
+        Returns
+        -------
+        the number of rows stored
+        """
+        import pyarrow as pa
+
+        path = self._path(session_id, name, create=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        n_rows = 0
+        writer = schema = None
+        try:
+            for chunk in chunks:
+                batch = pa.Table.from_pandas(
+                    chunk.reset_index(drop=True), preserve_index=False
+                )
+                if writer is None:
+                    schema = batch.schema
+                    writer = pa.ipc.new_file(str(tmp_path), schema)
+                else:
+                    # e.g. a column of integers in one chunk and floats in
+                    # another; the first chunk decides
+                    batch = batch.cast(schema)
+                writer.write_table(batch)
+                n_rows += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError(f"no data to store as {name}")
+        os.replace(tmp_path, path)
+        self.evict(keep=session_id)
+        return n_rows
+
+    def get_table(
+        self,
+        session_id: Optional[str],
+        name: str,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        """\
+        Memory-mapped :class:`pyarrow.Table` stored as `name`, or None.
+        """
+        import pyarrow as pa
+
+        if not self.has(session_id, name):
+            return None
+        path = self._path(session_id, name)
+        os.utime(path.parent)
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(list(columns))
+        return table
+
+    def get(
+        self,
+        session_id: Optional[str],
+        name: str,
+        columns: Optional[Sequence[str]] = None,
+    ) -> Optional[pd.DataFrame]:
+        """\
+        The table stored as `name` as a :class:`pandas.DataFrame`, or None.
+        """
+        table = self.get_table(session_id, name, columns)
+        return None if table is None else table.to_pandas()
+
+    def get_column(
+        self, session_id: Optional[str], name: str, column: str
+    ) -> Optional[np.ndarray]:
+        """\
+        A single column as a NumPy array, without copying when possible.
+        """
+        table = self.get_table(session_id, name, [column])
+        if table is None:
+            return None
+        return table.column(0).to_numpy()
+
+    def columns(self, session_id: Optional[str], name: str) -> List[str]:
+        import pyarrow.ipc as ipc
+
+        if not self.has(session_id, name):
+            return []
+        with ipc.open_file(self._path(session_id, name)) as reader:
+            return list(reader.schema.names)
+
+    def stat(
+        self, session_id: Optional[str], name: str
+    ) -> Optional[os.stat_result]:
+        """\
+        File status of the table stored as `name`, or None.  Tables are
+        replaced rather than modified in place, so its size and modification
+        time change whenever the table does.
+        """
+        if not self.has(session_id, name):
+            return None
+        return self._path(session_id, name).stat()
+
+    def n_rows(self, session_id: Optional[str], name: str) -> int:
+        # the table is memory-mapped, so this does not read its contents
+        table = self.get_table(session_id, name)
+        return 0 if table is None else table.num_rows
+
+    def add_columns(self, session_id: str, name: str, df: pd.DataFrame) -> None:
+        """\
+        Add (or replace) the columns of `df` in the table stored as `name`,
+        creating it if it does not exist.
+        """
+        with self._lock:
+            existing = self.get(session_id, name)
+            if existing is None:
+                combined = df
+            else:
+                existing = existing.drop(columns=df.columns, errors="ignore")
+                combined = pd.concat(
+                    [existing, df.reset_index(drop=True)], axis=1
+                )
+            self.put(session_id, name, combined)
+
+    def delete(self, session_id: str, name: str) -> None:
+        self._path(session_id, name).unlink(missing_ok=True)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """\
+        Remove sessions that are too old, then the least recently used ones
+        until the store fits in `max_bytes`.  The session `keep`, usually the
+        one just written to, is never removed, even if it alone is larger
+        than `max_bytes`.
+        """
+        now = time.time()
+        sessions = []
+        for session in self.root.iterdir():
+            if not session.is_dir() or session.name == keep:
+                continue
+            last_used = session.stat().st_mtime
+            if now - last_used > self.max_age:
+                logging.info(f"removing expired session {session.name}")
+                shutil.rmtree(session, ignore_errors=True)
+                continue
+            size = _directory_size(session)
+            sessions.append((last_used, size, session))
+
+        used = sum(size for _, size, _ in sessions)
+        if keep is not None:
+            used += _directory_size(self.root / keep)
+        for _, size, session in sorted(sessions, key=lambda x: x[0]):
+            if used <= self.max_bytes:
+                break
+            logging.info(f"removing session {session.name} to free space")
+            shutil.rmtree(session, ignore_errors=True)
+            used -= size
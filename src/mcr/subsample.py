@@ -0,0 +1,176 @@
+"""
+Representative subsampling of cells and label transfer back to all cells.
+
+Clustering a few hundred thousand well-chosen cells and letting every other
+cell take the majority cluster of its nearest sampled neighbors is far cheaper
+than running Leiden on a multi-million cell graph; see the `subsample`
+argument of :func:`~mcr.clustering.label_clusters`.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+SUBSAMPLE_STRATEGIES = ["uniform", "geometric", "density"]
+
+
+def _principal_components(X: np.ndarray, n_components: int) -> np.ndarray:
+    centered = X - X.mean(axis=0)
+    # the covariance of a cytometry panel is only markers x markers, so an
+    # eigendecomposition is much cheaper than an SVD of the data
+    _, vectors = np.linalg.eigh(np.cov(centered, rowvar=False))
+    return centered @ vectors[:, ::-1][:, :n_components]
+
+
+def _geometric_sample(
+    X: np.ndarray, n: int, rng: np.random.Generator, n_components: int = 10
+) -> np.ndarray:
+    # geometric sketching (Hie et al., 2019): cover the data with equal-sized
+    # boxes and take cells from each occupied box in turn, so that rare
+    # populations are represented about as well as abundant ones
+    projected = _principal_components(X, min(n_components, X.shape[1]))
+    projected -= projected.min(axis=0)
+    multipliers = rng.integers(1, 2**31, size=projected.shape[1])
+
+    def occupied_boxes(side: float):
+        boxes = np.floor(projected / side).astype(np.int64)
+        return np.unique(boxes @ multipliers, return_inverse=True)
+
+    # the largest box size that still gives at least `n` occupied boxes
+    low, high = 0.0, float(projected.max()) or 1.0
+    for _ in range(30):
+        side = (low + high) / 2
+        if len(occupied_boxes(side)[0]) >= n:
+            low = side
+        else:
+            high = side
+    if low > 0:
+        _, box_ids = occupied_boxes(low)
+    else:
+        box_ids = np.arange(len(X))
+
+    # rank of each cell within its box, in random order; taking cells by rank
+    # takes one from every box before taking a second from any
+    order = rng.permutation(len(X))
+    order = order[np.argsort(box_ids[order], kind="stable")]
+    sorted_ids = box_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    box_sizes = np.diff(np.r_[starts, len(X)])
+    ranks = np.arange(len(X)) - np.repeat(starts, box_sizes)
+    by_rank = order[np.lexsort((rng.random(len(X)), ranks))]
+    return by_rank[:n]
+
+
+def _density_sample(
+    X: np.ndarray, n: int, rng: np.random.Generator, n_neighbors: int = 10
+) -> np.ndarray:
+    # density-dependent downsampling: the chance of keeping a cell grows with
+    # the distance to its k-th nearest neighbor, thinning out dense
+    # populations while keeping sparse ones
+    from sklearn.neighbors import NearestNeighbors
+
+    dists, _ = (
+        NearestNeighbors(n_neighbors=n_neighbors, algorithm="kd_tree")
+        .fit(X)
+        .kneighbors(X)
+    )
+    weights = dists[:, -1].astype(np.float64)
+    weights[weights == 0] = weights[weights > 0].min(initial=1.0)
+    return rng.choice(len(X), size=n, replace=False, p=weights / weights.sum())
+
+
+def subsample_cells(
+    X: np.ndarray,
+    n: int,
+    strategy: str = "uniform",
+    random_state: Optional[int] = None,
+) -> np.ndarray:
+    """\
+    Choose `n` representative rows of `X`.
+
+    Parameters
+    ----------
+    X
+        :class:`numpy.ndarray` of cells by markers
+    n
+        int
+    strategy
+        str
+        default = "uniform".  One of
+
+        - "uniform": every cell is equally likely to be chosen
+        - "geometric": geometric sketching, sampling evenly across the space
+          the cells occupy rather than in proportion to population size
+        - "density": cells in sparse regions are more likely to be chosen
+    random_state
+        Optional[int]
+        default = None
+
+    Returns
+    -------
+    sorted array of row indices
+    """
+    rng = np.random.default_rng(random_state)
+    if n >= X.shape[0]:
+        return np.arange(X.shape[0])
+
+    if strategy == "uniform":
+        chosen = rng.choice(X.shape[0], size=n, replace=False)
+    elif strategy == "geometric":
+        chosen = _geometric_sample(X, n, rng)
+    elif strategy == "density":
+        chosen = _density_sample(X, n, rng)
+    else:
+        raise ValueError(
+            f"{strategy} is not a recognized subsampling strategy.  Choose "
+            f"one of {', '.join(SUBSAMPLE_STRATEGIES)}."
+        )
+    return np.sort(chosen)
+
+
+def transfer_labels(
+    X: np.ndarray,
+    sampled: np.ndarray,
+    sampled_labels: np.ndarray,
+    n_neighbors: int = 15,
+) -> np.ndarray:
+    """\
+    Extend labels known for the rows `sampled` of `X` to every row, by majority
+    vote of the `n_neighbors` nearest sampled rows.
+    """
+    from sklearn.neighbors import KNeighborsClassifier
+
+    labels = np.empty(X.shape[0], dtype=sampled_labels.dtype)
+    labels[sampled] = sampled_labels
+
+    rest = np.ones(X.shape[0], dtype=bool)
+    rest[sampled] = False
+    if rest.any():
+        classifier = KNeighborsClassifier(
+            n_neighbors=min(n_neighbors, len(sampled)), n_jobs=-1
+        ).fit(X[sampled], sampled_labels)
+        labels[rest] = classifier.predict(X[rest])
+    return labels
+
+
+def compare_partitions(
+    reference: np.ndarray, other: np.ndarray
+) -> Dict[str, float]:
+    """\
+    Agreement between two clusterings of the same cells.
+
+    Returns
+    -------
+    dictionary with the adjusted Rand index ("ari"), normalized mutual
+    information ("nmi"), and the number of clusters in each partition
+    """
+    from sklearn.metrics import (
+        adjusted_rand_score,
+        normalized_mutual_info_score,
+    )
+
+    return {
+        "ari": adjusted_rand_score(reference, other),
+        "nmi": normalized_mutual_info_score(reference, other),
+        "reference_clusters": len(np.unique(reference)),
+        "other_clusters": len(np.unique(other)),
+    }
@@ -0,0 +1,188 @@
+"""
+Getting large data files into the Dash GUI.
+
+`dcc.Upload` sends a file as a single base64-encoded request that is decoded in
+memory, which limits it to files far smaller than a large cytometry export.
+The routes added by :func:`register_upload_routes` instead accept a file in
+chunks (sent by ``assets/chunked_upload.js``) and append each one straight to
+a file in the session's directory, so neither the server's memory use nor
+the request size depends on the size of the file, and an interrupted upload
+resumes from the last chunk received.  Files already on the server can be
+loaded by path instead, from the directories listed in `MCR_DATA_DIRS`.
+Either way, :func:`import_file` then streams the file into the session store
+in blocks of rows.
+"""
+from typing import List, Optional
+
+import logging
+import os
+from pathlib import Path
+
+from .readers import SUPPORTED_SUFFIXES, iter_data
+from .store import SessionStore, is_valid_name
+
+UPLOAD_PREFIX = "upload:"
+CHUNK_LIMIT = 64 * 1024**2
+_COPY_BUFFER = 1024**2
+
+
+def upload_dir(store: SessionStore, session_id: str) -> Path:
+    path = store.session_dir(session_id, create=True) / "uploads"
+    path.mkdir(exist_ok=True)
+    return path
+
+
+def _part_path(store: SessionStore, session_id: str, upload_id: str) -> Path:
+    if not is_valid_name(upload_id):
+        raise ValueError(f"{upload_id} is not a valid upload id")
+    return upload_dir(store, session_id) / f"{upload_id}.part"
+
+
+def data_dirs() -> List[Path]:
+    """\
+    Directories that files may be loaded from by path; those listed in the
+    `MCR_DATA_DIRS` environment variable, or the working directory.
+    """
+    dirs = os.environ.get("MCR_DATA_DIRS")
+    if dirs:
+        return [Path(d).resolve() for d in dirs.split(os.pathsep) if d]
+    return [Path.cwd().resolve()]
+
+
+def resolve_data_path(
+    store: SessionStore, session_id: str, location: str
+) -> Path:
+    """\
+    The file named by `location`: either the token returned for a finished
+    chunked upload, or the path of a file on the server.
+
+    Raises
+    ------
+    ValueError
+        if the file does not exist, is not a supported type, or lies outside
+        the allowed data directories
+    """
+    location = location.strip()
+    if location.startswith(UPLOAD_PREFIX):
+        name = location[len(UPLOAD_PREFIX) :]
+        if not is_valid_name(name):
+            raise ValueError(f"{name} is not a valid upload")
+        path = upload_dir(store, session_id) / name
+    else:
+        path = Path(location).expanduser().resolve()
+        if not any(d == path or d in path.parents for d in data_dirs()):
+            raise ValueError(
+                f"{path} is not in one of the data directories "
+                f"({', '.join(str(d) for d in data_dirs())}); set "
+                f"MCR_DATA_DIRS to allow others."
+            )
+    if path.suffix not in SUPPORTED_SUFFIXES:
+        raise ValueError(f"{path.suffix} is not a supported file type")
+    if not path.is_file():
+        raise ValueError(f"{path} does not exist")
+    return path
+
+
+def import_file(
+    store: SessionStore,
+    session_id: str,
+    name: str,
+    path: Path,
+    chunksize: int = 250_000,
+) -> int:
+    """\
+    Stream the data file at `path` into the table `name` of a session.
+
+    Columns keep the types they were read with, so that integer IDs above
+    2**24 survive; markers are converted to float32 when they are analyzed.
+
+    Returns
+    -------
+    the number of rows read
+    """
+    logging.critical(f"importing {path}")
+    return store.put_chunks(
+        session_id,
+        name,
+        iter_data(str(path), chunksize=chunksize, downcast=False),
+    )
+
+
+def register_upload_routes(server, store: SessionStore) -> None:
+    """\
+    Add the chunked upload endpoints to the GUI's Flask `server`:
+
+    - ``GET mcr-upload/<session>/<upload>``: the number of bytes received
+    - ``PUT mcr-upload/<session>/<upload>?offset=<n>``: append a chunk, which
+      must start where the received bytes end
+    - ``POST mcr-upload/<session>/<upload>/complete``: finish the upload of
+      the file named in the JSON body, returning the token to load it by
+    """
+    from flask import jsonify, request
+
+    def received(session_id, upload_id):
+        try:
+            part = _part_path(store, session_id, upload_id)
+        except ValueError as error:
+            return None, (jsonify(error=str(error)), 400)
+        return part, None
+
+    @server.route("/mcr-upload/<session_id>/<upload_id>", methods=["GET"])
+    def upload_status(session_id, upload_id):
+        part, error = received(session_id, upload_id)
+        if error:
+            return error
+        return jsonify(received=part.stat().st_size if part.exists() else 0)
+
+    @server.route("/mcr-upload/<session_id>/<upload_id>", methods=["PUT"])
+    def upload_chunk(session_id, upload_id):
+        part, error = received(session_id, upload_id)
+        if error:
+            return error
+        size = part.stat().st_size if part.exists() else 0
+        offset = request.args.get("offset", type=int)
+        if offset != size:
+            # a retried or out-of-order chunk; the client resumes from `size`
+            return jsonify(received=size), 409
+
+        written = 0
+        with open(part, "ab") as fh:
+            while written < CHUNK_LIMIT:
+                buffer = request.stream.read(
+                    min(_COPY_BUFFER, CHUNK_LIMIT - written)
+                )
+                if not buffer:
+                    break
+                fh.write(buffer)
+                written += len(buffer)
+        return jsonify(received=size + written)
+
+    @server.route(
+        "/mcr-upload/<session_id>/<upload_id>/complete", methods=["POST"]
+    )
+    def upload_complete(session_id, upload_id):
+        part, error = received(session_id, upload_id)
+        if error:
+            return error
+        filename = (request.get_json() or {}).get("filename", "")
+        suffix = Path(filename).suffix.lower()
+        if suffix not in SUPPORTED_SUFFIXES or not part.exists():
+            return jsonify(error=f"cannot load {filename}"), 400
+        name = f"{upload_id}{suffix}"
+        os.replace(part, part.with_name(name))
+        return jsonify(path=f"{UPLOAD_PREFIX}{name}")
+
+
+def save_upload(
+    store: SessionStore, session_id: str, filename: str, contents: bytes
+) -> Optional[Path]:
+    """\
+    Write the decoded contents of a `dcc.Upload` to the session's upload
+    directory, so it is read the same way as a chunked upload.
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix not in SUPPORTED_SUFFIXES:
+        return None
+    path = upload_dir(store, session_id) / f"dcc-upload{suffix}"
+    path.write_bytes(contents)
+    return path
@@ -0,0 +1,120 @@
+"""
+Writing results to disk.
+
+Results can be written as CSV, Parquet, or Feather, chosen by the suffix of the
+output file.  Rather than rewriting the entire input table to add a cluster or
+embedding column, results can also be written as a *sidecar*: a table holding
+only the new columns plus a row key, which :func:`read_with_sidecars` joins
+back onto the source.
+"""
+from typing import Optional, Union
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .profiling import stage
+from .readers import CSV_SUFFIXES, FEATHER_SUFFIXES, PARQUET_SUFFIXES, read_data
+
+SIDECAR_INDEX = "mcr_row"
+SIDECAR_SOURCE_KEY = b"mcr.source"
+
+
+def _to_arrow(df: pd.DataFrame, index: bool, source: Optional[str] = None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=index)
+    if source is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[SIDECAR_SOURCE_KEY] = str(source).encode()
+        table = table.replace_schema_metadata(metadata)
+    return table
+
+
+def write_table(
+    df: pd.DataFrame,
+    filename: Union[str, Path],
+    index: bool = False,
+    source: Optional[str] = None,
+) -> None:
+    """\
+    Write `df` to `filename` in the format given by its suffix.
+
+    Parameters
+    ----------
+    df
+        :class:`pandas.DataFrame`
+    filename
+        Union[str, Path]
+        ".csv", ".tsv", and ".txt" files are delimited text; ".parquet"/".pq"
+        and ".feather"/".arrow"/".ipc" files are written with pyarrow.
+    index
+        bool
+        default = False.  Also write the index of `df`.
+    source
+        Optional[str]
+        default = None.  Recorded in the schema metadata of Parquet and
+        Feather files as the table the rows belong to.
+    """
+    path = Path(filename)
+
+    with stage("write", file=path.name, rows=df.shape[0]):
+        if path.suffix in PARQUET_SUFFIXES:
+            import pyarrow.parquet as pq
+
+            pq.write_table(_to_arrow(df, index, source), path)
+        elif path.suffix in FEATHER_SUFFIXES:
+            import pyarrow.feather as feather
+
+            # uncompressed, so that the file can be memory-mapped when read
+            feather.write_feather(
+                _to_arrow(df, index, source),
+                path,
+                compression="uncompressed",
+            )
+        elif path.suffix in CSV_SUFFIXES:
+            df.to_csv(
+                path, sep="\t" if path.suffix == ".tsv" else ",", index=index
+            )
+        else:
+            raise ValueError(
+                f"{path.suffix} is not a supported output type"
+            )
+
+
+def write_sidecar(
+    new_columns: pd.DataFrame,
+    filename: Union[str, Path],
+    source: Optional[str] = None,
+) -> None:
+    """\
+    Write only `new_columns`, keyed by row position, instead of rewriting the
+    source table with them appended.
+
+    Parameters
+    ----------
+    new_columns
+        :class:`pandas.DataFrame` with one row per row of the source table
+    filename
+        Union[str, Path]
+    source
+        Optional[str]
+        default = None.  The table `new_columns` belongs to.
+    """
+    sidecar = new_columns.reset_index(drop=True)
+    sidecar.insert(0, SIDECAR_INDEX, np.arange(sidecar.shape[0]))
+    write_table(sidecar, filename, index=False, source=source)
+
+
+def read_with_sidecars(
+    source: Union[str, Path], *sidecars: Union[str, Path]
+) -> pd.DataFrame:
+    """\
+    Read `source` and join the columns of each sidecar file onto it.
+    """
+    df = read_data(source, downcast=False).reset_index(drop=True)
+    for sidecar in sidecars:
+        columns = read_data(sidecar, downcast=False).set_index(SIDECAR_INDEX)
+        df = df.join(columns)
+    return df
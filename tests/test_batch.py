@@ -0,0 +1,32 @@
+import os
+
+from mcr.batch import collect_inputs, is_up_to_date, output_paths
+
+
+def test_inputs_from_globs_and_manifest(tmp_path):
+    for name in ("a.csv", "b.csv", "c.parquet"):
+        (tmp_path / name).touch()
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# samples\nc.parquet\n\na.csv\n")
+
+    files = collect_inputs([str(tmp_path / "*.csv")], str(manifest))
+    assert [f.name for f in files] == ["a.csv", "b.csv", "c.parquet"]
+
+
+def test_outputs_with_the_same_name_are_kept_apart(tmp_path):
+    files = [tmp_path / "x" / "s1.csv", tmp_path / "y" / "s1.csv"]
+    outputs = output_paths(files, tmp_path / "out")
+    assert len(set(outputs)) == 2
+    assert all(o.name.startswith("s1-") for o in outputs)
+
+
+def test_outputs_are_redone_when_stale_or_made_differently(tmp_path):
+    data_file, output = tmp_path / "s1.csv", tmp_path / "s1.mcr.parquet"
+    data_file.touch()
+    output.touch()
+    state = {output.name: "settings"}
+    assert is_up_to_date(data_file, output, "settings", state)
+    assert not is_up_to_date(data_file, output, "other settings", state)
+
+    os.utime(data_file, (output.stat().st_mtime + 10,) * 2)
+    assert not is_up_to_date(data_file, output, "settings", state)
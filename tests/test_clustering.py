@@ -0,0 +1,113 @@
+import igraph as ig
+import numpy as np
+import pytest
+import pandas as pd
+import scipy.sparse
+from click.testing import CliRunner
+
+from mcr.cli import main
+from mcr.clustering import (
+    graph_from_adjacency,
+    label_clusters,
+    label_clusters_sweep,
+)
+from mcr.neighbors import build_neighbor_graph
+
+RESOLUTIONS = [0.2, 0.6, 1.0]
+
+
+def _symmetric_adjacency(n_cells=60, seed=0):
+    rng = np.random.default_rng(seed)
+    upper = scipy.sparse.random(
+        n_cells, n_cells, density=0.1, random_state=rng, format="csr"
+    )
+    upper = scipy.sparse.triu(upper, k=1)
+    return (upper + upper.T).tocsr()
+
+
+def _blobs(n_cells=300, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 5, size=(3, 5))
+    return pd.DataFrame(
+        np.concatenate(
+            [c + rng.normal(size=(n_cells // 3, 5)) for c in centers]
+        ),
+        columns=[f"marker_{i}" for i in range(5)],
+    )
+
+
+def _legacy_graph(adjacency):
+    # the construction graph_from_adjacency replaced: one undirected edge
+    # per nonzero entry, so each pair of cells appears twice
+    sources, targets = adjacency.nonzero()
+    g = ig.Graph(n=adjacency.shape[0], edges=list(zip(sources, targets)))
+    g.es["weight"] = np.asarray(adjacency[sources, targets]).ravel()
+    return g
+
+
+def test_graph_from_adjacency_merges_symmetric_entries():
+    adjacency = _symmetric_adjacency()
+    g, weights = graph_from_adjacency(adjacency)
+
+    assert not g.is_directed()
+    assert g.ecount() == adjacency.nnz // 2
+    assert len(weights) == g.ecount()
+    # each edge carries adjacency[i, j] + adjacency[j, i]
+    assert weights.sum() == pytest.approx(adjacency.sum())
+    for (i, j), weight in zip(g.get_edgelist()[:20], weights[:20]):
+        assert weight == pytest.approx(2 * adjacency[i, j])
+
+    legacy = _legacy_graph(adjacency)
+    membership = np.random.default_rng(1).integers(0, 4, g.vcount())
+    assert g.modularity(membership, weights=weights) == pytest.approx(
+        legacy.modularity(membership, weights="weight")
+    )
+
+
+def test_sweep_matches_single_resolutions():
+    graph = build_neighbor_graph(_blobs(), n_neighbors=15, random_state=0)
+    sweep = label_clusters_sweep(resolutions=RESOLUTIONS, graph=graph, n_jobs=1)
+
+    assert list(sweep.columns) == [f"res_{r}" for r in RESOLUTIONS]
+    for r in RESOLUTIONS:
+        single = label_clusters(resolution=r, graph=graph, use_cache=False)
+        np.testing.assert_array_equal(sweep[f"res_{r}"], single)
+
+
+def test_sweep_is_the_same_in_parallel():
+    graph = build_neighbor_graph(_blobs(), n_neighbors=15, random_state=0)
+    serial = label_clusters_sweep(
+        resolutions=RESOLUTIONS, graph=graph, n_jobs=1
+    )
+    parallel = label_clusters_sweep(
+        resolutions=RESOLUTIONS, graph=graph, n_jobs=2
+    )
+
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_cli_cluster_cells_at_several_resolutions(tmp_path, monkeypatch):
+    # the CLI writes its log to the working directory
+    monkeypatch.chdir(tmp_path)
+    _blobs().to_csv(tmp_path / "cells.csv", index=False)
+
+    result = CliRunner().invoke(
+        main,
+        [
+            "cluster-cells",
+            "--data_file",
+            str(tmp_path / "cells.csv"),
+            "--output",
+            str(tmp_path / "clusters.csv"),
+            "--resolutions",
+            ",".join(str(r) for r in RESOLUTIONS),
+            "--n_jobs",
+            "2",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # added to the source columns by default
+    clusters = pd.read_csv(tmp_path / "clusters.csv")
+    assert list(clusters.columns[-3:]) == [f"res_{r}" for r in RESOLUTIONS]
+    assert len(clusters) == 300
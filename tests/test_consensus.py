@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from mcr.clustering import (
+    CONSENSUS_METHODS,
+    cluster_stability,
+    label_clusters_consensus,
+)
+
+
+def test_stability_is_the_mean_best_jaccard_index():
+    membership = [0, 0, 0, 0, 1, 1, 1, 1]
+    runs = [membership, [0, 0, 0, 1, 1, 1, 1, 1]]
+    stability = cluster_stability(membership, runs).set_index("cluster")
+
+    assert stability["size"].tolist() == [4, 4]
+    # cluster 0 matches exactly, then 3 of the 4 cells
+    assert stability.loc[0, "stability"] == pytest.approx((1 + 3 / 4) / 2)
+    assert stability.loc[1, "stability"] == pytest.approx((1 + 4 / 5) / 2)
+
+
+@pytest.mark.parametrize("method", CONSENSUS_METHODS)
+def test_consensus_separates_blobs(method):
+    rng = np.random.default_rng(0)
+    X = np.r_[rng.normal(size=(100, 5)), rng.normal(size=(100, 5)) + 20]
+    result = label_clusters_consensus(
+        X, resolution=0.1, n_seeds=3, method=method, n_jobs=1, use_cache=False
+    )
+
+    assert len(result.qualities) == 3
+    assert result.membership[0] != result.membership[-1]
+    assert (result.stability["stability"] > 0.9).all()
@@ -0,0 +1,23 @@
+import io
+
+import pandas as pd
+import pytest
+
+from mcr.downloads import stream_tables
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_tables_are_joined_and_streamed_in_blocks(fmt):
+    data = pa.table({"CD3": [float(i) for i in range(10)]})
+    embeddings = pa.table({"UMAP_1": [i / 10 for i in range(10)]})
+    clusters = pa.table({"res_0.6": [i % 3 for i in range(10)]})
+
+    pieces = list(stream_tables([data, embeddings, clusters], fmt, 4))
+    assert len(pieces) > 3
+
+    read = pd.read_csv if fmt == "csv" else pd.read_parquet
+    result = read(io.BytesIO(b"".join(pieces)))
+    assert result.columns.tolist() == ["CD3", "UMAP_1", "res_0.6"]
+    assert result["res_0.6"].tolist() == [i % 3 for i in range(10)]
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def test_import_does_not_load_gui_or_clustering_libraries():
+    code = (
+        "import sys, mcr, mcr.cli\n"
+        "print(' '.join(m for m in ('dash', 'igraph', 'leidenalg', 'umap') "
+        "if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_submodules_are_loaded_on_attribute_access():
+    import mcr
+
+    assert mcr.reduction.perform_reducion
+    assert "reduction" in dir(mcr)
+
+
+def test_gui_state_is_created_by_the_app_factory(tmp_path):
+    pytest.importorskip("dash")
+    sessions = tmp_path / "sessions"
+    code = (
+        "import os, dash, mcr.dash_gui\n"
+        "print(len(dash._callback.GLOBAL_CALLBACK_LIST), "
+        "os.path.exists(os.environ['MCR_SESSION_DIR']))\n"
+        "app = mcr.dash_gui.create_app()\n"
+        "print(len(app.callback_map) > 0, "
+        "os.path.exists(os.environ['MCR_SESSION_DIR']))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=dict(os.environ, MCR_SESSION_DIR=str(sessions)),
+    )
+    assert result.stdout.split("\n")[:2] == ["0 False", "True True"]
@@ -0,0 +1,23 @@
+import json
+
+from mcr import jit
+
+
+def test_cache_is_keyed_by_installed_versions(tmp_path, monkeypatch):
+    monkeypatch.setenv("MCR_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("NUMBA_CACHE_DIR", raising=False)
+
+    directory = jit.configure_cache()
+    assert directory.parent == tmp_path / "numba"
+    assert directory.is_dir()
+    assert jit.cache_status()["warm"] is False
+
+    (directory / jit.MANIFEST).write_text(
+        json.dumps({"versions": jit.installed_versions()})
+    )
+    assert jit.cache_status()["warm"] is True
+
+    stale = tmp_path / "numba" / "0123456789abcdef"
+    stale.mkdir()
+    assert jit.prune() == 1
+    assert not stale.exists() and directory.exists()
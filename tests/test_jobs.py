@@ -0,0 +1,95 @@
+import time
+
+import pandas as pd
+import pytest
+
+from mcr import jobs as jobs_module
+from mcr.jobs import JobManager
+from mcr.store import SessionStore
+
+
+def _double_job(session_id, source, result, columns, factor=2, delay=0.0):
+    time.sleep(delay)
+    store = jobs_module._worker_store
+    df = store.get(session_id, source, columns=columns)
+    store.put(session_id, result, (df * factor).add_suffix(f"_x{factor}"))
+    return result, {}
+
+
+def _missing_result_job(session_id, source, result, columns):
+    return result, {}
+
+
+def _wait(job, timeout=60):
+    # jobs stay active until their results are merged, or they fail
+    deadline = time.time() + timeout
+    while job.active:
+        assert time.time() < deadline, f"{job.kind} job did not finish"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setitem(jobs_module.JOB_KINDS, "double", _double_job)
+    monkeypatch.setitem(
+        jobs_module.JOB_KINDS, "missing_result", _missing_result_job
+    )
+    store = SessionStore(root=tmp_path / "sessions")
+    store.put("session", "data", pd.DataFrame({"x": [1.0, 2.0, 3.0]}))
+    manager = JobManager(store, max_workers=1)
+    yield manager
+    manager.shutdown()
+
+
+def test_finished_job_is_merged_and_reused(manager):
+    job = manager.submit(
+        "double", "session", source="data", target="results", columns=["x"]
+    )
+    _wait(job)
+    assert job.status == "finished"
+    assert manager.store.get("session", "results")["x_x2"].tolist() == [
+        2.0,
+        4.0,
+        6.0,
+    ]
+    assert manager.collect(job.job_id) is job
+    assert manager.collect(job.job_id) is None
+
+    again = manager.submit(
+        "double", "session", source="data", target="results", columns=["x"]
+    )
+    assert again.cached and again.status == "finished"
+
+
+def test_failed_merge_marks_the_job_failed(manager):
+    job = manager.submit(
+        "missing_result",
+        "session",
+        source="data",
+        target="results",
+        columns=["x"],
+    )
+    _wait(job)
+    assert job.status == "failed"
+    assert not manager.store.has("session", "results")
+
+
+def test_cancelled_job_is_not_merged(manager):
+    running = manager.submit(
+        "double",
+        "session",
+        source="data",
+        target="first",
+        columns=["x"],
+        delay=2.0,
+    )
+    queued = manager.submit(
+        "double", "session", source="data", target="second", columns=["x"]
+    )
+    assert manager.cancel(queued.job_id)
+    assert queued.status == "cancelled"
+    assert not manager.cancel(queued.job_id)
+
+    _wait(running)
+    assert running.status == "finished"
+    assert not manager.store.has("session", "second")
@@ -0,0 +1,109 @@
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from mcr.cli import main
+from mcr.model import MCRModel
+from mcr.reduction import fit_reducer
+
+
+def _blobs(n_cells=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.r_[
+        rng.normal(0, 0.5, size=(n_cells // 2, 5)),
+        rng.normal(8, 0.5, size=(n_cells // 2, 5)),
+    ]
+    return pd.DataFrame(X, columns=[f"marker_{i}" for i in range(5)])
+
+
+def test_model_round_trip(tmp_path):
+    reference = _blobs()
+    model = MCRModel.fit(reference, resolution=0.1, n_neighbors=15, n_epochs=20)
+    model.save(tmp_path / "model.joblib")
+    loaded = MCRModel.load(tmp_path / "model.joblib")
+
+    # columns can come in any order, and extra ones are ignored
+    new = _blobs(seed=1).iloc[:, ::-1].assign(extra=1.0)
+    projected = loaded.project(new)
+
+    assert list(projected.columns) == ["umap_1", "umap_2", "res_0.1"]
+    assert len(projected) == len(new)
+    assert set(projected["res_0.1"]) <= set(model.reference["res_0.1"])
+    # cells from the same blob land in the same cluster
+    assert projected["res_0.1"].iloc[:100].nunique() == 1
+    assert projected["res_0.1"].iloc[100:].nunique() == 1
+
+    with pytest.raises(KeyError):
+        loaded.project(new.drop(columns="marker_0"))
+
+
+def test_model_load_rejects_other_objects(tmp_path):
+    import joblib
+
+    joblib.dump({"not": "a model"}, tmp_path / "other.joblib")
+    with pytest.raises(TypeError):
+        MCRModel.load(tmp_path / "other.joblib")
+
+
+def test_cli_fit_and_project(tmp_path, monkeypatch):
+    # the CLI writes its log to the working directory
+    monkeypatch.chdir(tmp_path)
+    _blobs().to_csv(tmp_path / "reference.csv", index=False)
+    _blobs(seed=1).to_csv(tmp_path / "new.csv", index=False)
+
+    runner = CliRunner()
+    fitted = runner.invoke(
+        main,
+        [
+            "fit",
+            "--data_file",
+            str(tmp_path / "reference.csv"),
+            "--model",
+            str(tmp_path / "model.joblib"),
+            "--resolution",
+            "0.1",
+            "--n_neighbors",
+            "15",
+        ],
+    )
+    assert fitted.exit_code == 0, fitted.output
+
+    projected = runner.invoke(
+        main,
+        [
+            "project",
+            "--data_file",
+            str(tmp_path / "new.csv"),
+            "--model",
+            str(tmp_path / "model.joblib"),
+            "--output",
+            str(tmp_path / "projected.csv"),
+        ],
+    )
+    assert projected.exit_code == 0, projected.output
+
+    result = pd.read_csv(tmp_path / "projected.csv")
+    assert list(result.columns) == ["umap_1", "umap_2", "res_0.1"]
+    assert len(result) == 200
+
+
+def test_fit_reducer_passes_pacmap_arguments(monkeypatch):
+    class PaCMAP:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def fit_transform(self, X):
+            return np.zeros((len(X), 2))
+
+    monkeypatch.setitem(
+        sys.modules, "pacmap", types.SimpleNamespace(PaCMAP=PaCMAP)
+    )
+    reducer, _ = fit_reducer(_blobs(), "pacmap", n_neighbors=5, save_tree=True)
+
+    assert reducer.kwargs == dict(
+        n_dims=2, n_neighbors=5, MN_ratio=0.5, FP_ratio=2.0, save_tree=True
+    )
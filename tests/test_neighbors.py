@@ -0,0 +1,79 @@
+import numpy as np
+import scipy.sparse
+
+from mcr.neighbors import GraphCache, NeighborGraph, graph_key, hash_features
+
+
+def make_graph(key, n_cells=100, n_neighbors=5):
+    rng = np.random.default_rng(0)
+    return NeighborGraph(
+        knn_indices=rng.integers(0, n_cells, size=(n_cells, n_neighbors)),
+        knn_dists=rng.random((n_cells, n_neighbors), dtype=np.float32),
+        connectivities=scipy.sparse.random(
+            n_cells, n_cells, density=0.05, format="csr", random_state=0
+        ),
+        key=key,
+    )
+
+
+def test_key_depends_on_content_and_parameters():
+    X = np.arange(20, dtype=np.float32).reshape(10, 2)
+    assert hash_features(X) == hash_features(X.copy())
+    assert hash_features(X) != hash_features(X + 1)
+    assert graph_key("a", n_neighbors=15) != graph_key("a", n_neighbors=30)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    first, second, third = (make_graph(k) for k in "abc")
+    cache = GraphCache(max_memory_bytes=2 * first.nbytes)
+    cache.put(first)
+    cache.put(second)
+    cache.get("a")
+    cache.put(third)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_disk_tier_round_trip(tmp_path):
+    graph = make_graph("a")
+    GraphCache(cache_dir=tmp_path).put(graph)
+
+    restored = GraphCache(cache_dir=tmp_path).get("a")
+    np.testing.assert_array_equal(restored.knn_indices, graph.knn_indices)
+    assert (restored.connectivities != graph.connectivities).nnz == 0
+
+
+def test_exact_backends_agree():
+    from mcr.neighbors import nearest_neighbors
+
+    X = np.random.default_rng(0).normal(size=(200, 8)).astype(np.float32)
+    kd_indices, kd_dists = nearest_neighbors(
+        X, n_neighbors=10, backend="kdtree"
+    )
+    bf_indices, bf_dists = nearest_neighbors(
+        X, n_neighbors=10, backend="brute_blas"
+    )
+
+    np.testing.assert_array_equal(kd_indices[:, 0], np.arange(200))
+    np.testing.assert_array_equal(kd_indices, bf_indices)
+    np.testing.assert_allclose(kd_dists, bf_dists, atol=1e-3)
+
+
+def test_process_cache_is_opt_in(monkeypatch):
+    from mcr import neighbors
+    from mcr.clustering import label_clusters
+
+    monkeypatch.setenv("MCR_GRAPH_CACHE_MB", "1")
+    monkeypatch.delenv("MCR_CACHE_DIR", raising=False)
+    monkeypatch.setattr(neighbors, "_default_cache", None)
+    cache = neighbors.get_graph_cache()
+    assert cache.max_memory_bytes == 1024**2
+
+    X = np.random.default_rng(0).normal(size=(200, 8)).astype(np.float32)
+    label_clusters(X, n_neighbors=10, neighbor_backend="kdtree")
+    assert not cache._memory
+
+    label_clusters(X, n_neighbors=10, neighbor_backend="kdtree", use_cache=True)
+    assert len(cache._memory) == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+from mcr.outofcore import (
+    convert_to_store,
+    membership_strengths,
+    open_features,
+    write_edges,
+)
+
+
+def test_convert_to_store_round_trips_markers(tmp_path):
+    df = pd.DataFrame(
+        {
+            "Object Id": np.arange(25),
+            "CD3": np.linspace(0, 1, 25),
+            "CD19": np.linspace(1, 2, 25),
+        }
+    )
+    df.to_csv(tmp_path / "cells.csv", index=False)
+
+    work_dir = convert_to_store(
+        str(tmp_path / "cells.csv"),
+        tmp_path / "work",
+        ignore_columns=["Object Id"],
+        chunksize=10,
+    )
+    X = open_features(work_dir)
+    assert X.dtype == np.float32
+    np.testing.assert_allclose(X, df[["CD3", "CD19"]].to_numpy(), rtol=1e-6)
+
+
+def test_blocked_graph_matches_fuzzy_simplicial_set(tmp_path):
+    umap_ = pytest.importorskip("umap.umap_")
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 4)).astype(np.float32)
+    n_neighbors = 10
+    dists = np.linalg.norm(X[:, None] - X[None], axis=2)
+    knn_indices = np.argsort(dists, axis=1)[:, :n_neighbors].astype(np.int32)
+    knn_dists = np.take_along_axis(dists, knn_indices, axis=1)
+
+    strengths = membership_strengths(
+        knn_indices, knn_dists, tmp_path, block_rows=64
+    )
+    n_edges = write_edges(knn_indices, strengths, tmp_path, block_rows=64)
+    edges = np.fromfile(tmp_path / "edges.i64", dtype=np.int64).reshape(-1, 2)
+    weights = np.fromfile(tmp_path / "weights.f64", dtype=np.float64)
+    assert edges.shape[0] == n_edges == weights.shape[0]
+    # the shards of the transposed graph are removed
+    assert not (tmp_path / "transpose").exists()
+
+    expected, *_ = umap_.fuzzy_simplicial_set(
+        X=scipy.sparse.coo_matrix(([], ([], [])), shape=(X.shape[0], 1)),
+        n_neighbors=n_neighbors,
+        random_state=None,
+        metric="euclidean",
+        knn_indices=knn_indices,
+        knn_dists=knn_dists,
+    )
+    expected = scipy.sparse.triu(expected, k=1).tocsr()
+    found = scipy.sparse.csr_matrix(
+        (weights / 2, (edges[:, 0], edges[:, 1])), shape=expected.shape
+    )
+    np.testing.assert_allclose(found.toarray(), expected.toarray(), rtol=1e-5)
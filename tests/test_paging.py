@@ -0,0 +1,41 @@
+import pyarrow as pa
+
+from mcr.paging import page, split_filter_part
+
+
+def test_split_filter_part():
+    assert split_filter_part("{CD3} >= 2") == ("CD3", "ge", 2.0)
+    assert split_filter_part("{sample} contains 'donor 1'") == (
+        "sample",
+        "contains",
+        "donor 1",
+    )
+    # column names containing an operator
+    assert split_filter_part("{Tilt Angle} < 30") == ("Tilt Angle", "lt", 30.0)
+    assert split_filter_part("{a=b} eq 'x'") == ("a=b", "eq", "x")
+    assert split_filter_part("{CD3}>=2") == ("CD3", "ge", 2.0)
+    assert split_filter_part("no column") == (None, None, None)
+
+
+def test_page_sorts_and_filters_before_slicing():
+    table = pa.table({"CD3": [5.0, 1.0, 4.0, 2.0, 3.0], "id": list("abcde")})
+
+    rows, page_count = page(table, page_current=1, page_size=2)
+    assert [r["id"] for r in rows] == ["c", "d"]
+    assert page_count == 3
+
+    rows, page_count = page(
+        table,
+        page_size=2,
+        sort_by=[{"column_id": "CD3", "direction": "asc"}],
+        filter_query="{CD3} > 1",
+    )
+    assert [r["CD3"] for r in rows] == [2.0, 3.0]
+    assert page_count == 2
+
+
+def test_filter_on_a_column_named_like_an_operator():
+    table = pa.table({"Tilt Angle": [10.0, 40.0, 20.0], "id": list("abc")})
+
+    rows, _ = page(table, filter_query="{Tilt Angle} lt 30 && {id} ne 'a'")
+    assert [r["id"] for r in rows] == ["c"]
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from mcr.clustering import PartitionCache, ResolutionProfile
+
+
+def test_nearest_resolution_is_returned_from_memory_and_disk(tmp_path):
+    cache = PartitionCache(max_graphs=1, cache_dir=tmp_path)
+    assert cache.nearest("graph", 1.0) is None
+
+    cache.put("graph", 0.5, np.zeros(10, dtype=int))
+    cache.put("graph", 2.0, np.ones(10, dtype=int))
+    resolution, membership = cache.nearest("graph", 1.5)
+    assert resolution == 2.0 and membership.tolist() == [1] * 10
+
+    # pushed out of memory by another graph, but still on disk
+    cache.put("other", 1.0, np.arange(10))
+    resolution, membership = PartitionCache(cache_dir=tmp_path).nearest(
+        "graph", 0.6
+    )
+    assert resolution == 0.5 and membership.tolist() == [0] * 10
+
+
+def test_resolution_profile_picks_the_partition_covering_a_resolution():
+    scan = ResolutionProfile(
+        table=pd.DataFrame(
+            {
+                "resolution": [0.1, 0.5],
+                "resolution_end": [0.5, 2.0],
+                "n_clusters": [1, 2],
+                "quality": [0.0, 1.0],
+                "column": ["res_0.1", "res_0.5"],
+            }
+        ),
+        memberships=pd.DataFrame(
+            {"res_0.1": [0, 0, 0, 0], "res_0.5": [0, 0, 1, 1]}
+        ),
+    )
+    assert scan.membership_at(0.05).tolist() == [0, 0, 0, 0]
+    assert scan.membership_at(0.3).tolist() == [0, 0, 0, 0]
+    assert scan.membership_at(1.0).tolist() == [0, 0, 1, 1]
@@ -0,0 +1,36 @@
+import numpy as np
+
+from mcr.profiling import profile, stage
+
+
+def test_stages_are_recorded_only_while_profiling():
+    with stage("ignored"):
+        pass
+
+    with profile() as profiler:
+        with stage("outer", cells=10):
+            with stage("inner"):
+                sum(range(10_000))
+
+    assert [r.name for r in profiler.records] == ["outer", "inner"]
+    assert [r.depth for r in profiler.records] == [0, 1]
+    outer, inner = profiler.records
+    assert outer.info == {"cells": 10}
+    assert outer.wall_seconds >= inner.wall_seconds >= 0
+    if outer.peak_rss_mb is not None:
+        assert outer.peak_rss_mb >= inner.peak_rss_mb
+    assert profiler.to_dict()["total_wall_seconds"] == outer.wall_seconds
+
+
+def test_peak_before_a_nested_stage_is_kept():
+    with profile() as profiler:
+        with stage("outer"):
+            block = np.ones(200 * 1024**2 // 8)
+            del block
+            with stage("inner"):
+                pass
+
+    # only measurable where the high-water mark can be reset per stage
+    outer, inner = profiler.records
+    if profiler.can_reset_peak:
+        assert outer.peak_rss_mb >= inner.peak_rss_mb + 150
@@ -0,0 +1,55 @@
+import numpy as np
+
+from mcr.raster import axis_ranges, rasterize
+
+
+def test_raster_counts_and_means():
+    x = np.array([0.0, 0.1, 0.9, 1.0])
+    y = np.array([0.0, 0.1, 0.9, 1.0])
+    values = np.array([1.0, 3.0, 5.0, 7.0])
+
+    counts = rasterize(x, y, width=2, height=2)
+    assert np.nansum(counts.image) == 4
+    assert counts.counts.sum() == 4
+    np.testing.assert_array_equal(counts.image, [[2, np.nan], [np.nan, 2]])
+
+    means = rasterize(x, y, values, width=2, height=2)
+    np.testing.assert_array_equal(means.image, [[2, np.nan], [np.nan, 6]])
+
+
+def test_raster_takes_most_common_label():
+    x = np.zeros(5)
+    y = np.zeros(5)
+    labels = np.array([3, 1, 3, 2, 3])
+    raster = rasterize(
+        x, y, labels, x_range=(0, 1), y_range=(0, 1), categorical=True
+    )
+    assert raster.image[0, 0] == 3
+
+
+def test_raster_labels_per_pixel():
+    x = np.array([0.0, 0.0, 0.0, 1.0, 1.0, 1.0])
+    y = np.zeros(6)
+    labels = np.array([2, 5, 5, 2, 2, 5])
+    raster = rasterize(
+        x,
+        y,
+        labels,
+        x_range=(0, 1),
+        y_range=(0, 1),
+        width=2,
+        height=1,
+        categorical=True,
+    )
+    np.testing.assert_array_equal(raster.image, [[5, 2]])
+
+
+def test_axis_ranges_from_relayout_data():
+    assert axis_ranges(None) == (None, None)
+    assert axis_ranges({"xaxis.autorange": True, "yaxis.autorange": True}) == (
+        None,
+        None,
+    )
+    assert axis_ranges(
+        {"xaxis.range[0]": 1, "xaxis.range[1]": 2, "yaxis.range": [3, 4]}
+    ) == ((1.0, 2.0), (3.0, 4.0))
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from mcr.readers import iter_data, read_columns, read_data
+
+
+def write_table(path, sep=","):
+    pd.DataFrame(
+        {
+            "Object Id": [1, 2, 3, 4],
+            "CD3": [0.5, 1.5, 2.5, 3.5],
+            "CD19": [4, 3, 2, 1],
+        }
+    ).to_csv(path, sep=sep, index=False)
+    return path
+
+
+def test_ignored_columns_are_not_read(tmp_path):
+    datafile = write_table(tmp_path / "cells.csv")
+    df = read_data(datafile, ignore_columns=["Object Id"])
+
+    assert list(df.columns) == ["CD3", "CD19"]
+    assert (df.dtypes == np.float32).all()
+
+
+def test_tab_separated_text(tmp_path):
+    datafile = write_table(tmp_path / "cells.txt", sep="\t")
+    assert read_columns(datafile) == ["Object Id", "CD3", "CD19"]
+
+
+def test_chunks_cover_all_rows(tmp_path):
+    datafile = write_table(tmp_path / "cells.csv")
+    chunks = list(iter_data(datafile, chunksize=3))
+
+    assert [len(x) for x in chunks] == [3, 1]
+
+
+def test_unknown_file_type(tmp_path):
+    assert read_data(tmp_path / "cells.fcs") is None
+
+
+def test_latin1_file_with_ignored_columns(tmp_path):
+    datafile = tmp_path / "cells.csv"
+    datafile.write_bytes(
+        "Object Id,Area (\u00b5m\u00b2),CD3\n1,2.5,0.5\n2,3.5,1.5\n".encode(
+            "latin-1"
+        )
+    )
+
+    df = read_data(datafile, ignore_columns=["Object Id"])
+    assert list(df.columns) == ["Area (\u00b5m\u00b2)", "CD3"]
+    assert read_columns(datafile)[1] == "Area (\u00b5m\u00b2)"
+    chunks = list(iter_data(datafile, ignore_columns=["Object Id"]))
+    assert chunks[0]["CD3"].tolist() == [0.5, 1.5]
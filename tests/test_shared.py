@@ -0,0 +1,40 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+import scipy.sparse
+
+from mcr.shared import SharedArrays, attach_shared
+
+
+def _column_sums(matrix):
+    return np.asarray(attach_shared(matrix).sum(axis=0)).ravel()
+
+
+def test_workers_see_shared_arrays_and_matrices():
+    X = np.arange(12, dtype=np.float32).reshape(4, 3)
+    connectivities = scipy.sparse.random(
+        4, 4, density=0.5, format="csr", random_state=0
+    )
+
+    with SharedArrays() as shared:
+        descriptors = [shared.array(X), shared.csr(connectivities)]
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            sums = list(executor.map(_column_sums, descriptors))
+
+    np.testing.assert_allclose(sums[0], X.sum(axis=0))
+    np.testing.assert_allclose(
+        sums[1], np.asarray(connectivities.sum(axis=0)).ravel()
+    )
+
+
+def test_segments_are_removed_when_the_owner_closes():
+    with SharedArrays() as shared:
+        descriptor = shared.array(np.zeros(3))
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=descriptor.name)
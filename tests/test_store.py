@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mcr.store import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(root=tmp_path / "sessions")
+
+
+def test_put_and_get_round_trip(store):
+    df = pd.DataFrame({"CD3": [1.0, 2.0, 3.0], "CD19": [4.0, 5.0, 6.0]})
+    store.put("session", "data", df)
+
+    assert store.has("session", "data")
+    pd.testing.assert_frame_equal(store.get("session", "data"), df)
+    assert store.columns("session", "data") == ["CD3", "CD19"]
+    assert store.n_rows("session", "data") == 3
+    np.testing.assert_array_equal(
+        store.get_column("session", "data", "CD19"), [4.0, 5.0, 6.0]
+    )
+
+
+def test_add_columns_replaces_columns_of_the_same_name(store):
+    store.add_columns("session", "clusters", pd.DataFrame({"res_1": [0, 1]}))
+    store.add_columns("session", "clusters", pd.DataFrame({"res_2": [1, 1]}))
+    store.add_columns("session", "clusters", pd.DataFrame({"res_1": [2, 2]}))
+
+    clusters = store.get("session", "clusters")
+    assert list(clusters.columns) == ["res_2", "res_1"]
+    assert clusters["res_1"].tolist() == [2, 2]
+
+
+def test_lookups_do_not_create_sessions(store):
+    assert not store.has("unknown", "data")
+    assert store.get("unknown", "data") is None
+    assert store.columns("unknown", "data") == []
+    assert not (store.root / "unknown").exists()
+    with pytest.raises(ValueError):
+        store.has("../escape", "data")
+
+
+def test_evict_removes_least_recently_used_but_keeps_current(store):
+    df = pd.DataFrame({"x": np.zeros(10_000)})
+    store.put("old", "data", df)
+    size = sum(f.stat().st_size for f in (store.root / "old").iterdir())
+    store.max_bytes = size
+
+    store.put("new", "data", df)
+    assert not store.has("old", "data")
+    assert store.has("new", "data")
+
+    # larger than the whole budget on its own, but just written
+    store.put("new", "more", df)
+    assert store.has("new", "data") and store.has("new", "more")
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from mcr.subsample import (
+    SUBSAMPLE_STRATEGIES,
+    subsample_cells,
+    transfer_labels,
+)
+
+
+@pytest.mark.parametrize("strategy", SUBSAMPLE_STRATEGIES)
+def test_subsample_size(strategy):
+    X = np.random.default_rng(0).normal(size=(1000, 5))
+    sampled = subsample_cells(X, 100, strategy=strategy, random_state=0)
+
+    assert len(np.unique(sampled)) == 100
+
+
+def test_transfer_keeps_sampled_labels():
+    X = np.r_[np.zeros((50, 2)), np.ones((50, 2)) * 10]
+    sampled = np.array([0, 1, 50, 51])
+    labels = transfer_labels(X, sampled, np.array([0, 0, 1, 1]), n_neighbors=2)
+
+    assert (labels[:50] == 0).all()
+    assert (labels[50:] == 1).all()
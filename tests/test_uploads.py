@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from mcr.store import SessionStore
+from mcr.uploads import import_file, resolve_data_path
+
+
+def test_import_file_in_chunks(tmp_path):
+    source = tmp_path / "cells.csv"
+    pd.DataFrame({"CD3": range(10), "CD4": range(10, 20)}).to_csv(
+        source, index=False
+    )
+    store = SessionStore(root=tmp_path / "sessions")
+
+    assert import_file(store, "session", "data", source, chunksize=3) == 10
+    stored = store.get("session", "data")
+    assert stored["CD4"].tolist() == list(range(10, 20))
+
+
+def test_import_file_keeps_integer_ids(tmp_path):
+    source = tmp_path / "cells.csv"
+    ids = [2**24 + 1, 2**40 + 3, 7]
+    pd.DataFrame({"Object Id": ids, "CD3": [0.5, 1.5, 2.5]}).to_csv(
+        source, index=False
+    )
+    store = SessionStore(root=tmp_path / "sessions")
+
+    import_file(store, "session", "data", source, chunksize=2)
+    stored = store.get("session", "data")
+    assert stored["Object Id"].tolist() == ids
+    assert stored["Object Id"].dtype == "int64"
+
+
+def test_paths_outside_data_dirs_are_refused(tmp_path, monkeypatch):
+    store = SessionStore(root=tmp_path / "sessions")
+    allowed = tmp_path / "data"
+    allowed.mkdir()
+    (allowed / "cells.csv").write_text("CD3\n1\n")
+    monkeypatch.setenv("MCR_DATA_DIRS", str(allowed))
+
+    assert resolve_data_path(store, "session", str(allowed / "cells.csv"))
+    with pytest.raises(ValueError):
+        resolve_data_path(store, "session", str(allowed / ".." / "x.csv"))
+    with pytest.raises(ValueError):
+        resolve_data_path(store, "session", "upload:../../cells.csv")
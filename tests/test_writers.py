@@ -0,0 +1,15 @@
+import pandas as pd
+
+from mcr.writers import read_with_sidecars, write_sidecar
+
+
+def test_sidecar_round_trip(tmp_path):
+    source = tmp_path / "cells.csv"
+    pd.DataFrame({"CD3": [0.5, 1.5, 2.5]}).to_csv(source, index=False)
+
+    sidecar = tmp_path / "clusters.csv"
+    write_sidecar(pd.DataFrame({"res_0.6": [0, 1, 0]}), sidecar, source=source)
+
+    combined = read_with_sidecars(source, sidecar)
+    assert list(combined.columns) == ["CD3", "res_0.6"]
+    assert combined["res_0.6"].tolist() == [0, 1, 0]